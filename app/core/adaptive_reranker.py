@@ -0,0 +1,103 @@
+import time
+import numpy as np
+from typing import Any
+from langchain.docstore.document import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from app.core.hybrid_retriever import HybridRetriever
+from app.core.retrieval_cache import RetrievalCache
+from app.helper.logger import get_logger
+
+logger = get_logger("AdaptiveReranker")
+
+
+class AdaptiveRerankRetriever(BaseRetriever):
+    '''
+    Rerank cross-encoder co dieu kien tren ket qua cua base retriever.
+
+    Cac nhanh (ghi vao metrics cua RerankerService):
+        skip     BM25 va dense cung xep 1 chunk dung dau va ca 2 nhanh deu
+                 dan cach chunk do voi chunk thu 2 >= margin -> dung thu tu fusion
+        full     rerank toan bo ung vien (toi da max_candidates)
+        budget   het time_budget_ms giua chung -> chunk da cham diem xep theo
+                 cross-encoder, phan con lai giu thu tu fusion
+    Ket qua cuoi (chunk_ids) va diem tung cap (query, chunk) duoc cache trong RetrievalCache;
+    cache_key = vector_dir@generation.version cua index.
+    '''
+    base: Any
+    reranker: Any
+    top_n: int = 5
+    max_candidates: int = 20
+    margin: float = 0.3
+    time_budget_ms: float = 400
+    batch_size: int = 16
+    cache_key: Any = None
+
+    @staticmethod
+    def _gap(scores: np.ndarray) -> float:
+        ''' Khoang cach top1 - top2 tren khoang diem cua nhanh (0..1)'''
+        if len(scores) < 2:
+            return 1.0
+        span = float(scores[0] - scores[-1])
+        return float(scores[0] - scores[1]) / span if span > 0 else 0.0
+
+    def _confident(self, branches) -> bool:
+        (sparse_ids, sparse_scores), (dense_ids, dense_scores) = branches
+        if not len(sparse_ids) or not len(dense_ids) or sparse_ids[0] != dense_ids[0]:
+            return False
+        return min(self._gap(sparse_scores), self._gap(dense_scores)) >= self.margin
+
+    def _docs(self, ids) -> list[Document]:
+        return [self.base.docs[int(i)] for i in ids]
+
+    def _candidates(self, query: str) -> tuple[list[Document], bool]:
+        ''' (ung vien theo thu tu base, co the bo qua rerank hay khong)'''
+        if isinstance(self.base, HybridRetriever):
+            branches = self.base.branches(query)
+            ids, _ = self.base.fuse(branches)
+            return self._docs(ids[: self.max_candidates]), self._confident(branches)
+        return self.base.invoke(query)[: self.max_candidates], False
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        # Ket qua cache chi dung duoc khi doc lay lai duoc tu chunk_id (base hybrid tren ChunkStore)
+        cache = RetrievalCache()
+        cache_key = self.cache_key if isinstance(self.base, HybridRetriever) else None
+        cached = cache.get_results(cache_key, "rerank", query)
+        if cached is not None:
+            return self._docs(cached[0])
+
+        start_time = time.time()
+        docs, confident = self._candidates(query)
+        if confident or len(docs) <= 1:
+            self.reranker.record("skip", 0, time.time() - start_time)
+            ranked = docs[: self.top_n]
+            scores = np.zeros(len(ranked), dtype=np.float32)
+            path = "skip"
+        else:
+            deadline = start_time + self.time_budget_ms / 1000
+            scores = []
+            path = "full"
+            for pos in range(0, len(docs), self.batch_size):
+                if pos and time.time() >= deadline:
+                    path = "budget"
+                    break
+                batch = [d.page_content for d in docs[pos: pos + self.batch_size]]
+                scores.extend(cache.score_pairs(
+                    self.reranker.model_name, query, batch,
+                    lambda texts: self.reranker.predict(query, texts),
+                ))
+
+            scores = np.asarray(scores, dtype=np.float32)
+            order = np.argsort(-scores, kind="stable")
+            ranked = ([docs[i] for i in order] + docs[len(scores):])[: self.top_n]
+            scores = scores[order][: self.top_n]
+            elapsed = time.time() - start_time
+            self.reranker.record(path, len(order), elapsed)
+            if path == "budget":
+                logger.info(f"Rerank budget reached: scored {len(order)}/{len(docs)} candidates in {elapsed * 1000:.0f}ms")
+
+        # Ket qua bi cat boi time budget khong cache (lan sau co the rerank du)
+        ids = [d.metadata.get("chunk_id") for d in ranked]
+        if path != "budget" and None not in ids:
+            cache.put_results(cache_key, "rerank", query, ids, np.pad(scores, (0, len(ids) - len(scores))))
+        return ranked
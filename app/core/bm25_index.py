@@ -0,0 +1,249 @@
+import os
+import re
+import json
+import numpy as np
+from typing import Any
+from langchain.docstore.document import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from app.helper.logger import get_logger
+
+logger = get_logger("BM25Index")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    ''' Tokenizer dung chung cho luc build index va luc query'''
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    '''
+    Sparse inverted index cho BM25 (Okapi).
+
+    Postings duoc luu theo term (CSR):
+        term_indptr[t] : term_indptr[t+1]  -> vi tri postings cua term t
+        post_docs / post_tf                 -> doc id va term frequency
+    doc_norm = k1 * (1 - b + b * doc_len / avgdl) va idf duoc tinh san luc build,
+    nen luc query chi con cong don postings cua cac term trong cau hoi.
+    '''
+    VOCAB_FILE = "bm25_vocab.json"
+    ARRAY_FILES = ("term_indptr", "post_docs", "post_tf", "doc_len", "doc_norm", "idf")
+
+    def __init__(self, vocab: dict, term_indptr, post_docs, post_tf, doc_len, doc_norm, idf,
+                 k1: float = 1.5, b: float = 0.75):
+        self.vocab = vocab
+        self.term_indptr = term_indptr
+        self.post_docs = post_docs
+        self.post_tf = post_tf
+        self.doc_len = doc_len
+        self.doc_norm = doc_norm
+        self.idf = idf
+        self.k1 = k1
+        self.b = b
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    # -------------------------------------------------------
+    # Build
+    # -------------------------------------------------------
+    @classmethod
+    def from_texts(cls, texts: list[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        builder = BM25Builder()
+        builder.add_texts(texts)
+        return builder.build(k1=k1, b=b)
+
+    @classmethod
+    def from_documents(cls, docs: list[Document], **kwargs) -> "BM25Index":
+        return cls.from_texts([d.page_content for d in docs], **kwargs)
+
+    @classmethod
+    def _from_postings(cls, vocab, doc_ids, term_ids, tfs, doc_len, k1, b) -> "BM25Index":
+        '''
+        Sap postings theo term (CSR) va tinh san idf / doc_norm.
+        Doc da xoa (remove_docs) co doc_len = 0 nen khong tinh vao N va avgdl.
+        '''
+        live = doc_len > 0
+        n_docs = int(live.sum())
+        n_terms = len(vocab)
+        order = np.argsort(term_ids, kind="stable")
+        df = np.bincount(term_ids, minlength=n_terms)
+        term_indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(df, out=term_indptr[1:])
+
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(doc_len[live].mean()) if n_docs else 1.0
+        doc_norm = (k1 * (1 - b + b * doc_len / avgdl)).astype(np.float32)
+        return cls(vocab, term_indptr, doc_ids[order], tfs[order], doc_len, doc_norm, idf, k1=k1, b=b)
+
+    # -------------------------------------------------------
+    # Incremental update
+    # -------------------------------------------------------
+    def _term_ids(self) -> np.ndarray:
+        ''' Term id cua tung posting (giai nen CSR)'''
+        return np.repeat(np.arange(len(self.vocab), dtype=np.int32), np.diff(self.term_indptr))
+
+    def add_texts(self, texts: list[str]) -> "BM25Index":
+        '''
+        Them doc moi (doc id noi tiep doc cu), chi tokenize text moi.
+        Tra ve index moi, index hien tai khong bi sua.
+        '''
+        builder = BM25Builder(vocab=dict(self.vocab), start_doc=len(self))
+        builder.add_texts(texts)
+        new_docs, new_terms, new_tfs, new_len = builder.arrays()
+        return BM25Index._from_postings(
+            builder.vocab,
+            np.concatenate([np.asarray(self.post_docs), new_docs]),
+            np.concatenate([self._term_ids(), new_terms]),
+            np.concatenate([np.asarray(self.post_tf), new_tfs]),
+            np.concatenate([np.asarray(self.doc_len), new_len]),
+            k1=self.k1, b=self.b,
+        )
+
+    def remove_docs(self, doc_ids) -> "BM25Index":
+        ''' Xoa postings cua cac doc (doc id giu nguyen, doc_len = 0)'''
+        doc_ids = np.asarray(list(doc_ids), dtype=np.int64)
+        keep = ~np.isin(self.post_docs, doc_ids)
+        doc_len = np.array(self.doc_len, dtype=np.float32)
+        doc_len[doc_ids] = 0
+        return BM25Index._from_postings(
+            self.vocab,
+            np.asarray(self.post_docs)[keep],
+            self._term_ids()[keep],
+            np.asarray(self.post_tf)[keep],
+            doc_len,
+            k1=self.k1, b=self.b,
+        )
+
+    # -------------------------------------------------------
+    # Save / load
+    # -------------------------------------------------------
+    def save(self, save_dir: str) -> str:
+        try:
+            os.makedirs(save_dir, exist_ok=True)
+            # Ghi file tam roi rename: index cu co the dang duoc mmap boi retriever khac
+            for name in self.ARRAY_FILES:
+                path = os.path.join(save_dir, f"bm25_{name}.npy")
+                with open(path + ".tmp", "wb") as f:
+                    np.save(f, np.asarray(getattr(self, name)))
+                os.replace(path + ".tmp", path)
+            vocab_path = os.path.join(save_dir, self.VOCAB_FILE)
+            terms = sorted(self.vocab, key=self.vocab.get)
+            with open(vocab_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"k1": self.k1, "b": self.b, "terms": terms}, f, ensure_ascii=False)
+            os.replace(vocab_path + ".tmp", vocab_path)
+            logger.info(f"BM25 index saved in {save_dir}")
+            return vocab_path
+        except Exception as e:
+            logger.error(f"Error saving BM25 index {e}")
+            raise
+
+    @classmethod
+    def load(cls, save_dir: str, mmap: bool = True) -> "BM25Index":
+        try:
+            with open(os.path.join(save_dir, cls.VOCAB_FILE), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            vocab = {term: i for i, term in enumerate(data["terms"])}
+            mode = "r" if mmap else None
+            arrays = {
+                name: np.load(os.path.join(save_dir, f"bm25_{name}.npy"), mmap_mode=mode)
+                for name in cls.ARRAY_FILES
+            }
+            index = cls(vocab, k1=data["k1"], b=data["b"], **arrays)
+            logger.info(f"Loaded BM25 index ({len(index)} docs) from {save_dir}")
+            return index
+        except Exception as e:
+            logger.error(f"Error loading BM25 index {e}")
+            raise
+
+    @classmethod
+    def exists(cls, save_dir: str) -> bool:
+        return os.path.exists(os.path.join(save_dir, cls.VOCAB_FILE))
+
+    # -------------------------------------------------------
+    # Search
+    # -------------------------------------------------------
+    def get_scores(self, query: str) -> np.ndarray:
+        ''' Diem BM25 cua query cho tat ca doc (vector hoa bang numpy)'''
+        scores = np.zeros(len(self), dtype=np.float32)
+        term_ids = [self.vocab[t] for t in tokenize(query) if t in self.vocab]
+        if not term_ids or not len(self):
+            return scores
+        slices = [(self.term_indptr[t], self.term_indptr[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.post_docs[s:e] for s, e in slices])
+        tf = np.concatenate([self.post_tf[s:e] for s, e in slices])
+        idf = np.repeat(self.idf[term_ids], [e - s for s, e in slices])
+        weights = idf * tf * (self.k1 + 1) / (tf + self.doc_norm[docs])
+        scores += np.bincount(docs, weights=weights, minlength=len(self)).astype(np.float32)
+        return scores
+
+    def search(self, query: str, k: int) -> tuple[np.ndarray, np.ndarray]:
+        ''' Tra ve (doc_ids, scores) top-k, bo qua doc co diem 0'''
+        scores = self.get_scores(query)
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top = top[scores[top] > 0]
+        return top, scores[top]
+
+
+class BM25Builder:
+    ''' Tokenize doc theo tung batch (pipeline streaming), build BM25Index o cuoi'''
+
+    def __init__(self, vocab: dict = None, start_doc: int = 0):
+        self.vocab: dict[str, int] = vocab if vocab is not None else {}
+        self.start_doc = start_doc
+        self._doc_ids, self._term_ids, self._tfs, self._doc_len = [], [], [], []
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def add_texts(self, texts: list[str]):
+        doc_ids, term_ids, tfs = [], [], []
+        for text in texts:
+            doc_id = self.start_doc + len(self._doc_len)
+            tokens = tokenize(text)
+            self._doc_len.append(len(tokens))
+            counts: dict[int, int] = {}
+            for token in tokens:
+                tid = self.vocab.setdefault(token, len(self.vocab))
+                counts[tid] = counts.get(tid, 0) + 1
+            doc_ids.extend([doc_id] * len(counts))
+            term_ids.extend(counts.keys())
+            tfs.extend(counts.values())
+        # Gom postings cua batch thanh numpy array ngay de giu bo nho nho
+        self._doc_ids.append(np.asarray(doc_ids, dtype=np.int32))
+        self._term_ids.append(np.asarray(term_ids, dtype=np.int32))
+        self._tfs.append(np.asarray(tfs, dtype=np.float32))
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        ''' (doc_ids, term_ids, tfs, doc_len) cua cac doc da add'''
+        def concat(parts, dtype):
+            return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+        return (
+            concat(self._doc_ids, np.int32),
+            concat(self._term_ids, np.int32),
+            concat(self._tfs, np.float32),
+            np.asarray(self._doc_len, dtype=np.float32),
+        )
+
+    def build(self, k1: float = 1.5, b: float = 0.75) -> BM25Index:
+        index = BM25Index._from_postings(self.vocab, *self.arrays(), k1=k1, b=b)
+        logger.info(f"Built BM25 index: {len(index)} docs, {len(self.vocab)} terms, {len(index.post_docs)} postings")
+        return index
+
+
+class BM25IndexRetriever(BaseRetriever):
+    ''' LangChain retriever tren BM25Index; docs la ChunkStore hoac list[Document]'''
+    index: Any
+    docs: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        ids, _ = self.index.search(query, self.k)
+        return [self.docs[int(i)] for i in ids]
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, Iterator, List
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("ChatLog")
+
+
+def reverse_lines(path: str, block_size: int = 1 << 16) -> Iterator[bytes]:
+    ''' Doc file tu cuoi len, tra ve tung dong (khong doc ca file vao bo nho)'''
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        rest = b""
+        while pos > 0:
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + rest).split(b"\n")
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if rest.strip():
+            yield rest
+
+
+class ChatLog:
+    '''
+    Log message append-only cua 1 session (JSONL, moi dong {"seq", "role", "content", "ts"}).
+
+    - append(): ghi them 1 dong + flush; fsync gom theo lo (fsync_every message
+      hoac fsync_interval giay) thay vi moi message.
+    - tail(n) / iter_reverse(): doc tu cuoi file, chi doc phan can thiet.
+    - Compaction: file dang ghi vuot compact_bytes -> chuyen cac message cu sang
+      chat_history.archive.jsonl, file dang ghi chi giu keep_last message
+      (ghi file tam roi rename). seq la so thu tu tuyet doi cua message trong session.
+    '''
+    FILE = "chat_history.jsonl"
+    ARCHIVE_FILE = "chat_history.archive.jsonl"
+
+    def __init__(self, session_dir: str, fsync_every: int = None, fsync_interval: float = None,
+                 compact_bytes: int = None, keep_last: int = None):
+        self.session_dir = session_dir
+        self.path = os.path.join(session_dir, self.FILE)
+        self.archive_path = os.path.join(session_dir, self.ARCHIVE_FILE)
+        self.fsync_every = fsync_every or config.CHAT_LOG_FSYNC_EVERY
+        self.fsync_interval = fsync_interval or config.CHAT_LOG_FSYNC_INTERVAL
+        self.compact_bytes = compact_bytes or config.CHAT_LOG_COMPACT_BYTES
+        self.keep_last = keep_last or config.CHAT_LOG_KEEP_LAST
+        self._lock = threading.Lock()
+        self._file = None
+        self._next_seq = None
+        self._pending = 0
+        self._last_fsync = time.time()
+
+    # -------------------------------------------------------
+    # Write
+    # -------------------------------------------------------
+    def _open(self):
+        ''' Mo file de ghi; file da bi thay (compaction o handler khac) thi mo lai'''
+        if self._file is not None:
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._file.fileno()).st_ino:
+                    return self._file
+            except FileNotFoundError:
+                pass
+            self._file.close()
+        os.makedirs(self.session_dir, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    @property
+    def next_seq(self) -> int:
+        if self._next_seq is None:
+            last = next(self.iter_reverse(), None)
+            self._next_seq = last["seq"] + 1 if last else 0
+        return self._next_seq
+
+    def append(self, role: str, content: str) -> Dict:
+        with self._lock:
+            record = {"seq": self.next_seq, "role": role, "content": content, "ts": time.time()}
+            f = self._open()
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            self._next_seq += 1
+            self._pending += 1
+            if self._pending >= self.fsync_every or time.time() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+            if f.tell() > self.compact_bytes:
+                self._compact()
+            return record
+
+    def _fsync(self):
+        if self._file is not None and self._pending:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_fsync = time.time()
+
+    def flush(self):
+        with self._lock:
+            self._fsync()
+
+    def close(self):
+        with self._lock:
+            self._fsync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # -------------------------------------------------------
+    # Compaction
+    # -------------------------------------------------------
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        self._fsync()
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        if len(lines) <= self.keep_last:
+            return
+        old, keep = lines[: -self.keep_last], lines[-self.keep_last:]
+        # Archive ghi truoc, file dang ghi thay sau: crash giua chung chi lam trung message, khong mat
+        with open(self.archive_path, "a", encoding="utf-8") as f:
+            f.writelines(old)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(keep)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        logger.info(f"Compacted chat log {self.path}: archived {len(old)} messages, kept {len(keep)}")
+
+    # -------------------------------------------------------
+    # Read
+    # -------------------------------------------------------
+    def iter_reverse(self) -> Iterator[Dict]:
+        ''' Message moi nhat truoc, doc lazy tu file dang ghi roi toi archive'''
+        seen = None
+        for path in (self.path, self.archive_path):
+            for line in reverse_lines(path):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Dong ghi do (crash giua chung) -> bo qua
+                    continue
+                if seen is not None and record["seq"] >= seen:
+                    continue
+                seen = record["seq"]
+                yield record
+
+    def tail(self, n: int) -> List[Dict]:
+        ''' n message cuoi, theo thu tu thoi gian'''
+        records = []
+        for record in self.iter_reverse():
+            if len(records) >= n:
+                break
+            records.append(record)
+        return records[::-1]
+
+    def read_all(self) -> List[Dict]:
+        return list(self.iter_reverse())[::-1]
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path) or os.path.exists(self.archive_path)
+
+    def import_messages(self, messages: List[Dict]):
+        ''' Ghi lai lich su cu (khong co seq) thanh log moi'''
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for seq, msg in enumerate(messages):
+                record = {"seq": seq, "role": msg["role"], "content": msg["content"], "ts": msg.get("ts")}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._next_seq = len(messages)
@@ -0,0 +1,188 @@
+import os
+import json
+from typing import Dict, List
+from app.core.context_builder import count_tokens
+from app.core.chat_log import ChatLog, reverse_lines
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("ChatMemory")
+
+SUMMARY_PROMPT = (
+    "Progressively summarize the conversation below, adding onto the previous summary. "
+    "Keep facts, names and numbers the user may refer to later. "
+    "Answer with the new summary only, in at most {max_words} words.\n\n"
+    "=== Previous summary ===\n{summary}\n\n"
+    "=== New messages ===\n{messages}\n\n"
+    "=== New summary ==="
+)
+
+CONDENSE_PROMPT = (
+    "Given the conversation below and a follow-up question, rephrase the follow-up question "
+    "to be a standalone question, in its original language. "
+    "If it is already standalone, return it unchanged. Answer with the question only.\n\n"
+    "{history}\n\n"
+    "=== Follow-up question ===\n{question}\n\n"
+    "=== Standalone question ==="
+)
+
+
+class ChatMemory:
+    '''
+    Bo nho hoi thoai cua 1 session.
+
+    - window: cac message gan nhat, tong so token <= max_tokens.
+    - summary: tom tat cuon chieu cac message da bi day ra khoi window
+      (chi goi LLM khi window tran, day ra toi 1/2 ngan sach -> chi phi moi luot khong doi).
+    - condense(): viet lai cau hoi follow-up thanh cau hoi doc lap cho retrieval.
+    - Lich su luu append-only trong ChatLog (chat_history.jsonl), summary trong
+      memory_state.json; load() chi doc phan cuoi log (window + display_limit message).
+    '''
+    LEGACY_HISTORY_FILE = "chat_history.json"
+    STATE_FILE = "memory_state.json"
+
+    def __init__(self, session_dir: str, llm_service, max_tokens: int = None, summary_max_tokens: int = None,
+                 condense_questions: bool = None):
+        self.session_dir = session_dir
+        self.llm_service = llm_service
+        self.max_tokens = max_tokens or config.MEMORY_MAX_TOKENS
+        self.summary_max_tokens = summary_max_tokens or config.MEMORY_SUMMARY_MAX_TOKENS
+        self.condense_questions = config.MEMORY_CONDENSE_QUESTIONS if condense_questions is None else condense_questions
+        self.log = ChatLog(session_dir)
+        self.state_path = os.path.join(session_dir, self.STATE_FILE)
+        self.display_limit = config.CHAT_LOG_DISPLAY_MESSAGES
+
+        self.messages: List[Dict] = []      # display_limit message cuoi (hien thi UI)
+        self.window: List[Dict] = []
+        self.window_tokens = 0
+        self.summary = ""
+        self.summarized_count = 0           # so message dau tien da nam trong summary
+
+    # -------------------------------------------------------
+    # Messages
+    # -------------------------------------------------------
+    def add_user_message(self, content: str):
+        self._add("human", content)
+
+    def add_ai_message(self, content: str):
+        self._add("ai", content)
+        self._trim()
+
+    def _add(self, role: str, content: str):
+        message = self.log.append(role, content)
+        self.messages.append(message)
+        if len(self.messages) > self.display_limit:
+            del self.messages[0]
+        self.window.append(message)
+        self.window_tokens += count_tokens(content)
+
+    def is_empty(self) -> bool:
+        return not self.messages
+
+    # -------------------------------------------------------
+    # Window + summary
+    # -------------------------------------------------------
+    def _trim(self):
+        ''' Window tran -> day message cu nhat ra (con <= 1/2 ngan sach) va gop vao summary'''
+        if self.window_tokens <= self.max_tokens:
+            return
+        evicted = []
+        while len(self.window) > 2 and self.window_tokens > self.max_tokens // 2:
+            message = self.window.pop(0)
+            self.window_tokens -= count_tokens(message["content"])
+            evicted.append(message)
+        if not evicted:
+            return
+        self.summary = self._summarize(evicted)
+        self.summarized_count += len(evicted)
+        self._save_state()
+        logger.info(f"Summarized {len(evicted)} messages, window now ~{self.window_tokens} tokens")
+
+    def _summarize(self, messages: List[Dict]) -> str:
+        prompt = SUMMARY_PROMPT.format(
+            max_words=int(self.summary_max_tokens * 0.75),
+            summary=self.summary or "(none)",
+            messages=self._format(messages),
+        )
+        try:
+            return self.llm_service.generate(prompt).strip()
+        except Exception as e:
+            # Khong tom tat duoc -> giu summary cu, message bi day ra chi con trong log
+            logger.error(f"Failed to summarize chat history: {e}")
+            return self.summary
+
+    @staticmethod
+    def _format(messages: List[Dict]) -> str:
+        return "\n".join(f"{'User' if m['role'] == 'human' else 'Assistant'}: {m['content']}" for m in messages)
+
+    def render(self) -> str:
+        ''' Summary + window dang text de dua vao prompt'''
+        parts = []
+        if self.summary:
+            parts.append(f"=== Conversation summary ===\n{self.summary}")
+        if self.window:
+            parts.append(f"=== Recent messages ===\n{self._format(self.window)}")
+        return "\n\n".join(parts)
+
+    def condense(self, question: str) -> str:
+        ''' Cau hoi doc lap (retrieval + answer cache) tu cau hoi follow-up'''
+        if not self.condense_questions or not self.window:
+            return question
+        try:
+            standalone = self.llm_service.generate(
+                CONDENSE_PROMPT.format(history=self.render(), question=question)
+            ).strip()
+            logger.info(f"Condensed question: '{question[:60]}' -> '{standalone[:60]}'")
+            return standalone or question
+        except Exception as e:
+            logger.error(f"Failed to condense question: {e}")
+            return question
+
+    def clear(self):
+        self.window, self.window_tokens = [], 0
+        self.summary = ""
+
+    # -------------------------------------------------------
+    # Persistence
+    # -------------------------------------------------------
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary, "summarized_count": self.summarized_count}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def _migrate_legacy(self):
+        ''' chat_history.json (ghi lai toan bo moi luot) / jsonl chua co seq -> ChatLog'''
+        legacy_path = os.path.join(self.session_dir, self.LEGACY_HISTORY_FILE)
+        if not self.log.exists() and os.path.exists(legacy_path):
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.log.import_messages(data)
+            os.remove(legacy_path)
+            logger.info(f"Migrated {len(data)} messages to {self.log.path}")
+            return
+        last = next(reverse_lines(self.log.path), None)
+        if last is not None and "seq" not in json.loads(last):
+            with open(self.log.path, "r", encoding="utf-8") as f:
+                self.log.import_messages([json.loads(line) for line in f if line.strip()])
+
+    def load(self) -> bool:
+        self._migrate_legacy()
+        if not self.log.exists():
+            return False
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.summary = state.get("summary", "")
+            self.summarized_count = state.get("summarized_count", 0)
+        # Window = cac message chua nam trong summary (seq >= summarized_count), doc tu cuoi log
+        window = []
+        for message in self.log.iter_reverse():
+            if message["seq"] < self.summarized_count:
+                break
+            window.append(message)
+        self.window = window[::-1]
+        self.window_tokens = sum(count_tokens(m["content"]) for m in self.window)
+        self.messages = self.log.tail(self.display_limit)
+        self._trim()
+        return True
@@ -1,6 +1,8 @@
 import os
+from typing import Iterable, Iterator
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
+from app.core.csv_chunker import CSVChunker
 from app.helper.config import config
 from app.helper.logger import get_logger
 
@@ -17,29 +19,38 @@ class ChunkHandler:
     # -------------------------------------------------------
     # Main interface
     # -------------------------------------------------------
-    def split_documents(self, docs: list[Document], file_type: str) -> list[Document]:
+    def split_documents(self, docs: Iterable, file_type: str) -> list[Document]:
         """
         Split documents into chunks based on file type.
 
         Args:
-            docs (list[Document]): List of documents loaded by DataLoader
+            docs (Iterable): Page Document (PDF) hoac lo DataFrame (CSV) tu DataLoader
             file_type (str): Either 'pdf' or 'csv'
 
         Returns:
             list[Document]: List of chunked documents
         """
+        return list(self.iter_chunks(docs, file_type))
+
+    def iter_chunks(self, docs: Iterable, file_type: str) -> Iterator[Document]:
+        """
+        Phien ban streaming cua split_documents: nhan page/lo row lan luot tu
+        DataLoader.iter_file va yield chunk ngay khi co.
+
+        Args:
+            docs (Iterable): Page Document (PDF) hoac lo DataFrame (CSV)
+            file_type (str): Either 'pdf' or 'csv'
+        """
         splitter = self.get_splitter(file_type)
 
         if splitter == "csv":
-            logger.info("🧩 Using CSV chunking strategy.")
-            return self._split_csv_docs(docs)
-        elif isinstance(splitter, RecursiveCharacterTextSplitter):
-            logger.info("📘 Using text splitter for PDF or text-like content.")
-            return splitter.split_documents(docs)
-        else:
-            logger.warning(f"⚠️ Unknown splitter for file_type={file_type}. Defaulting to text splitter.")
-            fallback = self._get_pdf_splitter()
-            return fallback.split_documents(docs)
+            yield from CSVChunker().iter_chunks(docs)
+            return
+
+        if not isinstance(splitter, RecursiveCharacterTextSplitter):
+            splitter = self._get_pdf_splitter()
+        for doc in docs:
+            yield from splitter.split_documents([doc])
 
     # -------------------------------------------------------
     # Splitter selector
@@ -69,33 +80,5 @@ class ChunkHandler:
             chunk_size=self.default_chunk_size,
             chunk_overlap=self.default_chunk_overlap,
             separators=["\n\n", "\n", ".", " ", ""],
+            add_start_index=True,  # vi tri chunk trong trang -> ContextBuilder gop chunk lien ke
         )
-
-    # -------------------------------------------------------
-    # CSV Chunker
-    # -------------------------------------------------------
-    def _split_csv_docs(self, docs: list[Document], group_size: int = 2) -> list[Document]:
-        """
-        Group multiple CSV rows (each row = 1 Document) into larger chunks.
-        This helps LLM understand structured data better.
-
-        Args:
-            docs (list[Document]): List of CSV row documents
-            group_size (int): How many rows to group per chunk
-        """
-        all_chunks = []
-        try:
-            grouped_texts = [
-                "\n".join([doc.page_content for doc in docs[i:i + group_size]])
-                for i in range(0, len(docs), group_size)
-            ]
-
-            for chunk_text in grouped_texts:
-                all_chunks.append(Document(page_content=chunk_text))
-
-            logger.info(f"📊 CSV grouped into {len(all_chunks)} chunks (each ~{group_size} rows).")
-            return all_chunks
-
-        except Exception as e:
-            logger.exception(f"❌ Error while grouping CSV documents: {e}")
-            raise
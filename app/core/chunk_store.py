@@ -0,0 +1,229 @@
+import os
+import json
+import mmap
+import numpy as np
+from collections.abc import Mapping
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import Docstore
+from app.helper.logger import get_logger
+
+logger = get_logger("ChunkStore")
+
+
+class ChunkStore:
+    '''
+    Luu danh sach chunk canh FAISS index (trong vector_dir) de restore nhanh.
+
+    Layout:
+        chunks.bin          text cua tat ca chunk (utf-8, noi lien nhau)
+        chunks_meta.bin     metadata tung chunk (json utf-8, noi lien nhau)
+        chunks_offsets.npy  int64 (n+1, 2): offset [text, meta] cua tung chunk
+    File duoc mo bang mmap, chunk chi duoc decode khi can.
+    '''
+    TEXT_FILE = "chunks.bin"
+    META_FILE = "chunks_meta.bin"
+    OFFSET_FILE = "chunks_offsets.npy"
+
+    def __init__(self, save_dir: str):
+        self.save_dir = save_dir
+        self.offsets = np.load(os.path.join(save_dir, self.OFFSET_FILE), mmap_mode="r")
+        self._text = self._open_blob(os.path.join(save_dir, self.TEXT_FILE))
+        self._meta = self._open_blob(os.path.join(save_dir, self.META_FILE))
+
+    # -------------------------------------------------------
+    # Save / load
+    # -------------------------------------------------------
+    @classmethod
+    def save(cls, chunks: list[Document], save_dir: str) -> str:
+        """
+        Ghi chunk xuong vector_dir.
+
+        Args:
+            chunks (list[Document]): Chunk da split boi ChunkHandler
+            save_dir (str): Thu muc chua faiss_index
+
+        Returns:
+            str: Duong dan file text cua chunk store
+        """
+        try:
+            with ChunkStoreWriter(save_dir) as writer:
+                writer.add(chunks)
+            logger.info(f"Saved {len(chunks)} chunks to {save_dir}")
+            return writer.text_path
+        except Exception as e:
+            logger.error(f"Error saving chunk store {e}")
+            raise
+
+    @classmethod
+    def writer(cls, save_dir: str, append: bool = False) -> "ChunkStoreWriter":
+        '''
+        Writer ghi chunk theo tung batch (pipeline streaming).
+        append=True: ghi tiep vao store da co, chunk moi co id noi tiep.
+        '''
+        return ChunkStoreWriter(save_dir, append=append)
+
+    @classmethod
+    def load(cls, save_dir: str) -> "ChunkStore":
+        try:
+            store = cls(save_dir)
+            logger.info(f"Loaded chunk store ({len(store)} chunks) from {save_dir}")
+            return store
+        except Exception as e:
+            logger.error(f"Error loading chunk store {e}")
+            raise
+
+    @classmethod
+    def rewrite_metadata(cls, save_dir: str, updates: dict[int, dict]) -> int:
+        '''
+        Thay metadata cua mot so chunk (text + chunk_id khong doi). Ghi file meta + offsets moi
+        roi rename -> ChunkStore dang mmap ban cu van doc duoc.
+
+        Args:
+            updates (dict[int, dict]): chunk_id -> metadata moi
+        '''
+        if not updates:
+            return 0
+        store = cls(save_dir)
+        offsets = np.array(store.offsets)
+        meta_path = os.path.join(save_dir, cls.META_FILE)
+        offset_path = os.path.join(save_dir, cls.OFFSET_FILE)
+        meta_pos = 0
+        with open(meta_path + ".tmp", "wb") as f:
+            for i in range(len(store)):
+                if i in updates:
+                    meta = json.dumps(updates[i], ensure_ascii=False, default=str).encode("utf-8")
+                else:
+                    meta = bytes(store._meta[store.offsets[i, 1]:store.offsets[i + 1, 1]])
+                f.write(meta)
+                offsets[i, 1] = meta_pos
+                meta_pos += len(meta)
+            offsets[len(store), 1] = meta_pos
+        with open(offset_path + ".tmp", "wb") as f:
+            np.save(f, offsets)
+        os.replace(meta_path + ".tmp", meta_path)
+        os.replace(offset_path + ".tmp", offset_path)
+        return len(updates)
+
+    @classmethod
+    def exists(cls, save_dir: str) -> bool:
+        return all(
+            os.path.exists(os.path.join(save_dir, name))
+            for name in (cls.TEXT_FILE, cls.META_FILE, cls.OFFSET_FILE)
+        )
+
+    # -------------------------------------------------------
+    # Access
+    # -------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get_text(self, i: int) -> str:
+        start, end = self.offsets[i, 0], self.offsets[i + 1, 0]
+        return bytes(self._text[start:end]).decode("utf-8")
+
+    def get_metadata(self, i: int) -> dict:
+        start, end = self.offsets[i, 1], self.offsets[i + 1, 1]
+        return json.loads(bytes(self._meta[start:end]).decode("utf-8"))
+
+    def get(self, i: int) -> Document:
+        return Document(page_content=self.get_text(i), metadata=self.get_metadata(i))
+
+    def __getitem__(self, i: int) -> Document:
+        return self.get(i)
+
+    def __iter__(self):
+        return (self.get(i) for i in range(len(self)))
+
+    def get_texts(self) -> list[str]:
+        return [self.get_text(i) for i in range(len(self))]
+
+    def to_documents(self) -> list[Document]:
+        return [self.get(i) for i in range(len(self))]
+
+    @staticmethod
+    def _open_blob(path: str):
+        ''' mmap file; file rong thi mmap khong ho tro nen tra ve bytes rong'''
+        if os.path.getsize(path) == 0:
+            return b""
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ChunkStoreWriter:
+    ''' Ghi chunk vao ChunkStore theo batch; offsets duoc ghi khi close()'''
+
+    def __init__(self, save_dir: str, append: bool = False):
+        os.makedirs(save_dir, exist_ok=True)
+        self.save_dir = save_dir
+        self.text_path = os.path.join(save_dir, ChunkStore.TEXT_FILE)
+        append = append and ChunkStore.exists(save_dir)
+        # Chi ghi them vao cuoi file nen ChunkStore dang mmap file cu van doc duoc
+        mode = "ab" if append else "wb"
+        self._f_text = open(self.text_path, mode)
+        self._f_meta = open(os.path.join(save_dir, ChunkStore.META_FILE), mode)
+        if append:
+            offsets = np.load(os.path.join(save_dir, ChunkStore.OFFSET_FILE))
+            self._offsets = [tuple(row) for row in offsets.tolist()]
+        else:
+            self._offsets = [(0, 0)]
+
+    def add(self, chunks: list[Document]):
+        text_pos, meta_pos = self._offsets[-1]
+        for doc in chunks:
+            text = doc.page_content.encode("utf-8")
+            meta = json.dumps(doc.metadata or {}, ensure_ascii=False, default=str).encode("utf-8")
+            self._f_text.write(text)
+            self._f_meta.write(meta)
+            text_pos += len(text)
+            meta_pos += len(meta)
+            self._offsets.append((text_pos, meta_pos))
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def close(self):
+        if self._f_text.closed:
+            return
+        self._f_text.close()
+        self._f_meta.close()
+        offset_path = os.path.join(self.save_dir, ChunkStore.OFFSET_FILE)
+        with open(offset_path + ".tmp", "wb") as f:
+            np.save(f, np.asarray(self._offsets, dtype=np.int64))
+        os.replace(offset_path + ".tmp", offset_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ChunkDocstore(Docstore):
+    ''' Docstore chi doc cho FAISS: docstore id = chunk_id, doc doc tu ChunkStore (khong can pickle)'''
+
+    def __init__(self, chunk_store: ChunkStore):
+        self.chunk_store = chunk_store
+
+    def search(self, search: str):
+        i = int(search)
+        if not 0 <= i < len(self.chunk_store):
+            return f"ID {search} not found."
+        return self.chunk_store.get(i)
+
+
+class IndexIdMap(Mapping):
+    ''' index_to_docstore_id chi doc tren mang numpy (vi tri FAISS -> chunk_id)'''
+
+    def __init__(self, ids: np.ndarray):
+        self.ids = ids
+
+    def __getitem__(self, pos: int) -> str:
+        if not 0 <= pos < len(self.ids):
+            raise KeyError(pos)
+        return str(int(self.ids[pos]))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(range(len(self.ids)))
@@ -0,0 +1,135 @@
+import re
+from dataclasses import dataclass, field
+from langchain.docstore.document import Document
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("ContextBuilder")
+
+# So token chi la uoc luong cho ngan sach prompt, khong phai tokenizer cua Llama:
+# cl100k_base la BPE goc cua tokenizer Llama 3 (Llama 3 them ~28k token) nen dem xap xi, thuong hoi du.
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # khong load duoc bang BPE (offline lan dau) -> dung xap xi ben duoi
+    _ENCODING = None
+
+# Xap xi BPE khi khong co tiktoken: tu dai bi cat moi 5 ky tu, dau cau = 1 token (dem du, khong dem thieu)
+_APPROX_TOKEN_RE = re.compile(r"\w{1,5}|[^\w\s]", re.UNICODE)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def count_tokens(text: str) -> int:
+    ''' So token (xap xi) cua text'''
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return sum(1 for _ in _APPROX_TOKEN_RE.finditer(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    ''' Giu toi da max_tokens token dau cua text'''
+    if max_tokens <= 0:
+        return ""
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else _ENCODING.decode(tokens[:max_tokens])
+    for i, match in enumerate(_APPROX_TOKEN_RE.finditer(text)):
+        if i == max_tokens - 1:
+            return text[: match.end()]
+    return text
+
+
+@dataclass
+class _Passage:
+    ''' 1 doan context: 1 chunk hoac nhieu chunk lien ke cung trang da gop'''
+    text: str
+    key: tuple = None
+    start: int = None
+    end: int = None
+    shingles: set = field(default_factory=set)
+
+    def merge(self, text: str, start: int) -> bool:
+        ''' Gop chunk [start, start + len(text)) neu chong lan / ke sat doan hien tai'''
+        end = start + len(text)
+        if start > self.end or end < self.start:
+            return False
+        if start < self.start:
+            self.text = text[: self.start - start] + self.text
+            self.start = start
+        if end > self.end:
+            self.text = self.text + text[len(text) - (end - self.end):]
+            self.end = end
+        return True
+
+
+class ContextBuilder:
+    '''
+    Ghep context cho prompt tu cac chunk da xep hang (tot nhat truoc).
+
+    - Chunk cung nguon + trang co start_index chong lan / ke nhau -> gop thanh 1 doan
+      (phan overlap cua splitter chi gui 1 lan).
+    - Chunk trung lap gan nhu hoan toan voi doan da chon (Jaccard tren shingle tu) -> bo.
+    - Lay doan theo thu tu rank den khi het max_tokens; doan khong vua ngan sach
+      bi cat neu con it nhat min_chunk_tokens, khong thi bo qua.
+    '''
+
+    def __init__(self, max_tokens: int = None, min_chunk_tokens: int = None, dedupe_threshold: float = None,
+                 separator: str = "\n\n"):
+        self.max_tokens = max_tokens or config.CONTEXT_MAX_TOKENS
+        self.min_chunk_tokens = min_chunk_tokens if min_chunk_tokens is not None else config.CONTEXT_MIN_CHUNK_TOKENS
+        self.dedupe_threshold = dedupe_threshold or config.CONTEXT_DEDUPE_THRESHOLD
+        self.separator = separator
+
+    @staticmethod
+    def _shingles(text: str, size: int = 5) -> set:
+        words = _WORD_RE.findall(text.lower())
+        if len(words) < size:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+    def _is_duplicate(self, shingles: set, passages: list[_Passage]) -> bool:
+        for passage in passages:
+            union = len(shingles | passage.shingles)
+            if union and len(shingles & passage.shingles) / union >= self.dedupe_threshold:
+                return True
+        return False
+
+    def _passages(self, docs: list[Document]) -> list[_Passage]:
+        passages: list[_Passage] = []
+        for doc in docs:
+            text = doc.page_content.strip()
+            if not text:
+                continue
+            meta = doc.metadata or {}
+            start = meta.get("start_index")
+            key = (meta.get("source"), meta.get("page")) if start is not None else None
+            if key is not None:
+                merged = next((p for p in passages if p.key == key and p.merge(doc.page_content, start)), None)
+                if merged is not None:
+                    merged.shingles = self._shingles(merged.text)
+                    continue
+            shingles = self._shingles(text)
+            if self._is_duplicate(shingles, passages):
+                continue
+            end = start + len(doc.page_content) if start is not None else None
+            text = doc.page_content if key is not None else text
+            passages.append(_Passage(text, key, start, end, shingles))
+        return passages
+
+    def build(self, docs: list[Document]) -> str:
+        passages = self._passages(docs)
+        parts, used = [], 0
+        sep_tokens = count_tokens(self.separator)
+        for passage in passages:
+            text = passage.text.strip()
+            remaining = self.max_tokens - used - (sep_tokens if parts else 0)
+            n_tokens = count_tokens(text)
+            if n_tokens > remaining:
+                if remaining < self.min_chunk_tokens:
+                    continue
+                text = truncate_tokens(text, remaining)
+                n_tokens = count_tokens(text)
+            parts.append(text)
+            used += n_tokens + (sep_tokens if len(parts) > 1 else 0)
+        logger.info(f"Context: {len(parts)}/{len(docs)} passages, ~{used} tokens (budget {self.max_tokens})")
+        return self.separator.join(parts)
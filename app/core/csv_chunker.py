@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+from langchain.docstore.document import Document
+from app.core.context_builder import count_tokens, _APPROX_TOKEN_RE
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("CSVChunker")
+
+_DTYPE_NAMES = {"i": "integer", "u": "integer", "f": "number", "b": "boolean", "M": "datetime"}
+
+
+@dataclass
+class _CSVChunk:
+    ''' Chunk dang gom: header (schema [+ key]) + cac row da render'''
+    header: str
+    key: object = None
+    rows: list = field(default_factory=list)
+    tokens: int = 0
+    row_start: int = None
+    row_end: int = None
+
+    def add(self, rows: list, tokens: int, row_numbers: np.ndarray):
+        self.rows.extend(rows)
+        self.tokens += tokens
+        first, last = int(row_numbers.min()), int(row_numbers.max())
+        self.row_start = first if self.row_start is None else min(self.row_start, first)
+        self.row_end = last if self.row_end is None else max(self.row_end, last)
+
+    def to_document(self, group_by: str = None) -> Document:
+        metadata = {"rows": len(self.rows), "row_start": self.row_start, "row_end": self.row_end}
+        if group_by is not None:
+            metadata.update(group_by=group_by, key=str(self.key))
+        return Document(page_content=self.header + "\n" + "\n".join(self.rows), metadata=metadata)
+
+
+class CSVChunker:
+    '''
+    Chunk CSV tu cac lo DataFrame (pd.read_csv chunksize) thay vi 1 Document moi row.
+
+    - Row duoc render bang phep toan chuoi tren ca cot ("v1 | v2 | ..."), so token
+      dem xap xi bang str.count -> khong tao object Python cho tung row.
+    - Row lien tiep duoc gom den khi dat chunk_tokens (cumsum + searchsorted, moi
+      vong lap la 1 chunk chu khong phai 1 row); group_by -> moi gia tri cua cot
+      la 1 nhom rieng (giu chunk dang gom cua toi da MAX_OPEN_GROUPS nhom qua cac lo),
+      nhom lon van bi chia theo chunk_tokens.
+    - Moi chunk mo dau bang header + schema (ten cot + kieu, lay tu lo dau) -> chunk
+      tu doc duoc. Bo nho dinh = 1 lo DataFrame + cac chunk dang gom.
+    '''
+    SEPARATOR = " | "
+    MAX_OPEN_GROUPS = 1024
+
+    def __init__(self, chunk_tokens: int = None, group_by: str = None):
+        self.chunk_tokens = chunk_tokens or config.CSV_CHUNK_TOKENS
+        self.group_by = group_by if group_by is not None else config.CSV_GROUP_BY
+
+    @staticmethod
+    def _schema(df: pd.DataFrame) -> str:
+        columns = ", ".join(f"{col} ({_DTYPE_NAMES.get(dtype.kind, 'text')})" for col, dtype in df.dtypes.items())
+        return f"Columns: {columns}"
+
+    def _render(self, df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        ''' Text + so token (xap xi, tinh ca dau xuong dong) cua tung row'''
+        values = [df[col].astype(str).str.strip() for col in df.columns]
+        rows = values[0]
+        for col in values[1:]:
+            rows = rows + self.SEPARATOR + col
+        tokens = rows.str.count(_APPROX_TOKEN_RE.pattern).to_numpy(dtype=np.int64) + 1
+        return rows.to_numpy(dtype=object), tokens
+
+    def _pack(self, chunk: _CSVChunk, rows: np.ndarray, tokens: np.ndarray, row_numbers: np.ndarray,
+              budget: int):
+        ''' Gom rows vao chunk den khi day budget; yield Document cua chunk da day, tra ve chunk cuoi (chua day)'''
+        cum = np.cumsum(tokens)
+        i, n = 0, len(rows)
+        while i < n:
+            base = cum[i - 1] if i else 0
+            end = int(np.searchsorted(cum, base + budget - chunk.tokens, side="right"))
+            if end == i and not chunk.rows:
+                end = i + 1  # 1 row da vuot budget -> dung rieng 1 chunk
+            if end > i:
+                chunk.add(rows[i:end].tolist(), int(cum[end - 1] - base), row_numbers[i:end])
+            if end < n:
+                yield self._emit(chunk)
+                chunk = _CSVChunk(chunk.header, chunk.key)
+            i = end
+        return chunk
+
+    def _emit(self, chunk: _CSVChunk) -> Document:
+        self._n_chunks += 1
+        return chunk.to_document(self.group_by)
+
+    def iter_chunks(self, batches: Iterable[pd.DataFrame]) -> Iterator[Document]:
+        '''
+        Args:
+            batches (Iterable[pd.DataFrame]): Cac lo row tu DataLoader.iter_file
+        '''
+        schema, n_rows, self._n_chunks = None, 0, 0
+        open_chunks: dict = {}  # key -> chunk dang gom (thu tu chen = LRU), key None khi gom theo token
+        for df in batches:
+            if schema is None:
+                schema = self._schema(df)
+                if self.group_by is not None and self.group_by not in df.columns:
+                    logger.warning(f"Column '{self.group_by}' not found, grouping CSV rows by token budget")
+                    self.group_by = None
+            rows, tokens = self._render(df)
+            row_numbers = np.arange(n_rows, n_rows + len(df))
+            n_rows += len(df)
+            if self.group_by is None:
+                groups = [(None, slice(None))]
+            else:
+                groups = df.groupby(self.group_by, sort=False, dropna=False).indices.items()
+            for key, positions in groups:
+                chunk = open_chunks.pop(key, None)
+                if chunk is None:
+                    chunk = _CSVChunk(schema if key is None else f"{schema}\n{self.group_by} = {key}", key)
+                budget = max(self.chunk_tokens - count_tokens(chunk.header), 1)
+                open_chunks[key] = yield from self._pack(
+                    chunk, rows[positions], tokens[positions], row_numbers[positions], budget
+                )
+                # Qua nhieu nhom dang mo (cot co nhieu gia tri) -> xuat nhom lau khong gap nhat
+                if len(open_chunks) > self.MAX_OPEN_GROUPS:
+                    yield self._emit(open_chunks.pop(next(iter(open_chunks))))
+        for chunk in open_chunks.values():
+            if chunk.rows:
+                yield self._emit(chunk)
+        logger.info(f"📊 CSV chunked: {n_rows} rows -> {self._n_chunks} chunks (~{self.chunk_tokens} tokens each)")
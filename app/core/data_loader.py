@@ -1,6 +1,9 @@
 import os
+import pandas as pd
+from typing import Iterator
 from langchain.docstore.document import Document
-from langchain_community.document_loaders import CSVLoader, PyPDFLoader
+from app.core.pdf_parser import PDFParser
+from app.helper.config import config
 from app.helper.logger import get_logger
 
 logger = get_logger("DataLoader")
@@ -9,49 +12,45 @@ class DataLoader:
     """Read PDF or CSV files and return a list of LangChain Document objects."""
 
     @staticmethod
-    def load_file(file_path: str)-> tuple[list[Document],str]:
-        """Main method: determine file type and load content."""
+    def load_file(file_path: str) -> tuple[list, str]:
+        """Main method: doc het file -> list page Document (PDF) / lo DataFrame (CSV), cung dang voi iter_file."""
+        docs, type_docs = DataLoader.iter_file(file_path)
+        docs = list(docs)
+        logger.info(f"Successfully loaded file: {file_path}")
+        return docs, type_docs
+
+    @staticmethod
+    def iter_file(file_path: str) -> tuple[Iterator[Document], str]:
+        """Giong load_file nhung tra ve generator: page (PDF) / lo DataFrame (CSV) duoc doc lan luot (pipeline streaming)."""
         if not os.path.exists(file_path):
             logger.error(f" File not found: {file_path}") 
             raise FileNotFoundError(f"File not found: {file_path}")
 
         if file_path.endswith(".pdf"):
-            docs = DataLoader._load_pdf(file_path)
+            docs = PDFParser().iter_pages(file_path)
             type_docs = "pdf"
         elif file_path.endswith(".csv"):
-            docs = DataLoader._load_csv(file_path)
-            type_docs ="csv"
+            docs = DataLoader._iter_csv_batches(file_path)
+            type_docs = "csv"
         else:
             logger.error(f"❌ Unsupported file type: {file_path}")
             raise ValueError("Unsupported file type. Only PDF or CSV files are allowed.")
 
-        logger.info(f"Successfully loaded file: {file_path}")
-        return docs,type_docs
-
-    @staticmethod
-    def _load_pdf(file_path: str) -> list[Document]:
-        """Load PDF file using LangChain's PyPDFLoader."""
-        try:
-            loader = PyPDFLoader(file_path)
-            docs = loader.load()
-            logger.info(f" Loaded {len(docs)} pages from PDF: {os.path.basename(file_path)}")
-            return docs
-        except Exception as e:
-            logger.exception(f" Error loading PDF file {file_path}: {e}")
-            raise
+        logger.info(f"Streaming file: {file_path}")
+        return docs, type_docs
 
     @staticmethod
-    def _load_csv(file_path: str) -> list[Document]:
-        """Load CSV file using LangChain's CSVLoader."""
-        try:
-            loader = CSVLoader(
-                file_path=file_path,
-                encoding="utf-8",
-                csv_args={"delimiter": ",", "quotechar": '"'},
-            )
-            docs = loader.load()
-            logger.info(f" Loaded {len(docs)} rows from CSV: {os.path.basename(file_path)}")
-            return docs
-        except Exception as e:
-            logger.exception(f"❌ Error loading CSV file {file_path}: {e}")
-            raise
+    def _iter_csv_batches(file_path: str, batch_rows: int = None, keep_default_na: bool = False) -> Iterator[pd.DataFrame]:
+        """
+        Doc CSV theo lo batch_rows dong (pandas chunksize) -> bo nho chi giu 1 lo.
+        keep_default_na=False: o trong giu la "" (chunk text); True: o trong -> NaN (bang SQL).
+        """
+        with pd.read_csv(
+            file_path,
+            encoding="utf-8",
+            sep=",",
+            quotechar='"',
+            chunksize=batch_rows or config.CSV_BATCH_ROWS,
+            keep_default_na=keep_default_na,
+        ) as reader:
+            yield from reader
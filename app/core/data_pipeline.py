@@ -1,9 +1,15 @@
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from app.core.chunk_handler import ChunkHandler
 from app.core.vector_store import VectorStore
+from app.core.chunk_store import ChunkStore
+from app.core.bm25_index import BM25Builder
 from app.services.embedding_service import EmbeddingService
 from app.core.data_loader import DataLoader
 from app.helper.logger import get_logger
+from app.helper.config import config
 
 # Khởi tạo logger
 logger = get_logger('PipelineRAG')
@@ -19,49 +25,130 @@ class DataPipeLine:
         self.chunk = ChunkHandler()
         self.embedding_service = EmbeddingService()
         self.vector_store = VectorStore()
+        self.batch_size = config.PIPELINE_BATCH_SIZE
+        self.embed_workers = config.PIPELINE_EMBED_WORKERS
+        self.max_pending = config.PIPELINE_MAX_PENDING_BATCHES
         
         
-    def process(self, file_path: str, save_dir: str = 'data/vector_store') -> str:
+    def process(self, file_path: str, save_dir: str = 'data/vector_store', progress=None) -> tuple[str, ChunkStore]:
         """
-        Thực thi luồng chạy cho pipeline RAG.
+        Thực thi luồng chạy cho pipeline RAG (streaming).
+
+        Page được đọc lần lượt từ DataLoader, chunk ngay, và mỗi batch chunk được
+        embed trên thread pool trong khi vẫn tiếp tục parse file. Số batch đang
+        chờ embed bị giới hạn (max_pending) nên bộ nhớ không tăng theo kích thước file.
+        FAISS được thêm dần bằng add_embeddings, chunk/BM25 được ghi theo batch.
 
         Args: 
             file_path: Đường dẫn tới file CSV hoặc PDF.
             save_dir: Nơi lưu trữ FAISS index.
+            progress: callback(stage, **counts) báo tiến độ (parsed / total / chunks / embedded).
 
-        Return: Đường dẫn (path) đến FAISS index đã lưu.
+        Return: Đường dẫn (path) đến FAISS index đã lưu và ChunkStore của index.
         """
         try:
             logger.info(f"Starting data pipe line for file: {file_path}")
+            start_time = time.time()
 
-            # Step 1: Load file 
-            docs, file_type = self.loader.load_file(file_path)
-            logger.info(f"Loaded {len(docs)} documents of type: {file_type}")
-            
-            # Step 2: Chunk Document
-            chunks = self.chunk.split_documents(docs=docs, file_type=file_type)
-            logger.info(f'Split into {len(chunks)} chunks')
+            # Step 1 + 2: Stream page -> chunk
+            pages, file_type = self.loader.iter_file(file_path)
+            pages = self._track_parsed(pages, file_type, progress)
+            chunks = self.chunk.iter_chunks(pages, file_type=file_type)
             
-            # Step 3: Build Embedding model 
-            embedding_model = self.embedding_service.model
-            logger.info(f'Using embedding model: {self.embedding_service.model.model_name}')
+            # Step 3: Build Embedding model (qua embedding cache, chunk da gap se khong embed lai)
+            embedding_model = self.embedding_service.cached_model
+            logger.info(f'Using embedding model: {self.embedding_service.model.model_name} '
+                        f'(batch_size={self.embedding_service.engine.batch_size}, workers={self.embedding_service.engine.num_workers})')
             
-            # Step 4: Build Vector Store
-            vectorstore = self.vector_store.build_vector_store(chunks, embedding_model=embedding_model)
-            logger.info('FAISS vector store built successfully')
-            
-            # Step 5: Save Vector Store
+            # Step 4: Embed theo batch + them dan vao FAISS, ghi chunk + BM25 postings
             os.makedirs(save_dir, exist_ok=True)
+            bm25_builder = BM25Builder()
+            vectorstore = None
+            pending = deque()
+            with ChunkStore.writer(save_dir) as chunk_writer, \
+                    ThreadPoolExecutor(max_workers=self.embed_workers) as executor:
+                for batch in self._batched(chunks, self.batch_size):
+                    for doc in batch:
+                        doc.metadata["chunk_id"] = len(chunk_writer)
+                        chunk_writer.add([doc])
+                    texts = [doc.page_content for doc in batch]
+                    bm25_builder.add_texts(texts)
+                    pending.append((batch, executor.submit(embedding_model.embed_documents, texts)))
+                    while len(pending) > self.max_pending:
+                        vectorstore = self._add_batch(vectorstore, *pending.popleft(), embedding_model)
+                        self._report_embedded(progress, pending, len(chunk_writer))
+                while pending:
+                    vectorstore = self._add_batch(vectorstore, *pending.popleft(), embedding_model)
+                    self._report_embedded(progress, pending, len(chunk_writer))
+                n_chunks = len(chunk_writer)
+
+            if vectorstore is None:
+                raise ValueError(f"No content extracted from {file_path}")
+            elapsed = time.time() - start_time
+            logger.info(f'FAISS vector store built successfully ({file_type}): {n_chunks} chunks in {elapsed:.2f}s '
+                        f'({n_chunks / max(elapsed, 1e-6):.1f} chunks/sec)')
+            
+            # Step 5: Chon loai index theo so chunk (flat / IVF / PQ / HNSW) + save
+            self._report(progress, "indexing", chunks=n_chunks, embedded=n_chunks)
+            vectorstore = self.vector_store.optimize_index(vectorstore)
             index_path = self.vector_store.save_vector_store(vector_store=vectorstore, save_dir=save_dir)
             logger.info(f'Vector Store saved at: {index_path}') # Đã sửa logger info thành index_path
 
+            # Step 6: BM25 index build 1 lan, retriever chi can load (mmap)
+            bm25_builder.build().save(save_dir)
+
             logger.info('Pipeline completed successfully')
-            return index_path, chunks
+            return index_path, ChunkStore.load(save_dir)
         
         except Exception as e:
             logger.error(f'Failed to build pipeline: {e}')
             raise
 
+    def load_chunks(self, file_path: str) -> list:
+        """Parse + chunk file (khong embed) - cung ChunkHandler voi process()."""
+        pages, file_type = self.loader.iter_file(file_path)
+        return list(self.chunk.iter_chunks(pages, file_type=file_type))
+
+    @staticmethod
+    def _report(progress, stage: str, **counts):
+        """Goi callback tien do; loi trong callback khong lam hong pipeline."""
+        if progress is None:
+            return
+        try:
+            progress(stage, **counts)
+        except Exception as e:
+            logger.warning(f'Progress callback failed: {e}')
+
+    def _track_parsed(self, pages, file_type: str, progress):
+        """Dem page (PDF) / row (CSV) da parse khi pipeline doc qua."""
+        parsed = 0
+        unit = "rows" if file_type == "csv" else "pages"
+        for page in pages:
+            parsed += len(page) if file_type == "csv" else 1
+            total = page.metadata.get("total_pages") if file_type != "csv" else None
+            self._report(progress, "processing", parsed=parsed, total=total, unit=unit)
+            yield page
+
+    def _report_embedded(self, progress, pending, n_chunks: int):
+        """Sau moi batch them vao FAISS: chunk da embed = chunk da ghi - chunk con cho embed."""
+        self._report(progress, "processing", chunks=n_chunks,
+                     embedded=n_chunks - sum(len(batch) for batch, _ in pending))
+
+    def _add_batch(self, vectorstore, batch, future, embedding_model):
+        """Đợi batch embed xong và thêm vào FAISS (giữ đúng thứ tự chunk_id)."""
+        return self.vector_store.add_embeddings(vectorstore, batch, future.result(), embedding_model)
+
+    @staticmethod
+    def _batched(iterable, size: int):
+        batch = []
+        for item in iterable:
+            batch.append(item)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
 if __name__ =="__main__":
     pipeline =DataPipeLine()
     index_path ='data/laptop.csv'
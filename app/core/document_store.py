@@ -0,0 +1,193 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from app.core.index_manager import IndexManager
+from app.core.table_store import TableStore
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("DocumentStore")
+
+
+class DocumentStore:
+    '''
+    Kho tai lieu dung chung, key theo sha256 noi dung file.
+
+    Layout (duoi data/documents):
+        <doc_hash>/source/<file_name>   ban copy duy nhat cua file upload
+        <doc_hash>/vector_store/        index (faiss_index, chunks, bm25) build 1 lan, khong sua
+        <doc_hash>/table.sqlite         bang SQL cua file CSV (TableStore), build 1 lan
+        <doc_hash>/refs.json            danh sach session dang dung tai lieu
+    Tai lieu chi bi xoa khi khong con session nao tham chieu.
+    '''
+    _lock = threading.Lock()
+    _build_locks: dict[str, threading.Lock] = {}
+
+    def __init__(self, base_dir: str = None):
+        self.base_dir = base_dir or config.DOCUMENT_STORE_DIR
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    # -------------------------------------------------------
+    # Paths
+    # -------------------------------------------------------
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        sha = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def doc_dir(self, doc_hash: str) -> str:
+        return os.path.join(self.base_dir, doc_hash)
+
+    def vector_dir(self, doc_hash: str) -> str:
+        return os.path.join(self.doc_dir(doc_hash), "vector_store")
+
+    def source_path(self, doc_hash: str) -> str:
+        source_dir = os.path.join(self.doc_dir(doc_hash), "source")
+        files = os.listdir(source_dir) if os.path.exists(source_dir) else []
+        return os.path.join(source_dir, files[0]) if files else None
+
+    def table_path(self, doc_hash: str) -> str:
+        return os.path.join(self.doc_dir(doc_hash), TableStore.FILE)
+
+    def has_index(self, doc_hash: str) -> bool:
+        return os.path.exists(os.path.join(self.vector_dir(doc_hash), "faiss_index"))
+
+    # -------------------------------------------------------
+    # Add / build
+    # -------------------------------------------------------
+    def add_source(self, file_path: str, session_key: str = None) -> str:
+        '''
+        Copy file vao store neu chua co, tra ve doc_hash.
+        session_key: giu tham chieu cua session trong cung lock -> release cua session khac
+        khong the xoa tai lieu giua luc copy va acquire.
+        '''
+        doc_hash = self.file_hash(file_path)
+        source_dir = os.path.join(self.doc_dir(doc_hash), "source")
+        with self._lock:
+            if self.source_path(doc_hash) is None:
+                os.makedirs(source_dir, exist_ok=True)
+                shutil.copy(file_path, os.path.join(source_dir, os.path.basename(file_path)))
+                logger.info(f"Stored new document {doc_hash[:12]} ({os.path.basename(file_path)})")
+            else:
+                logger.info(f"Document {doc_hash[:12]} already in store, reuse it")
+            if session_key is not None:
+                self._acquire(doc_hash, session_key)
+        return doc_hash
+
+    def ensure_index(self, doc_hash: str, pipeline, progress=None) -> str:
+        '''
+        Build index cho tai lieu neu chua co (moi doc_hash chi build 1 lan).
+        Index duoc build vao thu muc tam roi rename, nen session khac
+        khong bao gio thay index dang build do.
+        '''
+        with self._lock:
+            build_lock = self._build_locks.setdefault(doc_hash, threading.Lock())
+        with build_lock:
+            vector_dir = self.vector_dir(doc_hash)
+            if self.has_index(doc_hash):
+                logger.info(f"Reuse shared index for document {doc_hash[:12]}")
+                return vector_dir
+            tmp_dir = f"{vector_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            try:
+                source_path = self.source_path(doc_hash)
+                _, chunk_store = pipeline.process(file_path=source_path, save_dir=tmp_dir, progress=progress)
+                IndexManager(tmp_dir).init_manifest(doc_hash, os.path.basename(source_path), len(chunk_store))
+                os.replace(tmp_dir, vector_dir)
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            logger.info(f"Built shared index for document {doc_hash[:12]} at {vector_dir}")
+            return vector_dir
+
+    def derive_index(self, doc_hash: str, base_hash: str, pipeline, progress=None) -> str:
+        '''
+        Index cho ban sua doc_hash cua tai lieu base_hash: copy index cua base roi chi
+        thay cac chunk thay doi (IndexManager.update_document) thay vi build lai tu dau.
+        Base khong co index -> build day du.
+        '''
+        if not self.has_index(base_hash):
+            return self.ensure_index(doc_hash, pipeline, progress)
+        with self._lock:
+            build_lock = self._build_locks.setdefault(doc_hash, threading.Lock())
+        with build_lock:
+            vector_dir = self.vector_dir(doc_hash)
+            if self.has_index(doc_hash):
+                logger.info(f"Reuse shared index for document {doc_hash[:12]}")
+                return vector_dir
+            tmp_dir = f"{vector_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+            try:
+                source_path = self.source_path(doc_hash)
+                chunks = pipeline.load_chunks(source_path)
+                if progress is not None:
+                    progress("updating", chunks=len(chunks))
+                IndexManager.copy_index(self.vector_dir(base_hash), tmp_dir).update_document(
+                    base_hash, doc_hash, os.path.basename(source_path), chunks
+                )
+                os.replace(tmp_dir, vector_dir)
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            logger.info(f"Derived index for document {doc_hash[:12]} from {base_hash[:12]} at {vector_dir}")
+            return vector_dir
+
+    def ensure_table(self, doc_hash: str) -> str:
+        ''' Bang SQL cho tai lieu CSV (build 1 lan), None neu khong phai CSV'''
+        source_path = self.source_path(doc_hash)
+        if source_path is None or not source_path.endswith(".csv"):
+            return None
+        with self._lock:
+            build_lock = self._build_locks.setdefault(doc_hash, threading.Lock())
+        with build_lock:
+            if not TableStore.exists(self.doc_dir(doc_hash)):
+                TableStore.build(source_path, self.doc_dir(doc_hash))
+        return self.table_path(doc_hash)
+
+    # -------------------------------------------------------
+    # Reference counting
+    # -------------------------------------------------------
+    def _refs_path(self, doc_hash: str) -> str:
+        return os.path.join(self.doc_dir(doc_hash), "refs.json")
+
+    def _read_refs(self, doc_hash: str) -> list[str]:
+        path = self._refs_path(doc_hash)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("sessions", [])
+
+    def _write_refs(self, doc_hash: str, sessions: list[str]):
+        path = self._refs_path(doc_hash)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"sessions": sessions}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def acquire(self, doc_hash: str, session_key: str) -> int:
+        with self._lock:
+            return self._acquire(doc_hash, session_key)
+
+    def _acquire(self, doc_hash: str, session_key: str) -> int:
+        sessions = self._read_refs(doc_hash)
+        if session_key not in sessions:
+            sessions.append(session_key)
+            self._write_refs(doc_hash, sessions)
+        return len(sessions)
+
+    def release(self, doc_hash: str, session_key: str) -> int:
+        ''' Bo tham chieu cua session; het tham chieu thi xoa tai lieu + index'''
+        with self._lock:
+            if not os.path.exists(self.doc_dir(doc_hash)):
+                return 0
+            sessions = [s for s in self._read_refs(doc_hash) if s != session_key]
+            if sessions:
+                self._write_refs(doc_hash, sessions)
+                logger.info(f"Document {doc_hash[:12]} still used by {len(sessions)} session(s)")
+                return len(sessions)
+            shutil.rmtree(self.doc_dir(doc_hash), ignore_errors=True)
+            self._build_locks.pop(doc_hash, None)
+            logger.info(f"Removed document {doc_hash[:12]} (no session left)")
+            return 0
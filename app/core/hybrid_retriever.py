@@ -0,0 +1,147 @@
+import threading
+import numpy as np
+import faiss
+from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from langchain.docstore.document import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_community.vectorstores.utils import DistanceStrategy
+from app.core.retrieval_cache import RetrievalCache
+from app.helper.logger import get_logger
+
+logger = get_logger("HybridRetriever")
+
+_EMPTY_IDS = np.empty(0, dtype=np.int64)
+_EMPTY_SCORES = np.empty(0, dtype=np.float32)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    ''' Thread pool dung chung toan process cho nhanh dense'''
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid-dense")
+    return _executor
+
+
+class HybridRetriever(BaseRetriever):
+    '''
+    Hybrid BM25 + dense retriever.
+
+    - Nhanh dense (embed query + FAISS search) chay tren thread pool dung chung,
+      song song voi nhanh BM25 o thread hien tai.
+    - Fusion tren chunk_id (numpy): "rrf" = sum w / (rrf_k + rank),
+      "weighted" = sum w * diem da min-max normalize cua tung nhanh.
+    - Chi tao Document cho top-k sau fusion (doc tu ChunkStore).
+    - cache_key (vector_dir@generation.version cua index): co thi cache ket qua theo query.
+    '''
+    vector_store: Any
+    bm25: Any
+    docs: Any
+    k_bm25: int = 30
+    k_vector: int = 5
+    k: int = 10
+    weights: list[float] = [0.5, 0.5]
+    fusion: str = "rrf"
+    rrf_k: int = 60
+    cache_key: Any = None
+
+    # -------------------------------------------------------
+    # Branches
+    # -------------------------------------------------------
+    def dense_search(self, query: str) -> tuple[np.ndarray, np.ndarray]:
+        ''' (chunk_ids, similarity) top k_vector tu FAISS, khong tao Document'''
+        vs = self.vector_store
+        model_key = getattr(vs.embeddings, "model_name", type(vs.embeddings).__name__)
+        vector = RetrievalCache().query_vector(model_key, query, vs.embeddings.embed_query)[None, :].copy()
+        if vs._normalize_L2:
+            faiss.normalize_L2(vector)
+        distances, labels = vs.index.search(vector, self.k_vector)
+        distances, labels = distances[0], labels[0]
+        ids = self._chunk_ids(labels[labels >= 0])
+        scores = distances[labels >= 0][ids >= 0]
+        ids = ids[ids >= 0]
+        # L2: khoang cach nho = gan -> doi dau de diem lon = tot
+        if vs.distance_strategy != DistanceStrategy.MAX_INNER_PRODUCT:
+            scores = -scores
+        return ids, scores.astype(np.float32)
+
+    def _chunk_ids(self, labels: np.ndarray) -> np.ndarray:
+        ''' Vi tri FAISS -> chunk_id; docstore id khong phai so (index cu) -> chunk_id trong metadata, khong co thi -1'''
+        vs = self.vector_store
+        ids = []
+        for label in labels:
+            doc_id = vs.index_to_docstore_id[int(label)]
+            if doc_id.isdigit():
+                ids.append(int(doc_id))
+                continue
+            doc = vs.docstore.search(doc_id)
+            chunk_id = doc.metadata.get("chunk_id") if isinstance(doc, Document) else None
+            if chunk_id is None:
+                logger.warning(f"Docstore id {doc_id} has no chunk_id, dropping dense hit")
+            ids.append(-1 if chunk_id is None else int(chunk_id))
+        return np.asarray(ids, dtype=np.int64)
+
+    def bm25_search(self, query: str) -> tuple[np.ndarray, np.ndarray]:
+        if self.bm25 is None:
+            return _EMPTY_IDS, _EMPTY_SCORES
+        ids, scores = self.bm25.search(query, self.k_bm25)
+        return np.asarray(ids, dtype=np.int64), scores
+
+    # -------------------------------------------------------
+    # Fusion
+    # -------------------------------------------------------
+    def fuse(self, branches: list[tuple[np.ndarray, np.ndarray]]) -> tuple[np.ndarray, np.ndarray]:
+        ''' Gop ket qua cac nhanh (da sap giam dan theo diem) -> (chunk_ids, fused_scores) giam dan'''
+        ids_parts, weight_parts = [], []
+        for (ids, scores), weight in zip(branches, self.weights):
+            if not len(ids):
+                continue
+            if self.fusion == "weighted":
+                span = float(scores.max() - scores.min())
+                norm = (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+                contrib = weight * norm
+            else:
+                contrib = weight / (self.rrf_k + np.arange(1, len(ids) + 1, dtype=np.float32))
+            ids_parts.append(ids)
+            weight_parts.append(contrib.astype(np.float32))
+        if not ids_parts:
+            return _EMPTY_IDS, _EMPTY_SCORES
+        unique_ids, inverse = np.unique(np.concatenate(ids_parts), return_inverse=True)
+        fused = np.bincount(inverse, weights=np.concatenate(weight_parts)).astype(np.float32)
+        order = np.argsort(-fused, kind="stable")
+        return unique_ids[order], fused[order]
+
+    def branches(self, query: str) -> list[tuple[np.ndarray, np.ndarray]]:
+        ''' Chay 2 nhanh song song: [(bm25 ids, scores), (dense ids, scores)]'''
+        dense_future = get_executor().submit(self.dense_search, query)
+        try:
+            sparse = self.bm25_search(query)
+        except Exception as e:
+            logger.error(f"BM25 branch failed, use dense only: {e}")
+            sparse = (_EMPTY_IDS, _EMPTY_SCORES)
+        try:
+            dense = dense_future.result()
+        except Exception as e:
+            logger.error(f"Dense branch failed, use BM25 only: {e}")
+            dense = (_EMPTY_IDS, _EMPTY_SCORES)
+        return [sparse, dense]
+
+    def search(self, query: str) -> tuple[np.ndarray, np.ndarray]:
+        ''' Fusion 2 nhanh, tra ve (chunk_ids, scores) top k'''
+        ids, scores = self.fuse(self.branches(query))
+        return ids[: self.k], scores[: self.k]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        cache = RetrievalCache()
+        cached = cache.get_results(self.cache_key, "hybrid", query)
+        if cached is not None:
+            ids, _ = cached
+        else:
+            ids, scores = self.search(query)
+            cache.put_results(self.cache_key, "hybrid", query, ids, scores)
+        return [self.docs[int(i)] for i in ids]
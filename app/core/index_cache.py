@@ -0,0 +1,126 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+from app.core.vector_store import VectorStore
+from app.core.chunk_store import ChunkStore
+from app.core.bm25_index import BM25Index
+from app.core.index_manager import IndexManager
+from app.core.retrieval_cache import RetrievalCache
+from app.services.answer_cache import AnswerCache
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("IndexCache")
+
+
+@dataclass
+class LoadedIndex:
+    ''' Index da load cua 1 vector_dir (dung chung giua cac session cung tai lieu)'''
+    vector_dir: str
+    generation: str
+    version: int
+    vector_store: Any
+    chunks: ChunkStore
+    bm25: BM25Index
+    nbytes: int
+
+    @property
+    def revision(self) -> str:
+        ''' generation + version: doi khi index thay doi hoac bi xoa roi tao lai'''
+        return f"{self.generation}.{self.version}"
+
+
+class IndexCache:
+    '''
+    LRU cache (toan process) cac index da load, key = vector_dir.
+
+    - Entry gan voi generation + version trong index_manifest.json: index thay doi
+      (hoac bi xoa roi tao lai cung duong dan) -> load lai.
+    - Gioi han so entry va tong dung luong (uoc tinh theo kich thuoc file index,
+      chunk store, BM25); vuot gioi han -> bo entry it dung nhat.
+    '''
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(IndexCache, cls).__new__(cls)
+                cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.max_entries = config.INDEX_CACHE_MAX_ENTRIES
+        self.max_bytes = config.INDEX_CACHE_MAX_MB * 1024 * 1024
+        self.vector_store = VectorStore()
+        self._entries: OrderedDict[str, LoadedIndex] = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, vector_dir: str, embedding_model) -> LoadedIndex:
+        key = os.path.abspath(vector_dir)
+        manifest = IndexManager(vector_dir).load_manifest()
+        generation, version = manifest.get("generation", ""), manifest.get("version", 0)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.generation == generation and entry.version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                logger.info(f"Warm index hit for {vector_dir} (hits={self.hits}, misses={self.misses})")
+                return entry
+            self.misses += 1
+
+        entry = self._load(vector_dir, generation, version, embedding_model)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old.nbytes
+            self._entries[key] = entry
+            self.total_bytes += entry.nbytes
+            self._evict()
+        return entry
+
+    def invalidate(self, vector_dir: str):
+        ''' Bo index da load, ket qua retrieval va cau tra loi da cache cua vector_dir'''
+        key = os.path.abspath(vector_dir)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry.nbytes
+                logger.info(f"Invalidated warm index {vector_dir}")
+        RetrievalCache().invalidate(key)
+        AnswerCache().invalidate(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_mb": round(self.total_bytes / (1024 * 1024), 2),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _load(self, vector_dir: str, generation: str, version: int, embedding_model) -> LoadedIndex:
+        chunks = ChunkStore.load(vector_dir)
+        bm25 = BM25Index.load(vector_dir)
+        vt_store = self.vector_store.load_vectore_store(vector_dir, embedding_model=embedding_model, chunk_store=chunks)
+        return LoadedIndex(vector_dir, generation, version, vt_store, chunks, bm25, self._dir_size(vector_dir))
+
+    def _evict(self):
+        # Luon giu entry vua them (cuoi OrderedDict)
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes
+        ):
+            key, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry.nbytes
+            logger.info(f"Evicted warm index {key} ({entry.nbytes / (1024 * 1024):.1f} MB)")
+
+    @staticmethod
+    def _dir_size(vector_dir: str) -> int:
+        total = 0
+        for root, _, files in os.walk(vector_dir):
+            total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        return total
@@ -0,0 +1,338 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import numpy as np
+from collections import defaultdict, deque
+from langchain.docstore.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from app.core.vector_store import VectorStore
+from app.core.chunk_store import ChunkStore, IndexIdMap
+from app.core.bm25_index import BM25Index
+from app.services.embedding_service import EmbeddingService
+from app.helper.logger import get_logger
+
+logger = get_logger("IndexManager")
+
+
+class IndexManager:
+    '''
+    Quan ly index cua 1 vector_dir (faiss_index + ChunkStore + BM25 + manifest).
+
+    index_manifest.json:
+        generation  id ngau nhien, doi moi lan index duoc tao lai (build / copy)
+        version     tang moi lan index thay doi (dung de invalidate cache)
+        documents   doc_hash -> {file_name, chunk_ids, chunk_keys}
+    chunk_id la vi tri trong ChunkStore = doc id trong BM25 = docstore id trong FAISS.
+    chunk_keys: hash noi dung (text + metadata) tung chunk, cung thu tu chunk_ids
+    -> upload ban sua cua tai lieu chi thay cac chunk thay doi (update_document).
+    Chunk bi xoa chi bi go khoi FAISS/BM25, ChunkStore chi ghi them (id khong doi).
+    '''
+    MANIFEST_FILE = "index_manifest.json"
+    # Metadata khac nhau giua 2 ban cua cung tai lieu du chunk khong doi
+    VOLATILE_METADATA = ("chunk_id", "source", "total_pages")
+
+    def __init__(self, vector_dir: str):
+        self.vector_dir = vector_dir
+        self.vector_store = VectorStore()
+        self.embedding_service = EmbeddingService()
+
+    # -------------------------------------------------------
+    # Manifest
+    # -------------------------------------------------------
+    def load_manifest(self) -> dict:
+        path = os.path.join(self.vector_dir, self.MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {"version": 0, "documents": {}}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_manifest(self, manifest: dict):
+        path = os.path.join(self.vector_dir, self.MANIFEST_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def init_manifest(self, doc_hash: str, file_name: str, n_chunks: int):
+        ''' Manifest cho index 1 tai lieu vua build boi DataPipeLine'''
+        chunk_ids = list(range(n_chunks))
+        self.save_manifest({
+            "generation": uuid.uuid4().hex,
+            "version": 1,
+            "documents": {doc_hash: {
+                "file_name": file_name,
+                "chunk_ids": chunk_ids,
+                "chunk_keys": self._stored_keys(chunk_ids),
+            }},
+        })
+
+    @classmethod
+    def chunk_key(cls, doc: Document) -> str:
+        ''' Hash text + metadata (tru cac truong VOLATILE_METADATA) cua chunk'''
+        metadata = {k: v for k, v in (doc.metadata or {}).items() if k not in cls.VOLATILE_METADATA}
+        payload = doc.page_content + "\x00" + json.dumps(metadata, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def text_key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _stored_keys(self, chunk_ids: list[int]) -> list[str]:
+        chunks = ChunkStore.load(self.vector_dir)
+        return [self.chunk_key(chunks.get(i)) for i in chunk_ids]
+
+    def document_chunks(self, doc_hash: str) -> list[Document]:
+        ''' Chunk cua 1 tai lieu theo thu tu trong tai lieu'''
+        chunks = ChunkStore.load(self.vector_dir)
+        return [chunks.get(i) for i in self.load_manifest()["documents"][doc_hash]["chunk_ids"]]
+
+    def version(self) -> int:
+        return self.load_manifest().get("version", 0)
+
+    def generation(self) -> str:
+        return self.load_manifest().get("generation", "")
+
+    # -------------------------------------------------------
+    # Legacy index (FAISS.from_documents, docstore id = uuid)
+    # -------------------------------------------------------
+    @staticmethod
+    def is_legacy(vector_dir: str) -> bool:
+        ''' Index chua co map vi tri FAISS -> chunk_id (docstore id khong phai so)'''
+        return not os.path.exists(os.path.join(vector_dir, "faiss_index", VectorStore.IDS_FILE))
+
+    def migrate_legacy(self) -> int:
+        '''
+        Doi index cu sang chunk_id: chunk lay tu docstore da pickle (index.pkl) theo thu tu
+        vi tri FAISS -> chunk_id = vi tri, vector giu nguyen (khong parse / embed lai).
+        Ghi lai faiss_index (docstore id = chunk_id) + ChunkStore + BM25.
+
+        Returns:
+            int: so chunk
+        '''
+        vt_store = self.vector_store.load_vectore_store(self.vector_dir, embedding_model=self.embedding_service.cached_model)
+        docs = []
+        for pos in range(vt_store.index.ntotal):
+            doc = vt_store.docstore.search(vt_store.index_to_docstore_id[pos])
+            docs.append(Document(page_content=doc.page_content, metadata={**(doc.metadata or {}), "chunk_id": pos}))
+        vt_store.docstore = InMemoryDocstore({str(pos): doc for pos, doc in enumerate(docs)})
+        vt_store.index_to_docstore_id = {pos: str(pos) for pos in range(len(docs))}
+        ChunkStore.save(docs, self.vector_dir)
+        BM25Index.from_texts([d.page_content for d in docs]).save(self.vector_dir)
+        self.vector_store.save_vector_store(vt_store, self.vector_dir)
+        logger.info(f"Migrated legacy index {self.vector_dir} to chunk ids ({len(docs)} chunks)")
+        return len(docs)
+
+    # -------------------------------------------------------
+    # Copy / append / delete
+    # -------------------------------------------------------
+    @staticmethod
+    def copy_index(src_dir: str, dst_dir: str) -> "IndexManager":
+        ''' Tao index rieng cho session tu index dung chung (copy file, khong embed lai)'''
+        shutil.rmtree(dst_dir, ignore_errors=True)
+        shutil.copytree(src_dir, dst_dir)
+        manager = IndexManager(dst_dir)
+        # dst_dir co the vua bi xoa roi tao lai: generation moi de cache key khong trung ban cu
+        manifest = manager.load_manifest()
+        manifest["generation"] = uuid.uuid4().hex
+        manager.save_manifest(manifest)
+        logger.info(f"Copied index {src_dir} -> {dst_dir}")
+        return manager
+
+    def append_index(self, src_dir: str) -> list[int]:
+        '''
+        Them toan bo tai lieu cua index src_dir vao index nay.
+        Vector duoc lay lai tu FAISS cua src (khong embed lai), chi BM25 tokenize phan moi.
+
+        Returns:
+            list[int]: chunk_id moi cua cac chunk vua them
+        '''
+        src = IndexManager(src_dir)
+        src_manifest = src.load_manifest()
+        src_ids = sorted(i for info in src_manifest["documents"].values() for i in info["chunk_ids"])
+        src_chunks = ChunkStore.load(src_dir)
+        embedding_model = self.embedding_service.cached_model
+
+        manifest = self.load_manifest()
+        start = len(ChunkStore.load(self.vector_dir))
+        id_map = {old: start + pos for pos, old in enumerate(src_ids)}
+
+        docs = []
+        for old in src_ids:
+            doc = src_chunks.get(old)
+            doc.metadata["chunk_id"] = id_map[old]
+            docs.append(doc)
+        vectors = self._reconstruct(src_dir, src_ids, [d.page_content for d in docs])
+
+        with ChunkStore.writer(self.vector_dir, append=True) as writer:
+            writer.add(docs)
+        vt_store = self.vector_store.load_vectore_store(self.vector_dir, embedding_model=embedding_model)
+        vt_store = self.vector_store.add_embeddings(vt_store, docs, vectors, embedding_model)
+        vt_store = self.vector_store.optimize_index(vt_store)
+        self.vector_store.save_vector_store(vt_store, self.vector_dir)
+        BM25Index.load(self.vector_dir).add_texts([d.page_content for d in docs]).save(self.vector_dir)
+
+        for doc_hash, info in src_manifest["documents"].items():
+            manifest["documents"][doc_hash] = {
+                "file_name": info["file_name"],
+                "chunk_ids": [id_map[i] for i in info["chunk_ids"]],
+                "chunk_keys": info.get("chunk_keys") or src._stored_keys(info["chunk_ids"]),
+            }
+        manifest["version"] = manifest.get("version", 0) + 1
+        self.save_manifest(manifest)
+        logger.info(f"Appended {len(docs)} chunks from {src_dir} into {self.vector_dir}")
+        return [id_map[i] for i in src_ids]
+
+    def delete_document(self, doc_hash: str) -> bool:
+        ''' Go tai lieu khoi FAISS + BM25 theo chunk_ids trong manifest'''
+        manifest = self.load_manifest()
+        info = manifest["documents"].pop(doc_hash, None)
+        if info is None:
+            logger.warning(f"Document {doc_hash[:12]} not in index {self.vector_dir}")
+            return False
+        ids = info["chunk_ids"]
+        embedding_model = self.embedding_service.cached_model
+        vt_store = self.vector_store.load_vectore_store(self.vector_dir, embedding_model=embedding_model)
+        vt_store = self.vector_store.delete(vt_store, [str(i) for i in ids])
+        self.vector_store.save_vector_store(vt_store, self.vector_dir)
+        BM25Index.load(self.vector_dir).remove_docs(ids).save(self.vector_dir)
+        manifest["version"] = manifest.get("version", 0) + 1
+        self.save_manifest(manifest)
+        logger.info(f"Deleted document {doc_hash[:12]} ({len(ids)} chunks) from {self.vector_dir}")
+        return True
+
+    def update_document(self, old_hash: str, new_hash: str, file_name: str, chunks: list[Document]) -> dict:
+        '''
+        Thay tai lieu old_hash bang ban sua new_hash (chunk da split boi ChunkHandler).
+
+        - Chunk co chunk_key trung chunk cu: giu nguyen chunk_id + vector (khong dung toi).
+        - Chunk moi / doi: ghi them vao ChunkStore voi chunk_id moi. Vector lay lai tu FAISS
+          neu text trung 1 chunk cu (chi metadata doi, vd trang bi day), con lai moi embed
+          (qua embedding cache).
+        - Chunk cu khong con: go khoi FAISS + BM25.
+
+        Returns:
+            dict: so chunk kept / added / removed / embedded
+        '''
+        manifest = self.load_manifest()
+        info = manifest["documents"].pop(old_hash)
+        old_ids = info["chunk_ids"]
+        old_keys = info.get("chunk_keys") or self._stored_keys(old_ids)
+
+        available = defaultdict(deque)
+        for chunk_id, key in zip(old_ids, old_keys):
+            available[key].append(chunk_id)
+        new_keys = [self.chunk_key(doc) for doc in chunks]
+        chunk_ids, added, kept_docs = [], [], {}
+        for doc, key in zip(chunks, new_keys):
+            if available[key]:
+                chunk_ids.append(available[key].popleft())
+                kept_docs[chunk_ids[-1]] = doc
+            else:
+                chunk_ids.append(None)
+                added.append(doc)
+        kept = {i for i in chunk_ids if i is not None}
+        removed = [i for i in old_ids if i not in kept]
+
+        start = len(ChunkStore.load(self.vector_dir))
+        for pos, doc in enumerate(added):
+            doc.metadata["chunk_id"] = start + pos
+        new_ids = iter(range(start, start + len(added)))
+        chunk_ids = [i if i is not None else next(new_ids) for i in chunk_ids]
+
+        vectors, n_embedded = self._vectors_for(added, removed)
+        embedding_model = self.embedding_service.cached_model
+        vt_store = self.vector_store.load_vectore_store(self.vector_dir, embedding_model=embedding_model)
+        self._refresh_metadata(vt_store, kept_docs)
+        if removed:
+            vt_store = self.vector_store.delete(vt_store, [str(i) for i in removed])
+        if added:
+            with ChunkStore.writer(self.vector_dir, append=True) as writer:
+                writer.add(added)
+            vt_store = self.vector_store.add_embeddings(vt_store, added, vectors, embedding_model)
+        vt_store = self.vector_store.optimize_index(vt_store)
+        self.vector_store.save_vector_store(vt_store, self.vector_dir)
+        bm25 = BM25Index.load(self.vector_dir)
+        if removed:
+            bm25 = bm25.remove_docs(removed)
+        if added:
+            bm25 = bm25.add_texts([d.page_content for d in added])
+        bm25.save(self.vector_dir)
+
+        manifest["documents"][new_hash] = {"file_name": file_name, "chunk_ids": chunk_ids, "chunk_keys": new_keys}
+        manifest["version"] = manifest.get("version", 0) + 1
+        self.save_manifest(manifest)
+        stats = {"kept": len(kept), "added": len(added), "removed": len(removed), "embedded": n_embedded}
+        logger.info(f"Updated document {old_hash[:12]} -> {new_hash[:12]} in {self.vector_dir}: {stats}")
+        return stats
+
+    def _refresh_metadata(self, vt_store, kept_docs: dict[int, Document]) -> int:
+        ''' Chunk giu lai: metadata VOLATILE_METADATA (source, total_pages) lay theo ban moi'''
+        chunks = ChunkStore.load(self.vector_dir)
+        updates = {}
+        for chunk_id, doc in kept_docs.items():
+            metadata = {**doc.metadata, "chunk_id": chunk_id}
+            if metadata != chunks.get_metadata(chunk_id):
+                updates[chunk_id] = metadata
+        if not updates:
+            return 0
+        ChunkStore.rewrite_metadata(self.vector_dir, updates)
+        # Docstore pickle (index.pkl) cung giu metadata -> cap nhat theo
+        doc_ids = [str(chunk_id) for chunk_id in updates]
+        vt_store.docstore.delete(doc_ids)
+        vt_store.docstore.add({
+            str(chunk_id): Document(page_content=chunks.get_text(chunk_id), metadata=metadata)
+            for chunk_id, metadata in updates.items()
+        })
+        return len(updates)
+
+    def _vectors_for(self, added: list[Document], removed: list[int]) -> tuple[np.ndarray, int]:
+        ''' Vector cho chunk moi: lay lai tu FAISS neu text trung chunk bi go, con lai embed'''
+        if not added:
+            return np.zeros((0, 0), dtype=np.float32), 0
+        chunks = ChunkStore.load(self.vector_dir)
+        removed_by_text = {self.text_key(chunks.get_text(i)): i for i in removed}
+        reuse = [(pos, removed_by_text[self.text_key(d.page_content)]) for pos, d in enumerate(added)
+                 if self.text_key(d.page_content) in removed_by_text]
+        to_embed = sorted(set(range(len(added))) - {pos for pos, _ in reuse})
+        parts = {}
+        if reuse:
+            ids = [chunk_id for _, chunk_id in reuse]
+            reused = self._reconstruct(self.vector_dir, ids, [chunks.get_text(i) for i in ids])
+            parts.update(zip((pos for pos, _ in reuse), reused))
+        if to_embed:
+            embedded = self.embedding_service.cached_model.embed_documents([added[pos].page_content for pos in to_embed])
+            parts.update(zip(to_embed, np.asarray(embedded, dtype=np.float32)))
+        return np.stack([parts[pos] for pos in range(len(added))]), len(to_embed)
+
+    def _reconstruct(self, src_dir: str, chunk_ids: list[int], texts: list[str]) -> np.ndarray:
+        '''
+        Lay vector cua chunk_ids tu FAISS cua src: index mmap + chi reconstruct cac vi tri can
+        (khong dung ca ma tran N x d). Index khong ho tro reconstruct thi embed (qua cache).
+        '''
+        embedding_model = self.embedding_service.cached_model
+        try:
+            src_store = self.vector_store.load_vectore_store(
+                src_dir, embedding_model=embedding_model, chunk_store=ChunkStore.load(src_dir)
+            )
+            positions = self._positions(src_store.index_to_docstore_id, chunk_ids)
+            return self.vector_store.ensure_direct_map(src_store.index).reconstruct_batch(positions)
+        except (RuntimeError, KeyError, ValueError) as e:
+            logger.warning(f"Cannot reconstruct vectors from {src_dir} ({e}), embedding through cache")
+            return np.asarray(embedding_model.embed_documents(texts), dtype=np.float32)
+
+    @staticmethod
+    def _positions(index_to_docstore_id, chunk_ids: list[int]) -> np.ndarray:
+        ''' Vi tri FAISS cua tung chunk_id (KeyError neu chunk khong co trong index)'''
+        if isinstance(index_to_docstore_id, IndexIdMap):
+            ids = np.asarray(index_to_docstore_id.ids, dtype=np.int64)
+        else:
+            ids = np.asarray([int(index_to_docstore_id[pos]) for pos in range(len(index_to_docstore_id))], dtype=np.int64)
+        wanted = np.asarray(chunk_ids, dtype=np.int64)
+        if not len(ids):
+            raise KeyError("empty index")
+        sorter = np.argsort(ids, kind="stable")
+        found = sorter[np.minimum(np.searchsorted(ids, wanted, sorter=sorter), len(ids) - 1)]
+        if not np.array_equal(ids[found], wanted):
+            raise KeyError(f"chunk ids not in index: {sorted(set(wanted.tolist()) - set(ids.tolist()))[:5]}")
+        return found
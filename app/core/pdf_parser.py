@@ -0,0 +1,133 @@
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Iterator
+from langchain.docstore.document import Document
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("PDFParser")
+
+try:
+    import fitz  # PyMuPDF (C, nhanh hon pypdf nhieu lan), co trong requirements; thieu thi dung pypdf
+    HAS_PYMUPDF = True
+except ImportError:
+    HAS_PYMUPDF = False
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    '''
+    Process pool dung chung toan process de parse PDF theo khoang trang.
+    spawn thay vi fork: fork tu process da co thread (Streamlit, ingestion queue, event loop LLM)
+    co the copy lock dang bi giu -> worker treo.
+    '''
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=config.PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _page_count(backend: str, path: str) -> int:
+    if backend == "pymupdf":
+        with fitz.open(path) as pdf:
+            return pdf.page_count
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def _extract_pages(backend: str, path: str, start: int, end: int) -> list[tuple[int, str, str]]:
+    ''' (so trang, text, nhan trang) cua cac trang [start, end) - chay trong process worker'''
+    if backend == "pymupdf":
+        with fitz.open(path) as pdf:
+            return [(i, pdf[i].get_text(), pdf[i].get_label() or str(i + 1)) for i in range(start, end)]
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    labels = reader.page_labels
+    return [(i, reader.pages[i].extract_text() or "", labels[i]) for i in range(start, end)]
+
+
+class PDFParser:
+    '''
+    Parse PDF thanh Document theo trang (metadata source / page / page_label / total_pages
+    giong PyPDFLoader -> trich dan trang va ContextBuilder khong doi).
+
+    - Backend: PyMuPDF neu da cai (pdf.backend = auto), khong thi pypdf.
+    - File lon (>= parallel_min_pages trang): chia khoang pages_per_task trang, parse
+      tren process pool; toi da 2 * workers khoang dang chay, trang van duoc yield
+      lan luot dung thu tu -> chunk/embed bat dau ngay khi khoang dau xong.
+    - Pool hong (worker chet) -> parse tiep trong process hien tai.
+    '''
+
+    def __init__(self, backend: str = None, workers: int = None, pages_per_task: int = None):
+        self.backend = self._resolve_backend(backend or config.PDF_BACKEND)
+        self.workers = workers if workers is not None else config.PDF_WORKERS
+        self.pages_per_task = pages_per_task or config.PDF_PAGES_PER_TASK
+        self.parallel_min_pages = config.PDF_PARALLEL_MIN_PAGES
+
+    @staticmethod
+    def _resolve_backend(backend: str) -> str:
+        if backend == "pymupdf" and not HAS_PYMUPDF:
+            logger.warning("PyMuPDF is not installed, falling back to pypdf")
+            return "pypdf"
+        if backend == "auto":
+            return "pymupdf" if HAS_PYMUPDF else "pypdf"
+        return backend
+
+    def iter_pages(self, file_path: str) -> Iterator[Document]:
+        total_pages = _page_count(self.backend, file_path)
+        logger.info(f"Parsing {total_pages} pages from {os.path.basename(file_path)} with {self.backend}")
+        ranges = [(start, min(start + self.pages_per_task, total_pages))
+                  for start in range(0, total_pages, self.pages_per_task)]
+        if self.workers > 1 and total_pages >= self.parallel_min_pages:
+            pages = self._parse_parallel(file_path, ranges)
+        else:
+            pages = (page for start, end in ranges for page in _extract_pages(self.backend, file_path, start, end))
+        for page, text, label in pages:
+            yield Document(
+                page_content=text,
+                metadata={"source": file_path, "page": page, "page_label": label, "total_pages": total_pages},
+            )
+
+    def _parse_parallel(self, file_path: str, ranges: list) -> Iterator[tuple[int, str, str]]:
+        pool = get_pool()
+        todo = iter(ranges)
+        pending = deque()
+        try:
+            for start, end in islice(todo, 2 * self.workers):
+                pending.append((start, end, pool.submit(_extract_pages, self.backend, file_path, start, end)))
+            while pending:
+                start, end, future = pending.popleft()
+                try:
+                    pages = future.result()
+                except BrokenProcessPool:
+                    logger.error("PDF process pool is broken, parsing remaining pages in-process")
+                    _reset_pool()
+                    remaining = [(start, end), *((s, e) for s, e, _ in pending), *todo]
+                    pending.clear()
+                    for rest_start, rest_end in remaining:
+                        yield from _extract_pages(self.backend, file_path, rest_start, rest_end)
+                    return
+                next_range = next(todo, None)
+                if next_range is not None:
+                    pending.append((*next_range, pool.submit(_extract_pages, self.backend, file_path, *next_range)))
+                yield from pages
+        finally:
+            # Generator bi bo giua chung -> huy cac khoang chua chay
+            for _, _, future in pending:
+                future.cancel()
@@ -1,67 +1,177 @@
 from app.services.llama_service import GroqLlamaService
 from app.services.embedding_service import EmbeddingService
+from app.services.answer_cache import AnswerCache
+from app.core.retrieval_cache import RetrievalCache
+from app.core.context_builder import ContextBuilder
 from app.helper.logger import get_logger
 from langchain.prompts import PromptTemplate
-from langchain.chains.retrieval_qa.base import RetrievalQA
+from langchain.docstore.document import Document
+from typing import Generator, List
+import os
+import time
 from app.core.retriaval_handler import RetrivalHandler
 from app.core.vector_store import VectorStore
 from app.core.data_loader import DataLoader
 from app.core.chunk_handler import ChunkHandler
+from app.helper.config import config
 
 logger = get_logger('Core_Engine')
 
 class RagEngine:
-    def __init__(self,retriever = None):
-        ''' RAG Engine core logic cho truy van retriever  va LLm'''
-        self.llm_service = GroqLlamaService()
-        self.llm = self.llm_service.llm
+    def __init__(self,retriever = None, llm_service: GroqLlamaService = None,
+                 index_dir: str = None, index_revision: str = ""):
+        '''
+        RAG Engine core logic cho truy van retriever  va LLm.
+        Engine duoc tao 1 lan cho moi session; moi cau hoi chi retrieve (BM25 + dense + rerank) 1 lan,
+        generate() va stream() dung chung buoc retrieve do.
+        index_dir / index_revision: index cua retriever (generation.version), dung lam key cho semantic answer cache.
+        '''
+        self.llm_service = llm_service or GroqLlamaService()
         self.embedding = EmbeddingService()
         self.retriever = retriever
+        self.k_final = config.K_FINAL
+        self.answer_cache = AnswerCache()
+        self.context_builder = ContextBuilder()
+        self.index_key = os.path.abspath(index_dir) if index_dir else None
+        self.index_revision = index_revision
+        self.table_engine = None
         
         self.prompt = PromptTemplate(
             template = (
             "You are an intelligent assistant. "
             "Answer the question clearly and accurately based only on the context below.\n\n"
+            "{history}"
             "=== Context ===\n{context}\n\n"
             "=== Question ===\n{question}\n\n"
             "Respond in the same language as the question, using a natural and concise tone."),
-            input_variables=['context','question'],
+            input_variables=['context','question','history'],
         )
-    def format_prompt(self, context: str, question: str) -> str:
-        """Ghép context + question thành prompt hoàn chỉnh."""
-        return self.prompt.format(context=context, question=question)
-    
-    
-        
+        # Cau hoi tong hop / loc tren CSV: ket qua SQL thay cho context retrieve
+        self.table_prompt = PromptTemplate(
+            template = (
+            "You are an intelligent assistant. "
+            "Answer the question using only the SQL query result below, computed over the whole uploaded table.\n\n"
+            "{history}"
+            "=== Query result ===\n{result}\n\n"
+            "=== Question ===\n{question}\n\n"
+            "Respond in the same language as the question, using a natural and concise tone."),
+            input_variables=['result','question','history'],
+        )
+    def format_prompt(self, context: str, question: str, history: str = "") -> str:
+        """Ghép context + question (+ lich su hoi thoai neu co) thành prompt hoàn chỉnh."""
+        return self.prompt.format(context=context, question=question, history=f"{history}\n\n" if history else "")
+
+    def set_retriever(self, retriever, index_dir: str = None, index_revision: str = ""):
+        ''' Doi retriever (index cua session thay doi) ma khong tao lai engine'''
+        self.retriever = retriever
+        self.index_key = os.path.abspath(index_dir) if index_dir else None
+        self.index_revision = index_revision
+
+    def set_tables(self, table_engine):
+        '''
+        Bang SQL cua cac file CSV trong session (TableQueryEngine), None -> chi dung RAG.
+        Engine cu khong close o day: cau hoi dang chay (thread UI) co the van dung connection cua no,
+        connection dong khi engine cu khong con ai giu (GC).
+        '''
+        self.table_engine = table_engine
+
+    def _lookup_answer(self, question: str):
+        ''' (cau tra loi da cache hoac None, vector cau hoi de put sau khi generate)'''
+        if not self.index_key or not self.answer_cache.enabled:
+            return None, None
+        try:
+            # Dung chung vector query voi nhanh dense cua retriever (RetrievalCache)
+            vector = RetrievalCache().query_vector(
+                self.embedding.cached_model.model_name, question, self.embedding.cached_model.embed_query
+            )
+        except Exception as e:
+            logger.error(f"Cannot embed question for answer cache: {e}")
+            return None, None
+        return self.answer_cache.get(self.index_key, self.index_revision, question, vector), vector
+
+    def _store_answer(self, question: str, vector, answer: str):
+        if vector is not None:
+            self.answer_cache.put(self.index_key, self.index_revision, question, vector, answer)
+
+    def retrieve(self, question: str) -> List[Document]:
+        ''' Chay retriever dung 1 lan cho cau hoi, tra ve top k_final docs'''
+        retriever = self.retriever
+        if not retriever:
+            return []
+        try:
+            start_time = time.time()
+            docs = retriever.invoke(question)[: self.k_final]
+            logger.info(f" Retrieved {len(docs)} documents in {time.time() - start_time:.2f}s")
+            for i, doc in enumerate(docs[:2]):
+                snippet = doc.page_content[:80].replace("\n", " ")
+                logger.info(f"Source {i+1}: {snippet}...")
+            return docs
+        except Exception as e:
+            logger.error(f"Error during document retrieval: {e}")
+            return []
+
+    def build_prompt(self, question: str, history: str = "", search_query: str = None) -> tuple[str, bool]:
+        '''
+        search_query: cau hoi doc lap (da condense) dung cho retrieval, mac dinh = question.
+        Cau hoi tong hop / loc va session co bang CSV -> 1 cau SQL tren ca bang thay cho retrieval.
+
+        Returns:
+            tuple[str, bool]: (prompt, grounded) - grounded = co ket qua SQL hoac context khong rong;
+            khong grounded (retrieve loi / rong) thi cau tra loi khong duoc cache
+        '''
+        search_query = search_query or question
+        # Giu tham chieu: job ingest nen co the thay table_engine giua chung
+        table_engine = self.table_engine
+        if table_engine is not None and table_engine.is_structured(search_query):
+            result = table_engine.answer_context(search_query)
+            if result is not None:
+                history = f"{history}\n\n" if history else ""
+                return self.table_prompt.format(result=result, question=question, history=history), True
+        docs = self.retrieve(search_query)
+        context = self.context_builder.build(docs)
+        return self.format_prompt(context=context, question=question, history=history), bool(docs)
     
-    def generate(self, question: str)-> str:
+    def generate(self, question: str, history: str = "", standalone: str = None)-> str:
+        '''
+        history: lich su hoi thoai (ChatMemory.render) dua vao prompt
+        standalone: cau hoi doc lap cho retrieval + answer cache
+        '''
         if not self.retriever:
             logger.warning("Haven't retriever, use only LLM ")
             return self.llm_service.generate(question)
         try:
             logger.info(f" Generatin answer for quere {question[:100]}")
-            qa_chain = RetrievalQA.from_chain_type(
-                llm= self.llm,
-                retriever = self.retriever,
-                chain_type= 'stuff',
-                chain_type_kwargs={"prompt":self.prompt},
-                return_source_documents=True 
-                  
-            )
-            result = qa_chain.invoke({"query": question})
-            answer = result.get("result","")
-            sources= result.get('source_document', [])
-            logger.info(f" Answer generated ({len(answer)} chars, len{len(sources)})")
-            if sources:
-                for i, doc in enumerate(sources[:2]):
-                    snippet = doc.page_content[:80].replace("\n", " ")
-                    logger.info(f"Source {i+1}: {snippet}...")
-            
-                   
+            search_query = standalone or question
+            cached, vector = self._lookup_answer(search_query)
+            if cached is not None:
+                return cached
+            prompt, grounded = self.build_prompt(question, history, search_query)
+            answer = self.llm_service.generate(prompt)
+            logger.info(f" Answer generated ({len(answer)} chars)")
+            if grounded:
+                self._store_answer(search_query, vector, answer)
             return answer
         except Exception as e:
             logger.info(f"Error during RAG generation {e}")
             return "Sorry, an error occurred while generating the answer."
+
+    def stream(self, question: str, history: str = "", standalone: str = None) -> Generator[str, None, None]:
+        ''' Nhu generate() nhung tra ve tung doan text tu LLM'''
+        search_query = standalone or question
+        if not self.retriever:
+            prompt, vector, grounded = question, None, False
+        else:
+            cached, vector = self._lookup_answer(search_query)
+            if cached is not None:
+                yield cached
+                return
+            prompt, grounded = self.build_prompt(question, history, search_query)
+        answer = ""
+        for text in self.llm_service.stream(prompt):
+            answer += text
+            yield text
+        if grounded:
+            self._store_answer(search_query, vector, answer)
         
 if __name__ == '__main__':
     vt_store = VectorStore().load_vectore_store(
@@ -85,7 +195,7 @@ if __name__ == '__main__':
     question = "Discuss all information of all laptop in this resource?"
     top_relavent = retriver_handler.get_relevant_documents(question)
     logger.info(f'Vector sent  {[top_relavent]}')
-    answer = rag.gernerate(question)
+    answer = rag.generate(question)
 
     print(question)
     print(answer)
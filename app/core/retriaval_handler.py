@@ -1,9 +1,8 @@
-from langchain.retrievers import EnsembleRetriever, ContextualCompressionRetriever
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers.document_compressors import CrossEncoderReranker
-from sentence_transformers import CrossEncoder
+from app.core.bm25_index import BM25Index
+from app.core.hybrid_retriever import HybridRetriever
+from app.core.adaptive_reranker import AdaptiveRerankRetriever
 from langchain.vectorstores.base import VectorStoreRetriever
-from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+from app.services.reranker_service import RerankerService
 from app.helper.config import config
 from app.helper.logger import get_logger
 logger = get_logger("RetrivalHandler")
@@ -15,44 +14,61 @@ class RetrivalHandler:
         self.type_use = config.TYPE_RETRIEVAL
         self.k_bm25 = config.K_BM25
         self.k_vector  = config.K_VECTOR
-        #self.weight = config.WEIGHT_RERANK
-        self.weight = [0.5, 0.5]
+        self.weight = config.WEIGHTS
+        self.fusion = config.FUSION
+        self.rrf_k = config.RRF_K
         self.rerank_enable = config.ENABLE
         self.k_final = config.K_FINAL
         self.rerank_model = config.RERANKER_MODEL
+        self.max_candidates = config.RERANKER_MAX_CANDIDATES
         self.retriever = None
     
 
         
-    def build(self, vector_store, all_docs = None):
+    def build(self, vector_store, all_docs = None, bm25_index: BM25Index = None, cache_key: str = None):
         
         """
         vectorstore: FAISS đã build (LangChain VectorStore)
-        all_docs: list[Document] toàn bộ docs đã index (cần cho BM25)
+        all_docs: ChunkStore hoặc list[Document] toàn bộ docs đã index (cần cho BM25)
+        bm25_index: BM25Index đã build sẵn (DataPipeLine), None thì build từ all_docs
+        cache_key: key cua index (vector_dir@generation.version) cho RetrievalCache, None = khong cache ket qua
         """
         try:
             if self.type_use =='hybrid':
                 if all_docs  is None:
                     logger.warning("Hybrid mode: all docs is None  -> BM25 not action. Fall back dense only  ")
                     return self._dense_only(vector_store)
-                bm25 = BM25Retriever.from_documents(all_docs)
-                dense  = vector_store.as_retriever(search_kwargs={"k": self.k_vector})
-                
-                base = EnsembleRetriever(retrievers=[bm25,dense],weights=self.weight)
-                
-                
+                if bm25_index is None:
+                    bm25_index = BM25Index.from_documents(all_docs)
+                # BM25 + dense chay song song, fusion tren chunk_id; rerank bat thi giu ca hop ung vien
+                base = HybridRetriever(
+                    vector_store=vector_store,
+                    bm25=bm25_index,
+                    docs=all_docs,
+                    k_bm25=self.k_bm25,
+                    k_vector=self.k_vector,
+                    k=self.max_candidates if self.rerank_enable else self.k_final,
+                    weights=self.weight,
+                    fusion=self.fusion,
+                    rrf_k=self.rrf_k,
+                    cache_key=cache_key,
+                )
             else:
                 base = self._dense_only(vector_store)
             
             self.retriever = base
             
             if self.rerank_enable:
-                cross_model = HuggingFaceCrossEncoder(model_name=self.rerank_model)
-                reranker = CrossEncoderReranker(model=cross_model, top_n=self.k_final)
-                retriever = ContextualCompressionRetriever(
-                    base_compressor= reranker,
-                    base_retriever= base
-                    
+                # Model cross-encoder dung chung toan process; bo qua / cat bot rerank khi retrieval da chac chan
+                retriever = AdaptiveRerankRetriever(
+                    base= base,
+                    reranker= RerankerService(),
+                    top_n= self.k_final,
+                    max_candidates= self.max_candidates,
+                    margin= config.RERANKER_MARGIN,
+                    time_budget_ms= config.RERANKER_TIME_BUDGET_MS,
+                    batch_size= config.RERANKER_BATCH_SIZE,
+                    cache_key= cache_key,
                 )
                 logger.info(f" Rerank enable ({self.rerank_model}) ,(k_final: {self.k_final})")
                 self.retriever = retriever
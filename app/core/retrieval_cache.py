@@ -0,0 +1,158 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+from app.core.bm25_index import tokenize
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("RetrievalCache")
+
+
+def normalize_query(query: str) -> str:
+    ''' Query chuan hoa (lowercase, bo dau cau, gop khoang trang) = tokenizer cua BM25'''
+    return " ".join(tokenize(query))
+
+
+class LRUCache:
+    ''' LRU don gian co dem hit/miss (thread-safe)'''
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def drop(self, predicate: Callable[[Any], bool]) -> int:
+        ''' Xoa cac entry co key thoa predicate, tra ve so entry bi xoa'''
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class RetrievalCache:
+    '''
+    Cache ket qua retrieval dung chung toan process.
+
+        results        (index key, stage, query chuan hoa) -> (chunk_ids, scores) da xep hang
+        query_vectors  (model, query) -> vector query (nhanh dense)
+        pair_scores    (model, query chuan hoa, hash text chunk) -> diem cross-encoder
+    Index key = "vector_dir@generation.version" cua manifest nen index thay doi thi
+    ket qua cu khong con duoc dung; IndexCache.invalidate xoa luon ket qua cua vector_dir.
+    stage tach ket qua cua tung buoc (hybrid / rerank) cung index va query.
+    '''
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(RetrievalCache, cls).__new__(cls)
+                cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.enabled = config.RETRIEVAL_CACHE_ENABLED
+        self.results = LRUCache(config.RETRIEVAL_CACHE_MAX_RESULTS)
+        self.query_vectors = LRUCache(config.RETRIEVAL_CACHE_MAX_QUERY_VECTORS)
+        self.pair_scores = LRUCache(config.RETRIEVAL_CACHE_MAX_PAIR_SCORES)
+
+    # -------------------------------------------------------
+    # Ranked results
+    # -------------------------------------------------------
+    def get_results(self, index_key: str, stage: str, query: str) -> Optional[tuple[np.ndarray, np.ndarray]]:
+        if not self.enabled or not index_key:
+            return None
+        return self.results.get((index_key, stage, normalize_query(query)))
+
+    def put_results(self, index_key: str, stage: str, query: str, ids, scores):
+        if not self.enabled or not index_key:
+            return
+        self.results.put(
+            (index_key, stage, normalize_query(query)),
+            (np.asarray(ids, dtype=np.int64), np.asarray(scores, dtype=np.float32)),
+        )
+
+    def invalidate(self, vector_dir: str):
+        ''' Xoa ket qua da cache cua moi version cua vector_dir (abspath)'''
+        prefix = f"{vector_dir}@"
+        dropped = self.results.drop(lambda key: key[0].startswith(prefix))
+        if dropped:
+            logger.info(f"Dropped {dropped} cached results of {vector_dir}")
+
+    # -------------------------------------------------------
+    # Query embedding
+    # -------------------------------------------------------
+    def query_vector(self, model_key: str, query: str, embed: Callable[[str], list[float]]) -> np.ndarray:
+        if not self.enabled:
+            return np.asarray(embed(query), dtype=np.float32)
+        key = (model_key, query.strip())
+        vector = self.query_vectors.get(key)
+        if vector is None:
+            vector = np.asarray(embed(query), dtype=np.float32)
+            self.query_vectors.put(key, vector)
+        return vector
+
+    # -------------------------------------------------------
+    # Reranker pair scores
+    # -------------------------------------------------------
+    def score_pairs(self, model_key: str, query: str, texts: list[str],
+                    score: Callable[[list[str]], np.ndarray]) -> np.ndarray:
+        ''' Diem cross-encoder cua (query, text); chi goi score() cho cac cap chua co trong cache'''
+        if not self.enabled:
+            return np.asarray(score(texts), dtype=np.float32)
+        normalized = normalize_query(query)
+        keys = [(model_key, normalized, hash(text)) for text in texts]
+        scores = np.empty(len(texts), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            value = self.pair_scores.get(key)
+            if value is None:
+                missing.append(i)
+            else:
+                scores[i] = value
+        if missing:
+            new_scores = np.asarray(score([texts[i] for i in missing]), dtype=np.float32)
+            for i, value in zip(missing, new_scores):
+                scores[i] = value
+                self.pair_scores.put(keys[i], float(value))
+        return scores
+
+    def clear(self):
+        for cache in (self.results, self.query_vectors, self.pair_scores):
+            cache.clear()
+
+    def stats(self) -> dict:
+        return {
+            "results": self.results.stats(),
+            "query_vectors": self.query_vectors.stats(),
+            "pair_scores": self.pair_scores.stats(),
+        }
@@ -0,0 +1,110 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List
+from app.helper.logger import get_logger
+
+logger = get_logger("SessionCatalog")
+
+
+class SessionCatalog:
+    '''
+    Danh muc session cua 1 user (SQLite, user_dir/catalog.sqlite).
+
+    Moi lan metadata.json cua session duoc ghi thi dong tuong ung trong catalog
+    duoc cap nhat (upsert), xoa session thi xoa dong -> sidebar chi can 1 query
+    co sap xep + phan trang thay vi doc lai tung metadata.json.
+    Catalog chua co (user cu) -> build 1 lan tu cac metadata.json.
+    '''
+    FILE = "catalog.sqlite"
+    SORT_COLUMNS = ("created_at", "updated_at", "title")
+    _locks: dict[str, threading.Lock] = {}
+    _locks_guard = threading.Lock()
+
+    def __init__(self, user_dir: str):
+        self.user_dir = user_dir
+        self.path = os.path.join(user_dir, self.FILE)
+        with self._locks_guard:
+            self._lock = self._locks.setdefault(os.path.abspath(self.path), threading.Lock())
+        with self._lock:
+            if not os.path.exists(self.path):
+                os.makedirs(user_dir, exist_ok=True)
+                self._create()
+
+    @contextmanager
+    def _connect(self):
+        ''' Connection ngan han (commit khi thanh cong, luon dong)'''
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _create(self):
+        tmp_path = self.path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute(
+                "CREATE TABLE sessions ("
+                "session_id TEXT PRIMARY KEY, title TEXT, created_at TEXT, updated_at TEXT, meta TEXT)"
+            )
+            conn.execute("CREATE INDEX idx_created_at ON sessions(created_at)")
+            conn.execute("CREATE INDEX idx_updated_at ON sessions(updated_at)")
+            rows = list(self._scan_metadata())
+            conn.executemany("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)", rows)
+            conn.commit()
+        finally:
+            conn.close()
+        # Build vao file tam roi rename: process khac khong thay catalog build do
+        os.replace(tmp_path, self.path)
+        logger.info(f"Built session catalog {self.path} ({len(rows)} sessions)")
+
+    def _scan_metadata(self):
+        for folder in os.listdir(self.user_dir):
+            meta_path = os.path.join(self.user_dir, folder, "metadata.json")
+            if not os.path.exists(meta_path):
+                continue
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    yield self._row(json.load(f))
+            except Exception as e:
+                logger.error(f" Erro reading metadat from {folder}:{e}")
+
+    @staticmethod
+    def _row(meta: Dict) -> tuple:
+        return (
+            str(meta.get("session_id")),
+            meta.get("title", "Untitled"),
+            meta.get("created_at", ""),
+            meta.get("updated_at", meta.get("created_at", "")),
+            json.dumps(meta, ensure_ascii=False),
+        )
+
+    def upsert(self, meta: Dict):
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)", self._row(meta))
+
+    def delete(self, session_id: str):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (str(session_id),))
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def list(self, limit: int = None, offset: int = 0, sort_by: str = "created_at", descending: bool = True) -> List[Dict]:
+        if sort_by not in self.SORT_COLUMNS:
+            raise ValueError(f"Cannot sort sessions by {sort_by}, use one of {self.SORT_COLUMNS}")
+        query = f"SELECT meta FROM sessions ORDER BY {sort_by} {'DESC' if descending else 'ASC'}, session_id"
+        params: tuple = ()
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params = (limit, offset)
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [json.loads(meta) for (meta,) in rows]
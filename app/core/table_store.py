@@ -0,0 +1,211 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, Optional
+from app.core.data_loader import DataLoader
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("TableStore")
+
+SQL_PROMPT = (
+    "You translate a question about tabular data into ONE SQLite SELECT query.\n"
+    "Use only the tables and columns below and quote column names with double quotes. "
+    "Aggregate in SQL (AVG, SUM, COUNT, MIN, MAX, GROUP BY) instead of returning raw rows. "
+    "Answer with the SQL query only.\n\n"
+    "=== Tables ===\n{schema}\n\n"
+    "{error}"
+    "=== Question ===\n{question}\n\n"
+    "=== SQL ==="
+)
+
+# Cau hoi tong hop / loc (tieng Anh + tieng Viet da bo dau) -> chay SQL thay vi retrieval.
+# Chi gom cum tu it gap trong cau hoi van ban thuong ("total", "max", "between", "tong", "dem" bi bo)
+_STRUCTURED_RE = re.compile(
+    r"\b(average|avg|median|sum|count|how many|number of|maximum|minimum|"
+    r"highest|lowest|largest|smallest|cheapest|most expensive|greater than|less than|more than|"
+    r"fewer than|top \d+|group by|percentage|"
+    r"trung binh|tong so|tong cong|bao nhieu|so luong|dem so|lon nhat|nho nhat|cao nhat|thap nhat|re nhat|dat nhat|"
+    r"nhieu nhat|it nhat|toi da|toi thieu|lon hon|nho hon|cao hon|thap hon|it hon|nhieu hon)\b"
+    r"|[<>]=?\s*\d"
+)
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_SQL_BLOCK_RE = re.compile(r"```(?:sql)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_SELECT_RE = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+# Authorizer: chi cho phep doc (SELECT, doc cot, goi ham); moi thao tac khac bi tu choi
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+
+def _strip_accents(text: str) -> str:
+    text = unicodedata.normalize("NFD", text.lower()).replace("đ", "d")
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
+class TableStore:
+    '''
+    Ban SQL cua 1 file CSV (doc_dir/table.sqlite, bang "data"), build 1 lan tu cac lo
+    DataFrame (cung DataLoader voi pipeline), sau do chi doc. O trong -> NULL.
+    '''
+    FILE = "table.sqlite"
+    TABLE = "data"
+
+    @classmethod
+    def build(cls, csv_path: str, save_dir: str) -> str:
+        path = os.path.join(save_dir, cls.FILE)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        n_rows = 0
+        conn = sqlite3.connect(tmp_path)
+        try:
+            for df in DataLoader._iter_csv_batches(csv_path, keep_default_na=True):
+                df.to_sql(cls.TABLE, conn, if_exists="append", index=False)
+                n_rows += len(df)
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+        logger.info(f"Built SQL table for {os.path.basename(csv_path)}: {n_rows} rows -> {path}")
+        return path
+
+    @classmethod
+    def exists(cls, save_dir: str) -> bool:
+        return os.path.exists(os.path.join(save_dir, cls.FILE))
+
+
+class TableQueryEngine:
+    '''
+    Truy van SQL tren cac bang CSV cua 1 session.
+
+    - Moi bang (TableStore) duoc ATTACH read-only vao 1 connection in-memory,
+      dat ten view theo ten file -> LLM viet SQL tren ten bang de doc.
+    - is_structured(): cau hoi tong hop / loc co nhac toi ten bang hoac ten cot (heuristic, khong goi LLM).
+    - answer_context(): LLM viet 1 cau SELECT (sua 1 lan neu loi) -> SQLite chay tren
+      ca bang -> ket qua nho (toi da max_rows dong) thay cho hang chuc chunk trong prompt.
+    - Chi doc: authorizer chi cho SELECT/READ/FUNCTION + PRAGMA query_only + gioi han thoi gian.
+    '''
+
+    def __init__(self, tables: Dict[str, str], llm_service, max_rows: int = None, timeout_ms: int = None):
+        '''
+        Args:
+            tables (Dict[str, str]): ten bang -> duong dan table.sqlite
+        '''
+        self.llm_service = llm_service
+        self.max_rows = max_rows or config.TABLE_MAX_ROWS
+        self.timeout_ms = timeout_ms or config.TABLE_TIMEOUT_MS
+        self.tables = dict(tables)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect("file::memory:", uri=True, check_same_thread=False)
+        for i, (name, path) in enumerate(self.tables.items()):
+            self.conn.execute(f"ATTACH DATABASE ? AS doc{i}", (f"file:{os.path.abspath(path)}?mode=ro",))
+            self.conn.execute(f'CREATE TEMP VIEW "{name}" AS SELECT * FROM doc{i}.{TableStore.TABLE}')
+        self.schema = self._schema()
+        self.vocabulary = self._vocabulary()
+        self.conn.execute("PRAGMA query_only = ON")
+        self.conn.set_authorizer(lambda action, *args: sqlite3.SQLITE_OK if action in _ALLOWED_ACTIONS else sqlite3.SQLITE_DENY)
+
+    @staticmethod
+    def table_name(file_name: str, taken) -> str:
+        ''' Ten bang SQL tu ten file (chu thuong, [a-z0-9_]), khong trung ten da co'''
+        base = re.sub(r"\W+", "_", _strip_accents(os.path.splitext(file_name)[0])).strip("_") or "table"
+        if base[0].isdigit():
+            base = f"t_{base}"
+        name, i = base, 2
+        while name in taken:
+            name, i = f"{base}_{i}", i + 1
+        return name
+
+    def _schema(self, sample_rows: int = None) -> str:
+        ''' CREATE TABLE + vai dong mau cua tung bang (dua vao prompt text-to-SQL)'''
+        sample_rows = sample_rows or config.TABLE_SAMPLE_ROWS
+        parts = []
+        for i, name in enumerate(self.tables):
+            columns = self.conn.execute(f"PRAGMA doc{i}.table_info({TableStore.TABLE})").fetchall()
+            n_rows = self.conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+            samples = self.conn.execute(f'SELECT * FROM "{name}" LIMIT {int(sample_rows)}').fetchall()
+            ddl = ", ".join(f'"{col[1]}" {col[2] or "TEXT"}' for col in columns)
+            parts.append(
+                f'CREATE TABLE "{name}" ({ddl}); -- {n_rows} rows\n'
+                + "\n".join(f"-- {' | '.join(map(str, row))}" for row in samples)
+            )
+        return "\n\n".join(parts)
+
+    def _vocabulary(self) -> Optional[re.Pattern]:
+        ''' Regex ten bang + ten cot (bo dau, "_" -> " ", cho phep so nhieu "s")'''
+        terms = set()
+        for i, name in enumerate(self.tables):
+            columns = self.conn.execute(f"PRAGMA doc{i}.table_info({TableStore.TABLE})").fetchall()
+            for term in [name, *(col[1] for col in columns)]:
+                term = _NON_WORD_RE.sub(" ", _strip_accents(str(term))).strip()
+                if len(term) > 1:
+                    terms.add(term)
+        if not terms:
+            return None
+        return re.compile(r"\b(" + "|".join(sorted(map(re.escape, terms), key=len, reverse=True)) + r")s?\b")
+
+    def is_structured(self, question: str) -> bool:
+        text = _strip_accents(question)
+        if not _STRUCTURED_RE.search(text):
+            return False
+        # Cau hoi van ban cung co the chua tu tong hop -> chi chay SQL khi nhac toi bang / cot cua session
+        return self.vocabulary is not None and bool(self.vocabulary.search(_NON_WORD_RE.sub(" ", text)))
+
+    @staticmethod
+    def _extract_sql(text: str) -> str:
+        match = _SQL_BLOCK_RE.search(text)
+        sql = (match.group(1) if match else text).strip()
+        return sql.split(";")[0].strip()
+
+    def run(self, sql: str) -> tuple[list, list, bool]:
+        ''' (ten cot, toi da max_rows dong, co bi cat khong); chi chay duoc 1 cau SELECT'''
+        if not _SELECT_RE.match(sql):
+            raise ValueError(f"Only SELECT queries are allowed: {sql[:80]}")
+        deadline = time.time() + self.timeout_ms / 1000
+        with self._lock:
+            self.conn.set_progress_handler(lambda: int(time.time() > deadline), 10000)
+            try:
+                cursor = self.conn.execute(sql)
+                rows = cursor.fetchmany(self.max_rows + 1)
+            finally:
+                self.conn.set_progress_handler(None, 0)
+        columns = [col[0] for col in cursor.description or []]
+        return columns, rows[: self.max_rows], len(rows) > self.max_rows
+
+    @staticmethod
+    def _format(columns: list, rows: list, truncated: bool) -> str:
+        def fmt(value):
+            return "NULL" if value is None else str(round(value, 4) if isinstance(value, float) else value)
+
+        lines = [" | ".join(columns)] + [" | ".join(fmt(v) for v in row) for row in rows]
+        if truncated:
+            lines.append(f"... (first {len(rows)} rows only)")
+        return "\n".join(lines)
+
+    def answer_context(self, question: str) -> Optional[str]:
+        ''' SQL + ket qua dang text cho prompt; None neu khong viet/chay duoc SQL (-> dung RAG)'''
+        error = ""
+        for _ in range(2):
+            sql = ""
+            try:
+                sql = self._extract_sql(self.llm_service.generate(
+                    SQL_PROMPT.format(schema=self.schema, question=question, error=error)
+                ))
+                start_time = time.time()
+                columns, rows, truncated = self.run(sql)
+            except Exception as e:
+                logger.warning(f"Text-to-SQL failed: {e}")
+                error = f"=== Previous attempt failed ===\n{sql}\nError: {e}\n\n"
+                continue
+            logger.info(f"SQL answered in {(time.time() - start_time) * 1000:.1f}ms ({len(rows)} rows): {sql}")
+            if not rows:
+                return None
+            return f"SQL: {sql}\n\n{self._format(columns, rows, truncated)}"
+        return None
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -1,5 +1,12 @@
 import os
+import time
+import shutil
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from app.core.chunk_store import ChunkDocstore, IndexIdMap
+from app.helper.config import config
 from app.helper.logger import get_logger
 
 
@@ -7,6 +14,19 @@ logger = get_logger('VectorStore')
 
 class VectorStore:
     ''' Quan ly build/ save/ laod Faiss vector store'''
+    INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+    IDS_FILE = "index_ids.npy"
+
+    def __init__(self):
+        self.index_type = config.INDEX_TYPE
+        self.flat_max = config.INDEX_FLAT_MAX
+        self.ivf_pq_min = config.INDEX_IVF_PQ_MIN
+        self.nlist = config.INDEX_NLIST
+        self.nprobe = config.INDEX_NPROBE
+        self.pq_m = config.INDEX_PQ_M
+        self.hnsw_m = config.INDEX_HNSW_M
+        self.ef_search = config.INDEX_EF_SEARCH
+
     def build_vector_store(self,docs, embedding_model):
         try:
             vector_store = FAISS.from_documents(documents=docs, embedding=embedding_model )
@@ -14,25 +34,260 @@ class VectorStore:
         except Exception as e:
             logger.error(f'Erro build vector store{e}')
             raise
+    def add_embeddings(self, vector_store, docs, embeddings, embedding_model):
+        '''
+        Them 1 batch chunk da embed vao FAISS (tao moi neu vector_store la None).
+        Docstore id = chunk_id de map nguoc ve ChunkStore / BM25.
+        '''
+        try:
+            text_embeddings = list(zip([d.page_content for d in docs], embeddings))
+            metadatas = [d.metadata for d in docs]
+            ids = [str(d.metadata["chunk_id"]) for d in docs]
+            if vector_store is None:
+                return FAISS.from_embeddings(text_embeddings, embedding_model, metadatas=metadatas, ids=ids)
+            vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            self.ensure_direct_map(vector_store.index)
+            return vector_store
+        except Exception as e:
+            logger.error(f'Erro add embeddings to vector store {e}')
+            raise
+
     def save_vector_store(self,vector_store:FAISS, save_dir:str)-> str:
         try:
             os.makedirs(save_dir,exist_ok=True)
             index_path = os.path.join(save_dir,'faiss_index')
-            vector_store.save_local(index_path)
+            # Luu vao thu muc tam roi doi ten: index cu co the dang duoc session khac doc
+            tmp_path = index_path + '.tmp'
+            old_path = index_path + '.old'
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            vector_store.save_local(tmp_path)
+            # Map vi tri FAISS -> chunk_id (load nhanh khong can unpickle docstore)
+            ids = [vector_store.index_to_docstore_id[pos] for pos in range(vector_store.index.ntotal)]
+            if all(doc_id.isdigit() for doc_id in ids):
+                np.save(os.path.join(tmp_path, self.IDS_FILE), np.asarray(ids, dtype=np.int64))
+            if os.path.exists(index_path):
+                shutil.rmtree(old_path, ignore_errors=True)
+                os.replace(index_path, old_path)
+            os.replace(tmp_path, index_path)
+            shutil.rmtree(old_path, ignore_errors=True)
             logger.info(f'FAISS saved in {index_path}')
             return index_path
         except Exception as e:
-            logger.erro(f'Error save FAISS {e}')
+            logger.error(f'Error save FAISS {e}')
             raise
     
-    def load_vectore_store(self,save_dir:str, embedding_model):
+    def load_vectore_store(self,save_dir:str, embedding_model, chunk_store=None):
+        '''
+        chunk_store != None: load chi doc (cho retriever) - faiss index duoc mmap neu loai index ho tro,
+        docstore doc thang tu ChunkStore thay vi unpickle index.pkl.
+        chunk_store = None: load day du (can khi sua index: append / delete).
+        '''
         try:
             index_path = os.path.join(save_dir,'faiss_index')
-            vector_store = FAISS.load_local(index_path,embeddings=embedding_model,allow_dangerous_deserialization=True)
+            ids_path = os.path.join(index_path, self.IDS_FILE)
+            if chunk_store is not None and os.path.exists(ids_path):
+                index = self._read_index_mmap(os.path.join(index_path, 'index.faiss'))
+                vector_store = FAISS(
+                    embedding_function=embedding_model,
+                    index=index,
+                    docstore=ChunkDocstore(chunk_store),
+                    index_to_docstore_id=IndexIdMap(np.load(ids_path, mmap_mode="r")),
+                )
+            else:
+                vector_store = FAISS.load_local(index_path,embeddings=embedding_model,allow_dangerous_deserialization=True)
+            self.apply_search_params(vector_store.index)
             logger.info(f' Loaded FAISS index from {index_path}')
             return vector_store
         except Exception as e:
             logger.error(f'Erro load FAISS {e}')
             raise
-        
-         
\ No newline at end of file
+
+    # fourcc dau file cua cac loai index doc duoc bang mmap: IndexFlat (IxF2 / IxFI), IndexHNSW (IHN*)
+    MMAP_FOURCC = (b"IxF", b"IHN")
+
+    @classmethod
+    def _read_index_mmap(cls, path: str):
+        '''
+        Doc faiss index bang mmap (flat codes) voi Flat / HNSW. IVF (IwFl / IwPQ) khong mmap duoc
+        cung flag nay -> doc binh thuong.
+        '''
+        with open(path, "rb") as f:
+            fourcc = f.read(4)
+        if not fourcc.startswith(cls.MMAP_FOURCC):
+            return faiss.read_index(path)
+        flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError as e:
+            logger.warning(f"mmap not supported for {path} ({e}), reading into memory")
+            return faiss.read_index(path)
+
+    # -------------------------------------------------------
+    # Index factory (Flat / IVF-Flat / IVF-PQ / HNSW)
+    # -------------------------------------------------------
+    def choose_index_type(self, n_vectors: int) -> str:
+        '''
+        index_type = auto: chon theo so vector.
+        HNSW khong ho tro xoa vector (remove_ids) nen chi dung khi cau hinh ro.
+        '''
+        if self.index_type in self.INDEX_TYPES:
+            return self.index_type
+        if n_vectors <= self.flat_max:
+            return "flat"
+        if n_vectors < self.ivf_pq_min:
+            return "ivf_flat"
+        return "ivf_pq"
+
+    def _factory_string(self, index_type: str, n_vectors: int, dim: int) -> str:
+        if index_type == "hnsw":
+            return f"HNSW{self.hnsw_m},Flat"
+        # Faiss can ~39 diem train / centroid
+        nlist = self.nlist or int(4 * np.sqrt(n_vectors))
+        nlist = int(max(1, min(nlist, n_vectors // 39)))
+        if index_type == "ivf_pq":
+            # so sub-quantizer phai chia het dim
+            m = max(d for d in range(1, min(self.pq_m, dim) + 1) if dim % d == 0)
+            return f"IVF{nlist},PQ{m}"
+        return f"IVF{nlist},Flat"
+
+    def build_index(self, vectors: np.ndarray, index_type: str, metric: int = faiss.METRIC_L2):
+        ''' Tao + train faiss index tu ma tran vector (thu tu vector giu nguyen)'''
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n_vectors, dim = vectors.shape
+        if index_type == "flat":
+            index = faiss.IndexFlatIP(dim) if metric == faiss.METRIC_INNER_PRODUCT else faiss.IndexFlatL2(dim)
+        else:
+            index = faiss.index_factory(dim, self._factory_string(index_type, n_vectors, dim), metric)
+            if not index.is_trained:
+                index.train(vectors)
+        index.add(vectors)
+        self.ensure_direct_map(index)
+        self.apply_search_params(index)
+        return index
+
+    @staticmethod
+    def ensure_direct_map(index):
+        '''
+        IVF: direct map (hashtable) day du de reconstruct(pos) duoc. Hashtable khong nhan cac
+        vector add sau khi tao (va index luu tu ban cu co the thieu) -> tao lai tu inverted lists.
+        '''
+        try:
+            ivf = faiss.extract_index_ivf(index)
+        except RuntimeError:
+            return index
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+
+    def apply_search_params(self, index):
+        ''' Ap nprobe (IVF) / efSearch (HNSW) tu config'''
+        try:
+            faiss.extract_index_ivf(index).nprobe = self.nprobe
+        except RuntimeError:
+            pass
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = self.ef_search
+
+    @staticmethod
+    def _metric(vector_store: FAISS) -> int:
+        if vector_store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+            return faiss.METRIC_INNER_PRODUCT
+        return faiss.METRIC_L2
+
+    @staticmethod
+    def current_index_type(index) -> str:
+        if isinstance(index, faiss.IndexHNSW):
+            return "hnsw"
+        if isinstance(index, faiss.IndexIVFPQ):
+            return "ivf_pq"
+        if isinstance(index, faiss.IndexIVF):
+            return "ivf_flat"
+        return "flat"
+
+    def optimize_index(self, vector_store: FAISS) -> FAISS:
+        '''
+        Doi index (flat khi build dan bang add_embeddings) sang loai index hop voi
+        kich thuoc corpus; da dung loai roi thi giu nguyen. Train tren chinh embedding cua session, thu tu vector
+        giu nguyen nen index_to_docstore_id khong doi.
+        '''
+        n_vectors = vector_store.index.ntotal
+        index_type = self.choose_index_type(n_vectors)
+        if n_vectors == 0 or index_type == self.current_index_type(vector_store.index):
+            return vector_store
+        start_time = time.time()
+        vectors = vector_store.index.reconstruct_n(0, n_vectors)
+        vector_store.index = self.build_index(vectors, index_type, metric=self._metric(vector_store))
+        logger.info(f"Built {index_type} index for {n_vectors} vectors in {time.time() - start_time:.2f}s")
+        return vector_store
+
+    def delete(self, vector_store: FAISS, ids: list[str]) -> FAISS:
+        '''
+        Xoa vector theo docstore id. Flat: remove_ids (vi tri duoc danh lai).
+        IVF/HNSW: label khong duoc danh lai (HNSW con khong ho tro remove_ids)
+        nen build lai index tu cac vector con lai (reconstruct_n doc thang inverted lists,
+        khong can direct map). Xoa het -> index flat rong (khong train IVF tren 0 vector).
+        '''
+        index_type = self.current_index_type(vector_store.index)
+        if index_type == "flat":
+            vector_store.delete(ids)
+            return vector_store
+        drop = set(ids)
+        keep = [pos for pos, doc_id in sorted(vector_store.index_to_docstore_id.items()) if doc_id not in drop]
+        vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)[keep]
+        doc_ids = [vector_store.index_to_docstore_id[pos] for pos in keep]
+        vector_store.index = self.build_index(
+            vectors.reshape(len(keep), vector_store.index.d),
+            index_type if keep else "flat",
+            metric=self._metric(vector_store),
+        )
+        vector_store.docstore.delete(list(drop & set(vector_store.index_to_docstore_id.values())))
+        vector_store.index_to_docstore_id = dict(enumerate(doc_ids))
+        return vector_store
+
+    # -------------------------------------------------------
+    # Benchmark recall / latency
+    # -------------------------------------------------------
+    def benchmark(self, vector_store: FAISS, n_queries: int = 200, k: int = 10,
+                  index_types: tuple = INDEX_TYPES) -> list[dict]:
+        '''
+        So sanh recall@k (so voi flat exact search) va latency cua tung loai index
+        tren chinh embedding cua vector store. Query = vector trong index + nhieu nho.
+        '''
+        n_vectors = vector_store.index.ntotal
+        vectors = vector_store.index.reconstruct_n(0, n_vectors)
+        rng = np.random.default_rng(0)
+        sample = rng.choice(n_vectors, size=min(n_queries, n_vectors), replace=False)
+        queries = vectors[sample] + rng.normal(scale=0.01, size=(len(sample), vectors.shape[1])).astype(np.float32)
+        metric = self._metric(vector_store)
+        k = min(k, n_vectors)
+
+        exact = self.build_index(vectors, "flat", metric=metric)
+        _, truth = exact.search(queries, k)
+        results = []
+        for index_type in index_types:
+            start_time = time.time()
+            index = self.build_index(vectors, index_type, metric=metric)
+            build_time = time.time() - start_time
+            start_time = time.time()
+            _, found = index.search(queries, k)
+            latency_ms = (time.time() - start_time) * 1000 / len(queries)
+            recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+            results.append({
+                "index_type": index_type,
+                "recall@k": round(float(recall), 4),
+                "latency_ms": round(latency_ms, 4),
+                "build_s": round(build_time, 3),
+            })
+            logger.info(f"Benchmark {index_type}: {results[-1]}")
+        return results
+
+
+if __name__ == "__main__":
+    import sys
+    from app.services.embedding_service import EmbeddingService
+
+    save_dir = sys.argv[1] if len(sys.argv) > 1 else "data/vector_store"
+    store = VectorStore()
+    vt_store = store.load_vectore_store(save_dir, embedding_model=EmbeddingService().model)
+    for row in store.benchmark(vt_store):
+        print(row)
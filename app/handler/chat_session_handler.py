@@ -2,18 +2,24 @@ import os
 import json 
 import time
 import shutil
+import threading
 
 from typing import Dict,Optional,Any, Generator,List
-from langchain.memory import ConversationBufferMemory
 from app.helper.logger import get_logger
 from app.services.embedding_service import EmbeddingService
 from app.services.llama_service import GroqLlamaService
 from app.core.data_pipeline import DataPipeLine
-from app.core.chunk_handler import ChunkHandler
-from app.core.data_loader import DataLoader
 from app.core.vector_store import VectorStore
+from app.core.chunk_store import ChunkStore
+from app.core.document_store import DocumentStore
+from app.core.index_manager import IndexManager
+from app.core.index_cache import IndexCache
+from app.core.bm25_index import BM25Index
 from app.core.retriaval_handler import RetrivalHandler
 from app.core.rag_engine import RagEngine
+from app.core.table_store import TableQueryEngine
+from app.core.chat_memory import ChatMemory
+from app.core.session_catalog import SessionCatalog
 from app.helper.config import config
 
 logger = get_logger("ChatSession")
@@ -22,6 +28,16 @@ class ChatSessionHandler:
     '''
     Quan ly va van hanh toan bo chat
     '''
+    # Lock dung chung toan process theo session / file metadata: nhieu ChatSessionHandler cung 1 session
+    # (UI + job ingest nen) khong sua index / metadata chong len nhau
+    _locks: Dict[str, threading.RLock] = {}
+    _locks_guard = threading.Lock()
+
+    @classmethod
+    def _named_lock(cls, name: str) -> threading.RLock:
+        with cls._locks_guard:
+            return cls._locks.setdefault(name, threading.RLock())
+
     def __init__(self,user_id:str,session_id:Optional[str]= None, base_dir:str ="data/sessions"):
         self.user_id = user_id
         self.session_id = session_id or str(time.time())
@@ -31,21 +47,31 @@ class ChatSessionHandler:
         self.upload_dir = os.path.join(self.session_dir, "uploads")                 
         self.vector_dir = os.path.join(self.session_dir, "vector_store")   
         os.makedirs(self.session_dir, exist_ok= True )
-        os.makedirs(self.upload_dir,exist_ok= True)
-        os.makedirs(self.vector_dir,exist_ok=True)
+        self.catalog = SessionCatalog(self.user_dir)
         
         # Metadata
         self.meta_path = os.path.join(self.session_dir,"metadata.json")
+        self._meta_lock = self._named_lock(f"meta:{os.path.abspath(self.meta_path)}")
         if not os.path.exists(self.meta_path):
             self._create_metadata() 
         
+        # Tai lieu dung chung theo hash: session 1 file chi tham chieu toi index trong document store,
+        # session nhieu file co index rieng (session_dir/vector_store) ghep tu index cua tung file
+        self.document_store = DocumentStore()
+        self.session_key = f"{user_id}/{self.session_id}"
+        # Them / thay / xoa tai lieu cua session chay tuan tu (RLock: IngestionQueue giu truoc khi goi file_process)
+        self.session_lock = self._named_lock(f"session:{self.session_key}")
+        self.own_vector_dir = os.path.join(self.session_dir, "vector_store")
+        self.vector_dir = self._resolve_vector_dir(self.get_metadata())
+        
         #Service
         self.llm = GroqLlamaService()
         self.embedding_service = EmbeddingService().model
         self.vectore_store = VectorStore()
         self.retriever_handler  = RetrivalHandler()
+        self.index_cache = IndexCache()
         self.pipe_line = DataPipeLine()
-        self.memory = ConversationBufferMemory(memory_key="chat_history",return_messages=True)
+        self.memory = ChatMemory(self.session_dir, self.llm)
         
         #State
         self.engine = None
@@ -59,20 +85,31 @@ class ChatSessionHandler:
             "user_id": self.user_id,
             "title": "New Chat",
             "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
             "file_uploaded": False                           
         }
-        with open(self.meta_path,"w",encoding="utf-8") as f:
+        self._write_metadata(meta)
+
+    def _write_metadata(self, meta: Dict):
+        ''' Ghi file tam roi rename: reader khong bao gio thay metadata ghi do. Cap nhat catalog cua user'''
+        tmp_path = f"{self.meta_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path,"w",encoding="utf-8") as f:
             json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.meta_path)
+        self.catalog.upsert(meta)
             
     def update_metadata(self,**kwargs):
-        if not os.path.exists(self.meta_path):
-            self._create_metadata()
-        with open(self.meta_path,"r+",encoding="utf-8") as f:
-            meta = json.load(f)
-            meta.update(kwargs)
-            f.seek(0)
-            json.dump(meta,f,ensure_ascii=False,indent=2)
-            f.truncate()
+        self.modify_metadata(lambda meta: meta.update(kwargs))
+
+    def modify_metadata(self, modify):
+        ''' Doc lai metadata duoi _meta_lock roi sua tai cho (modify(meta)) -> khong ghi de thay doi cua luong khac'''
+        with self._meta_lock:
+            if not os.path.exists(self.meta_path):
+                self._create_metadata()
+            meta = self.get_metadata()
+            modify(meta)
+            meta["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            self._write_metadata(meta)
             
     def get_metadata(self)-> Dict:
         if os.path.exists(self.meta_path):
@@ -80,82 +117,221 @@ class ChatSessionHandler:
                 return json.load(f)
         return {}
     
+    def _resolve_vector_dir(self, meta: Dict) -> str:
+        documents = meta.get("documents", [])
+        if len(documents) == 1 and not meta.get("own_index"):
+            return self.document_store.vector_dir(documents[0]["doc_hash"])
+        return self.own_vector_dir
+
+    def get_documents(self) -> List[Dict]:
+        ''' Danh sach tai lieu trong session: [{doc_hash, file_name}]'''
+        return self.get_metadata().get("documents", [])
+
     #File upload,vector_strore
-    def file_process(self,file_path:str) -> bool:
+    def file_process(self,file_path:str, progress=None) -> bool:
         '''
-        Process file with data pipi line
+        Process file with data pipi line.
+        Session da co tai lieu -> them file vao index cua session (khong build lai phan cu)
+        progress: callback(stage, **counts) bao tien do (IngestionQueue)
         '''
+        with self.session_lock:
+            return self._file_process(file_path, progress)
+
+    def _file_process(self, file_path: str, progress=None) -> bool:
         if not os.path.exists(file_path):
             logger.error(f"Not found find upload {file_path}")
             return False
 
-        dest_path = os.path.join(self.upload_dir,os.path.basename(file_path))
-        shutil.copy(file_path,dest_path)
-        self.current_path = dest_path
-        logger.info(f" Copied file to {dest_path} \n Starting pipe line with {dest_path}")
-        #Pipeline process 
-        index_path, chunks = self.pipe_line.process(file_path=dest_path, save_dir=self.vector_dir)
-        #loafd index -> retriever
-        vt_store = self.vectore_store.load_vectore_store(
-            save_dir=self.vector_dir,
-            embedding_model= self.embedding_service
-            
+        documents = self.get_documents()
+        if self.get_metadata().get("file_uploaded") and not documents:
+            logger.error(f" Legacy session {self.session_id} only supports one file")
+            return False
+        # File trung noi dung voi file da upload (o session khac) -> dung lai index da build.
+        # Tham chieu duoc giu ngay khi luu file (session khac release khong xoa mat tai lieu dang build);
+        # loi truoc khi tai lieu vao metadata -> tra lai tham chieu, tranh tai lieu mo coi
+        doc_hash = self.document_store.add_source(file_path, session_key=self.session_key)
+        if any(d["doc_hash"] == doc_hash for d in documents):
+            logger.info(f" Document {doc_hash[:12]} already in session {self.session_id}")
+            return self._attach_engine()
+        # Ban sua cua file da co trong session (cung ten file) -> chi cap nhat chunk thay doi
+        previous = next((d for d in documents if d["file_name"] == os.path.basename(file_path)), None)
+        if previous is not None:
+            return self._replace_document(previous, doc_hash, progress)
+
+        try:
+            self.current_path = self.document_store.source_path(doc_hash)
+            logger.info(f" Stored file as document {doc_hash[:12]} \n Starting pipe line with {self.current_path}")
+            #Pipeline process (chi chay khi document chua co index)
+            doc_vector_dir = self.document_store.ensure_index(doc_hash, self.pipe_line, progress)
+
+            meta = self.get_metadata()
+            own_index = meta.get("own_index", False)
+            if documents:
+                # Session da co tai lieu: lan dau thi copy index dung chung thanh index rieng, sau do append
+                if not own_index:
+                    IndexManager.copy_index(self.document_store.vector_dir(documents[0]["doc_hash"]), self.own_vector_dir)
+                    own_index = True
+                IndexManager(self.own_vector_dir).append_index(doc_vector_dir)
+                self.index_cache.invalidate(self.own_vector_dir)
+
+            #update meta data
+            def add_document(meta):
+                documents = [d for d in meta.get("documents", []) if d["doc_hash"] != doc_hash]
+                documents.append({"doc_hash": doc_hash, "file_name": os.path.basename(file_path)})
+                meta.update(file_uploaded = True, file_name = os.path.basename(file_path),
+                            documents = documents, own_index = own_index)
+            self.modify_metadata(add_document)
+        except Exception:
+            self.document_store.release(doc_hash, self.session_key)
+            raise
+        self.vector_dir = self._resolve_vector_dir(self.get_metadata())
+        logger.info(f" file process and FAISS index strore at {self.vector_dir}")
+        if progress is not None:
+            progress("attaching")
+        return self._attach_engine()
+
+    def _replace_document(self, previous: Dict, doc_hash: str, progress=None) -> bool:
+        '''
+        Upload ban sua cua tai lieu da co: index cua ban moi suy ra tu index cu,
+        chi chunk thay doi duoc embed lai (IndexManager.update_document).
+        Tham chieu cua doc_hash da duoc giu boi add_source.
+        '''
+        try:
+            self.current_path = self.document_store.source_path(doc_hash)
+            logger.info(f" Document {previous['doc_hash'][:12]} revised as {doc_hash[:12]}, updating index incrementally")
+            doc_vector_dir = self.document_store.derive_index(doc_hash, previous["doc_hash"], self.pipe_line, progress)
+
+            meta = self.get_metadata()
+            if meta.get("own_index"):
+                chunks = IndexManager(doc_vector_dir).document_chunks(doc_hash)
+                IndexManager(self.own_vector_dir).update_document(previous["doc_hash"], doc_hash, previous["file_name"], chunks)
+                self.index_cache.invalidate(self.own_vector_dir)
+            def replace_document(meta):
+                documents = [
+                    {"doc_hash": doc_hash, "file_name": d["file_name"]} if d["doc_hash"] == previous["doc_hash"] else d
+                    for d in meta.get("documents", [])
+                ]
+                meta.update(file_uploaded = True, file_name = previous["file_name"], documents = documents)
+            self.modify_metadata(replace_document)
+        except Exception:
+            self.document_store.release(doc_hash, self.session_key)
+            raise
+        if self.document_store.release(previous["doc_hash"], self.session_key) == 0:
+            self.index_cache.invalidate(self.document_store.vector_dir(previous["doc_hash"]))
+        self.vector_dir = self._resolve_vector_dir(self.get_metadata())
+        if progress is not None:
+            progress("attaching")
+        return self._attach_engine()
+
+    def remove_document(self, doc_hash: str) -> bool:
+        ''' Xoa 1 tai lieu khoi session (go khoi FAISS/BM25 theo chunk id, khong build lai)'''
+        with self.session_lock:
+            return self._remove_document(doc_hash)
+
+    def _remove_document(self, doc_hash: str) -> bool:
+        documents = self.get_documents()
+        remaining = [d for d in documents if d["doc_hash"] != doc_hash]
+        if len(remaining) == len(documents):
+            logger.warning(f" Document {doc_hash[:12]} not in session {self.session_id}")
+            return False
+        own_index = self.get_metadata().get("own_index", False)
+        if own_index:
+            self.index_cache.invalidate(self.own_vector_dir)
+            if remaining:
+                IndexManager(self.own_vector_dir).delete_document(doc_hash)
+            else:
+                shutil.rmtree(self.own_vector_dir, ignore_errors=True)
+                own_index = False
+        if self.document_store.release(doc_hash, self.session_key) == 0:
+            self.index_cache.invalidate(self.document_store.vector_dir(doc_hash))
+        self.update_metadata(
+            documents = remaining,
+            own_index = own_index,
+            file_uploaded = bool(remaining),
+            file_name = remaining[-1]["file_name"] if remaining else None,
         )
+        self.vector_dir = self._resolve_vector_dir(self.get_metadata())
+        if not remaining:
+            self.engine = None
+            self.retriever = None
+            return True
+        return self._attach_engine()
+
+    def _attach_engine(self) -> bool:
+        ''' Lay index cua vector_dir (tu LRU cache index dang warm) -> retriever -> RagEngine'''
+        loaded = self.index_cache.get(self.vector_dir, embedding_model=self.embedding_service)
         self.retriever_handler.build(
-            vector_store= vt_store,
-            all_docs= chunks
+            vector_store= loaded.vector_store,
+            all_docs= loaded.chunks,
+            bm25_index= loaded.bm25,
+            cache_key= f"{os.path.abspath(loaded.vector_dir)}@{loaded.revision}"
         )
         self.retriever = self.retriever_handler.retriever
-        self.engine = RagEngine(retriever=self.retriever)
-        #update meta data
-        self.update_metadata(file_uploaded =True, file_name = os.path.basename(file_path))
-        logger.info(f" file process and FAISS index strore at {index_path}")
+        # Engine tao 1 lan cho session, index doi thi chi thay retriever
+        if self.engine is None:
+            self.engine = RagEngine(retriever=self.retriever, llm_service=self.llm,
+                                    index_dir=loaded.vector_dir, index_revision=loaded.revision)
+        else:
+            self.engine.set_retriever(self.retriever, index_dir=loaded.vector_dir, index_revision=loaded.revision)
+        self.engine.set_tables(self._attach_tables())
         return True
+
+    def _attach_tables(self) -> Optional[TableQueryEngine]:
+        ''' Bang SQL cua cac file CSV trong session (build 1 lan / tai lieu) -> TableQueryEngine'''
+        if not config.TABLE_ENABLED:
+            return None
+        tables = {}
+        for document in self.get_documents():
+            try:
+                path = self.document_store.ensure_table(document["doc_hash"])
+            except Exception as e:
+                logger.error(f" Cannot build SQL table for {document['file_name']}: {e}")
+                continue
+            if path is not None:
+                tables[TableQueryEngine.table_name(document["file_name"], tables)] = path
+        return TableQueryEngine(tables, self.llm) if tables else None
     
     def ask(self,question:str)-> str:
         if not self.engine:
             return "I'm chat bot with document. Please upload document!!"
         try:
-            self.memory.chat_memory.add_user_message(question)
-            answer = self.engine.generate(question)
-            self.memory.chat_memory.add_ai_message(answer)
-            self.save_chat_history()
+            # Cau hoi follow-up -> cau hoi doc lap cho retrieval; lich su (summary + window) vao prompt
+            standalone = self.memory.condense(question)
+            history = self.memory.render()
+            self.memory.add_user_message(question)
+            answer = self.engine.generate(question, history=history, standalone=standalone)
+            self.memory.add_ai_message(answer)
             return answer
         except Exception as e:
             logger.error(f"Error generating answer: {e}")
             return "Sorry, something went wrong."   
-    
-    def save_chat_history(self):
-        path  = os.path.join(self.session_dir,"chat_history.json")
-        try:
-            data = [{'role':m.type,"content": m.content} for m in self.memory.chat_memory.messages]
-            with open(path,"w",encoding="utf-8") as f:
-                json.dump(data,f, ensure_ascii=False,indent=2)
-                logger.info(f"Save chat history for session {self.session_id}")
-        except Exception as e:
-            logger.error(f"Failed to save chat history {e}")
             
     def load_chat_history(self)->bool:
-        path = os.path.join(self.session_dir,"chat_history.json")
-        if not os.path.exists(path):
-            logger.warning("Not found chat history")
-            return False
+        ''' Chi doc phan cuoi log: window chua tom tat + chat_log.display_messages message de hien thi'''
         try:
-            with open(path,"r",encoding="utf-8") as f:
-                data = json.load(f)
-                for msg in data:
-                    if msg['role'] =='human':
-                        self.memory.chat_memory.add_user_message(msg['content'])
-                    else:
-                        self.memory.chat_memory.add_ai_message(msg['content'])
-                return True
+            if not self.memory.load():
+                logger.warning("Not found chat history")
+                return False
+            return True
         except Exception as e:
             logger.error(f" Erro loading chat history {e}")
             return False
     
     def detete_session(self) -> bool:
         ''' Delete all session (upload,vt_store, history)'''
+        # Job ingest dang chay cua session giu session_lock -> doi job xong roi moi xoa thu muc
+        with self.session_lock:
+            return self._delete_session()
+
+    def _delete_session(self) -> bool:
         try:
+            # Chi xoa document dung chung khi khong con session nao tham chieu
+            for document in self.get_documents():
+                if self.document_store.release(document["doc_hash"], self.session_key) == 0:
+                    self.index_cache.invalidate(self.document_store.vector_dir(document["doc_hash"]))
+            self.index_cache.invalidate(self.own_vector_dir)
+            self.memory.log.close()
+            self.catalog.delete(self.session_id)
             if os.path.exists(self.session_dir):
                 shutil.rmtree(self.session_dir,ignore_errors=True)
                 logger.info(f" Deleted session folder {self.session_dir}")
@@ -167,8 +343,6 @@ class ChatSessionHandler:
             logger.error(f" Error deleting session {e}")
             return False
     
-    from typing import Generator, Any
-
 # =========================================================
 # 💬 STREAMING CHAT
 # =========================================================
@@ -182,27 +356,20 @@ class ChatSessionHandler:
             return
 
         try:
-            self.memory.chat_memory.add_user_message(question)
             placeholder.markdown("🤔 *Thinking...*")
+            standalone = self.memory.condense(question)
+            history = self.memory.render()
+            self.memory.add_user_message(question)
 
-            #  Lấy các tài liệu liên quan
-            docs = self.retriever_handler.get_relevant_documents(question)
-            context = "\n\n".join([d.page_content for d in docs[: config.K_FINAL]])
-
-            # Tạo prompt cho LLM
-            prompt = self.engine.format_prompt(context=context, question=question)
-
+            # Retrieve 1 lan + stream output từ LLM (cung pipeline voi ask)
             response = ""
-            #tream output từ LLM
-            for chunk in self.engine.llm.stream(prompt):
-                text = getattr(chunk, "content", "")
+            for text in self.engine.stream(question, history=history, standalone=standalone):
                 response += text
                 placeholder.markdown(response)
                 yield text
 
-            # Lưu vào bộ nhớ hội thoại
-            self.memory.chat_memory.add_ai_message(response)
-            self.save_chat_history()
+            # Lưu vào bộ nhớ hội thoại (ghi them 1 dong vao chat_history.jsonl)
+            self.memory.add_ai_message(response)
 
             yield "\n"
         except Exception as e:
@@ -218,26 +385,23 @@ class ChatSessionHandler:
         logger.info("🧹 Cleared chat memory for session %s", self.session_id)
     
     @staticmethod
-    def list_user_sessions(user_id:str ,base_dir:str="data/sessions") -> List[Dict]:
-        
+    def list_user_sessions(user_id:str ,base_dir:str="data/sessions", limit: int = None, offset: int = 0,
+                           sort_by: str = "created_at") -> List[Dict]:
+        ''' Danh sach session cua user tu SessionCatalog (sap xep + phan trang, khong doc tung metadata.json)'''
         user_dir = os.path.join(base_dir,f"user_{user_id}")
         if not os.path.exists(user_dir):
             return []
-        sessions = []
-        for folder in os.listdir(user_dir):
-            meta_path = os.path.join(user_dir,folder,'metadata.json')
-            if os.path.exists(meta_path):
-                try:
-                    with open(meta_path,"r",encoding='utf-8') as f:
-                        meta = json.load(f)
-                    meta.setdefault('title','Unitled')
-                    meta["path"] = os.path.join(user_dir,folder)
-                    sessions.append(meta)
-                except Exception as e:
-                    logger.error(f" Erro reading metadat from {folder}:{e}")
-        sessions.sort(key= lambda x:x.get('created_at',""),reverse= True)
+        sessions = SessionCatalog(user_dir).list(limit=limit, offset=offset, sort_by=sort_by)
+        for meta in sessions:
+            meta.setdefault('title','Unitled')
+            meta["path"] = os.path.join(user_dir,f"session_{meta['session_id']}")
         return sessions
 
+    @staticmethod
+    def count_user_sessions(user_id: str, base_dir: str = "data/sessions") -> int:
+        user_dir = os.path.join(base_dir,f"user_{user_id}")
+        return SessionCatalog(user_dir).count() if os.path.exists(user_dir) else 0
+
     def summarize_title(self,first_quesion:str = "New chat"):
         '''Update title for firest question'''
         try:
@@ -259,42 +423,22 @@ class ChatSessionHandler:
         if not meta.get('file_uploaded'):
             logger.warning('f"Session {self.session_id} File not marked as uploaded')
             return False
-        try:
-            uploaded_files = os.listdir(self.upload_dir)
-            if len(uploaded_files) != 1:
-                logger.error(f" Cannot restroe engine for session{self.session_id}")
-                return False
-            original_filename = uploaded_files[0]
-        except FileNotFoundError:
-            logger.error(f" Upload dir not founf  {self.upload_dir}. Can't restore")
-            return False
-        original_file_path  = os.path.join(self.upload_dir,original_filename)
         vector_store_exists = os.path.exists(self.vector_dir) and any(os.scandir(self.vector_dir))
         if not vector_store_exists:
             logger.error(f" VEctor store not found  for session {self.session_id}. Can't not restore")
             return False
         try:
             logger.info(f" Restoring RAG Engine for session")            
-            chunkhandler = ChunkHandler()
-            loader = DataLoader()
-            docs,file_type  = loader.load_file(file_path=original_file_path )
-            chunks  = chunkhandler.split_documents(docs=docs,file_type= file_type)
-            # Tai lai vector Store
-            vt_store = self.vectore_store.load_vectore_store(
-                    save_dir=self.vector_dir,
-                    embedding_model=self.embedding_service
-                )
-            self.retriever_handler.build(vector_store=vt_store, all_docs=chunks)
-            self.retriever = self.retriever_handler.retriever
-            self.engine = RagEngine(retriever=self.retriever)
+            if IndexManager.is_legacy(self.vector_dir):
+                # Session cu (docstore id = uuid): chunk lay tu docstore cua chinh index -> khop vector
+                IndexManager(self.vector_dir).migrate_legacy()
+            if not BM25Index.exists(self.vector_dir):
+                BM25Index.from_texts(ChunkStore.load(self.vector_dir).get_texts()).save(self.vector_dir)
+            # Tai lai vector Store + BM25 + chunk -> retriever
+            self._attach_engine()
             logger.info(f"✅ RAG Engine for session {self.session_id} successfully restored.")
             return True
         except Exception as e:
             logger.error(f"Failed to reload RAG engine from disk for session {self.session_id}: {e}")
             self.engine = None
             return False
-        
-    
-        
-            
-            
\ No newline at end of file
@@ -42,11 +42,114 @@ class Config:
         self.TEMPERATURE = model_cfg.get("temperature", 0.7)
         self.EMBEDDING_MODEL = model_cfg.get("embedding_model", "sentence-transformers/all-MiniLM-L6-v2")
         
+        # LLM HTTP client (API tuong thich OpenAI)
+        llm_cfg = yaml_data.get("llm", {})
+        self.LLM_BASE_URL = llm_cfg.get("base_url", "https://api.groq.com/openai/v1")
+        self.LLM_TIMEOUT = llm_cfg.get("timeout", 60)
+        self.LLM_MAX_CONCURRENCY = llm_cfg.get("max_concurrency", 8)
+        self.LLM_MAX_CONNECTIONS = llm_cfg.get("max_connections", 16)
+        self.LLM_KEEPALIVE_EXPIRY = llm_cfg.get("keepalive_expiry", 60)
+        
+        # Embedding engine + cache
+        embedding_cfg = yaml_data.get("embedding", {})
+        self.EMBEDDING_DEVICE = embedding_cfg.get("device", "cpu")
+        self.EMBEDDING_BATCH_SIZE = embedding_cfg.get("batch_size", 64)
+        self.EMBEDDING_NUM_WORKERS = embedding_cfg.get("num_workers", 1)
+        self.EMBEDDING_SORT_BY_LENGTH = embedding_cfg.get("sort_by_length", True)
+        self.EMBEDDING_CACHE_DIR = embedding_cfg.get("cache_dir", "data/embedding_cache")
+        self.EMBEDDING_CACHE_MAX_ENTRIES = embedding_cfg.get("cache_max_entries", 200000)
+        
+        # Ingestion pipeline
+        pipeline_cfg = yaml_data.get("pipeline", {})
+        self.PIPELINE_BATCH_SIZE = pipeline_cfg.get("batch_size", 256)
+        self.PIPELINE_EMBED_WORKERS = pipeline_cfg.get("embed_workers", 2)
+        self.PIPELINE_MAX_PENDING_BATCHES = pipeline_cfg.get("max_pending_batches", 4)
+
+        # CSV chunking
+        csv_cfg = yaml_data.get("csv", {})
+        self.CSV_BATCH_ROWS = csv_cfg.get("batch_rows", 50000)
+        self.CSV_CHUNK_TOKENS = csv_cfg.get("chunk_tokens", 256)
+        self.CSV_GROUP_BY = csv_cfg.get("group_by")
+
+        # PDF parsing
+        pdf_cfg = yaml_data.get("pdf", {})
+        self.PDF_BACKEND = pdf_cfg.get("backend", "auto")
+        self.PDF_WORKERS = pdf_cfg.get("workers") or min(4, os.cpu_count() or 1)
+        self.PDF_PAGES_PER_TASK = pdf_cfg.get("pages_per_task", 16)
+        self.PDF_PARALLEL_MIN_PAGES = pdf_cfg.get("parallel_min_pages", 32)
+
+        # Structured (SQL) query cho file CSV
+        table_cfg = yaml_data.get("table", {})
+        self.TABLE_ENABLED = table_cfg.get("enabled", True)
+        self.TABLE_MAX_ROWS = table_cfg.get("max_rows", 50)
+        self.TABLE_TIMEOUT_MS = table_cfg.get("timeout_ms", 2000)
+        self.TABLE_SAMPLE_ROWS = table_cfg.get("sample_rows", 3)
+        
+        # Vector store index factory
+        index_cfg = yaml_data.get("vector_store", {})
+        self.INDEX_TYPE = index_cfg.get("index_type", "auto")
+        self.INDEX_FLAT_MAX = index_cfg.get("flat_max", 20000)
+        self.INDEX_IVF_PQ_MIN = index_cfg.get("ivf_pq_min", 500000)
+        self.INDEX_NLIST = index_cfg.get("nlist", 0)
+        self.INDEX_NPROBE = index_cfg.get("nprobe", 16)
+        self.INDEX_PQ_M = index_cfg.get("pq_m", 16)
+        self.INDEX_HNSW_M = index_cfg.get("hnsw_m", 32)
+        self.INDEX_EF_SEARCH = index_cfg.get("ef_search", 64)
+        
+        # Warm index cache
+        index_cache_cfg = yaml_data.get("index_cache", {})
+        self.INDEX_CACHE_MAX_ENTRIES = index_cache_cfg.get("max_entries", 8)
+        self.INDEX_CACHE_MAX_MB = index_cache_cfg.get("max_mb", 1024)
+        
+        # Storage
+        storage_cfg = yaml_data.get("storage", {})
+        self.DOCUMENT_STORE_DIR = storage_cfg.get("documents_dir", "data/documents")
+        
         # API-- keys
         # Spliiter for RAG 
         model_rag = yaml_data.get("rag",{})
         self.CHUNK_SIZE = model_rag.get('chunk_size')
         self.CHUNK_OVERLAP = model_rag.get('chunk_overlap')
+        self.SIMILARITY_THRESHOLD = model_rag.get('similarity_threshold', 0.9)
+        
+        # Context assembly
+        context_cfg = yaml_data.get("context", {})
+        self.CONTEXT_MAX_TOKENS = context_cfg.get("max_tokens", 2000)
+        self.CONTEXT_MIN_CHUNK_TOKENS = context_cfg.get("min_chunk_tokens", 50)
+        self.CONTEXT_DEDUPE_THRESHOLD = context_cfg.get("dedupe_threshold", 0.9)
+        
+        # Chat memory
+        memory_cfg = yaml_data.get("memory", {})
+        self.MEMORY_MAX_TOKENS = memory_cfg.get("max_tokens", 1500)
+        self.MEMORY_SUMMARY_MAX_TOKENS = memory_cfg.get("summary_max_tokens", 300)
+        self.MEMORY_CONDENSE_QUESTIONS = memory_cfg.get("condense_questions", True)
+        
+        # Chat log (append-only)
+        chat_log_cfg = yaml_data.get("chat_log", {})
+        self.CHAT_LOG_FSYNC_EVERY = chat_log_cfg.get("fsync_every", 8)
+        self.CHAT_LOG_FSYNC_INTERVAL = chat_log_cfg.get("fsync_interval", 2.0)
+        self.CHAT_LOG_COMPACT_BYTES = chat_log_cfg.get("compact_bytes", 1024 * 1024)
+        self.CHAT_LOG_KEEP_LAST = chat_log_cfg.get("keep_last", 200)
+        self.CHAT_LOG_DISPLAY_MESSAGES = chat_log_cfg.get("display_messages", 200)
+
+        # Background ingestion jobs
+        jobs_cfg = yaml_data.get("jobs", {})
+        self.JOBS_DB_PATH = jobs_cfg.get("db_path", "data/jobs.sqlite")
+        self.JOBS_MAX_WORKERS = jobs_cfg.get("max_workers", 2)
+        self.JOBS_PROGRESS_INTERVAL = jobs_cfg.get("progress_interval", 0.5)
+        self.JOBS_POLL_INTERVAL = jobs_cfg.get("poll_interval", 1.0)
+
+        # Session catalog (sidebar)
+        sessions_cfg = yaml_data.get("sessions", {})
+        self.SESSION_PAGE_SIZE = sessions_cfg.get("page_size", 20)
+        self.SESSION_SORT_BY = sessions_cfg.get("sort_by", "created_at")
+        
+        # Semantic answer cache
+        answer_cache_cfg = yaml_data.get("answer_cache", {})
+        self.ANSWER_CACHE_ENABLED = answer_cache_cfg.get("enabled", True)
+        self.ANSWER_CACHE_TTL_SECONDS = answer_cache_cfg.get("ttl_seconds", 3600)
+        self.ANSWER_CACHE_MAX_ENTRIES = answer_cache_cfg.get("max_entries", 256)
+        self.ANSWER_CACHE_MAX_DOCUMENTS = answer_cache_cfg.get("max_documents", 32)
         
         #self.GROQ_API_KEY = os.getenv("GROQ_API_KEY")
         self.GROQ_API_KEY = self._get_secret("GROQ_API_KEY")
@@ -57,9 +160,22 @@ class Config:
         self.K_FINAL =  retrival_config.get("k_final")
         self.K_VECTOR =retrival_config.get("k_vector")
         self.K_BM25 = retrival_config.get("k_bm25")
+        self.WEIGHTS = retrival_config.get("weights", [0.5, 0.5])
+        self.FUSION = retrival_config.get("fusion", "rrf")
+        self.RRF_K = retrival_config.get("rrf_k", 60)
+        # Retrieval result cache
+        retrieval_cache_cfg = yaml_data.get("retrieval_cache", {})
+        self.RETRIEVAL_CACHE_ENABLED = retrieval_cache_cfg.get("enabled", True)
+        self.RETRIEVAL_CACHE_MAX_RESULTS = retrieval_cache_cfg.get("max_results", 1024)
+        self.RETRIEVAL_CACHE_MAX_QUERY_VECTORS = retrieval_cache_cfg.get("max_query_vectors", 4096)
+        self.RETRIEVAL_CACHE_MAX_PAIR_SCORES = retrieval_cache_cfg.get("max_pair_scores", 50000)
         ## Rerank Model
         reranker_cfg = yaml_data.get("reranker",{})
-        self.RERANKER_MODEL = reranker_cfg.get("model", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        self.RERANKER_MODEL = reranker_cfg.get("model_name", reranker_cfg.get("model", "cross-encoder/ms-marco-MiniLM-L-6-v2"))
+        self.RERANKER_BATCH_SIZE = reranker_cfg.get("batch_size", 32)
+        self.RERANKER_MAX_CANDIDATES = reranker_cfg.get("max_candidates", 20)
+        self.RERANKER_MARGIN = reranker_cfg.get("margin", 0.3)
+        self.RERANKER_TIME_BUDGET_MS = reranker_cfg.get("time_budget_ms", 400)
         self.ENABLE = reranker_cfg.get('enabled')
     
     
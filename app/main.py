@@ -2,10 +2,13 @@ import sys
 import streamlit as st
 import time
 import os
+import uuid
 
 # Path run
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.handler.chat_session_handler import ChatSessionHandler
+from app.helper.config import config
+from app.services.ingestion_queue import IngestionQueue
 
 
 #Congifg
@@ -26,8 +29,21 @@ BASE_DIR = "data/sessions"
 # ==========================================
 # Intinilize session state
 # ==========================================
+def load_sessions():
+    ''' Trang dau (+ cac trang da "Show more") cua danh sach session tu catalog'''
+    return ChatSessionHandler.list_user_sessions(
+        USER_ID, limit=st.session_state.session_limit, sort_by=config.SESSION_SORT_BY
+    )
+
+if "session_limit" not in st.session_state:
+    st.session_state.session_limit = config.SESSION_PAGE_SIZE
+
 if "chat_sessions" not in st.session_state:
-    st.session_state.chat_sessions = ChatSessionHandler.list_user_sessions(USER_ID)
+    st.session_state.chat_sessions = load_sessions()
+
+# Job ingest dang theo doi: job_id -> session_key
+if "watching_jobs" not in st.session_state:
+    st.session_state.watching_jobs = {}
 
 # ChatSessionHandler mặc định để tránh tạo session thừa
 if "chat_obj" not in st.session_state:
@@ -43,7 +59,7 @@ with st.sidebar:
         # Chỉ reset context, KHÔNG tạo session mới ngay lập tức
         st.session_state.chat_obj = None
         # Cập nhật danh sách sessions (không thêm session mới)
-        st.session_state.chat_sessions = ChatSessionHandler.list_user_sessions(USER_ID)
+        st.session_state.chat_sessions = load_sessions()
         st.rerun()
 
     st.markdown("---")
@@ -70,8 +86,10 @@ with st.sidebar:
                 st.rerun()
 
             if col2.button("🗑️", key=f"delete_{session_id}", help="Delete this chat session"):
-                # Xóa session được chọn
-                ChatSessionHandler(user_id=USER_ID, session_id=session_id).detete_session()
+                # Xóa session được chọn (bỏ các file upload còn đang chờ ingest)
+                deleted = ChatSessionHandler(user_id=USER_ID, session_id=session_id)
+                IngestionQueue().cancel_session(deleted.session_key)
+                deleted.detete_session()
 
                 # Nếu session hiện tại bị xóa → loại bỏ nó, KHÔNG tạo new chat tự động
                 if (
@@ -81,7 +99,14 @@ with st.sidebar:
                 ):
                     del st.session_state.chat_obj  
                 # Cập nhật danh sách sessions hiển thị
-                st.session_state.chat_sessions = ChatSessionHandler.list_user_sessions(USER_ID)
+                st.session_state.chat_sessions = load_sessions()
+                st.rerun()
+
+        # Con session chua hien thi -> tai them 1 trang
+        if len(sessions) >= st.session_state.session_limit:
+            if st.button("Show more", use_container_width=True):
+                st.session_state.session_limit += config.SESSION_PAGE_SIZE
+                st.session_state.chat_sessions = load_sessions()
                 st.rerun()
 
 # ==========================================
@@ -100,42 +125,112 @@ st.markdown(f"<p style='text-align:center;'> In chat session: <b>{meta.get('titl
 st.markdown("---")
 
 
+# ==========================================
+# Ingestion jobs (chay nen, UI chi poll tien do)
+# ==========================================
+STAGE_PROGRESS = {"queued": 0.0, "starting": 0.05, "processing": 0.1, "updating": 0.5,
+                  "indexing": 0.85, "attaching": 0.95, "done": 1.0}
+
+
+def submit_upload(chat: ChatSessionHandler, uploaded) -> str:
+    """Luu file upload vao thu muc tam rieng roi xep hang ingest (job tu xoa file khi xong)."""
+    temp_dir = os.path.join(BASE_DIR, "temp", uuid.uuid4().hex)
+    os.makedirs(temp_dir, exist_ok=True)
+    temp_path = os.path.join(temp_dir, uploaded.name)
+    with open(temp_path, "wb") as f:
+        f.write(uploaded.getbuffer())
+    job_id = IngestionQueue().submit(chat, temp_path)
+    st.session_state.watching_jobs[job_id] = chat.session_key
+    return job_id
+
+
+def job_progress(job: dict) -> tuple[float, str]:
+    progress, stage = job["progress"], job["stage"]
+    value = STAGE_PROGRESS.get(stage, 0.0)
+    if stage == "processing" and progress.get("total"):
+        value += 0.75 * min(progress.get("parsed", 0) / progress["total"], 1.0)
+    text = f"⚙️ {job['file_name']}: {stage}"
+    if progress.get("parsed"):
+        text += f" · {progress['parsed']} {progress.get('unit', 'pages')} parsed"
+    if progress.get("chunks"):
+        text += f" · {progress.get('embedded', 0)}/{progress['chunks']} chunks embedded"
+    return value, text
+
+
+@st.fragment(run_every=config.JOBS_POLL_INTERVAL)
+def render_jobs(chat: ChatSessionHandler):
+    """Tien do job ingest cua session (tu cap nhat); job xong -> rerun ca trang de dung index moi."""
+    queue = IngestionQueue()
+    for job in queue.session_jobs(chat.session_key, active_only=True):
+        st.progress(*job_progress(job))
+    watching = st.session_state.watching_jobs
+    finished = [job for job in (queue.get(job_id) for job_id, session_key in list(watching.items())
+                                if session_key == chat.session_key)
+                if job is not None and job["status"] not in IngestionQueue.ACTIVE]
+    if finished:
+        messages = st.session_state.setdefault("job_messages", [])
+        for job in finished:
+            del watching[job["job_id"]]
+            if job["status"] == "done":
+                messages.append(f"✅ {job['file_name']} processed")
+            else:
+                messages.append(f"❌ {job['file_name']} failed: {job['error']}")
+        st.session_state.chat_sessions = load_sessions()
+        st.rerun()
+
+
+for message in st.session_state.pop("job_messages", []):
+    st.toast(message)
+
+processed = st.session_state.setdefault("processed_uploads", set())
+active_jobs = IngestionQueue().session_jobs(chat_obj.session_key, active_only=True) if chat_obj is not None else []
+if chat_obj is not None and (active_jobs or chat_obj.session_key in st.session_state.watching_jobs.values()):
+    render_jobs(chat_obj)
+
 # 📎 Upload file (chỉ khi chưa có)
 
 if not meta.get("file_uploaded", False):
-    uploaded_file = st.file_uploader("📂 Upload file to chat", type=["pdf", "csv"])
-    if uploaded_file:
+    uploaded_file = None if active_jobs else st.file_uploader("📂 Upload file to chat", type=["pdf", "csv"])
+    if uploaded_file and uploaded_file.file_id not in processed:
         # 🔸 Chỉ khi user upload mới tạo session
         if chat_obj is None:
             st.session_state.chat_obj = ChatSessionHandler(user_id=USER_ID)
             chat_obj = st.session_state.chat_obj
 
-        temp_dir = os.path.join(BASE_DIR, "temp")
-        os.makedirs(temp_dir, exist_ok=True)
-        temp_path = os.path.join(temp_dir, uploaded_file.name)
-        with open(temp_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-
-        with st.spinner("⚙️ Process data..."):
-            success = chat_obj.file_process(temp_path)
+        # Xu ly nen: UI khong bi chan, tien do hien o render_jobs
+        submit_upload(chat_obj, uploaded_file)
+        processed.add(uploaded_file.file_id)
+        st.session_state.chat_sessions = load_sessions()
+        st.rerun()
+else:
+    # Session đã có tài liệu: thêm / xóa từng file (index được cập nhật tăng dần)
+    with st.expander(f"📎 Documents ({len(chat_obj.get_documents())})"):
+        for doc in chat_obj.get_documents():
+            col1, col2 = st.columns([0.85, 0.15])
+            col1.markdown(f"📄 {doc['file_name']}")
+            # Dang co job ingest cua session -> khong cho xoa (job dang sua index / metadata)
+            if col2.button("✖", key=f"remove_{doc['doc_hash']}", help="Remove this document",
+                           disabled=bool(active_jobs)):
+                with st.spinner("⚙️ Removing document..."):
+                    chat_obj.remove_document(doc["doc_hash"])
+                st.session_state.chat_sessions = load_sessions()
+                st.rerun()
 
-        os.remove(temp_path)
-        if success:
-            st.success("✅ Successful procesing data!")
-            # Sau khi xử lý xong, cập nhật meta và danh sách sessions
-            st.session_state.chat_sessions = ChatSessionHandler.list_user_sessions(USER_ID)
+        extra_file = st.file_uploader("➕ Add file to this chat", type=["pdf", "csv"], key=f"add_{chat_obj.session_id}")
+        if extra_file and (chat_obj.session_id, extra_file.file_id) not in processed:
+            # Chat van dung index hien tai trong luc file moi duoc ingest
+            submit_upload(chat_obj, extra_file)
+            processed.add((chat_obj.session_id, extra_file.file_id))
             st.rerun()
-        else:
-            st.error("❌Fail, please try again.")
 
 
 #Streaming
 
 # Hiển thị lại lịch sử chat nếu đã có session
 if chat_obj is not None:
-    for msg in chat_obj.memory.chat_memory.messages:
-        with st.chat_message(msg.type):
-            st.markdown(msg.content)
+    for msg in chat_obj.memory.messages:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
 
 prompt = st.chat_input(" Enter your message...")
 
@@ -150,7 +245,7 @@ if prompt:
         st.warning("⚠️ Please upload document.")
         st.stop()
 
-    is_first = not chat_obj.memory.chat_memory.messages
+    is_first = chat_obj.memory.is_empty()
 
     with st.chat_message("user"):
         st.markdown(prompt)
@@ -161,7 +256,7 @@ if prompt:
 
     if is_first:
         chat_obj.summarize_title(prompt)
-        st.session_state.chat_sessions = ChatSessionHandler.list_user_sessions(USER_ID)
+        st.session_state.chat_sessions = load_sessions()
         st.rerun()
     else:
         st.rerun()
@@ -0,0 +1,134 @@
+import re
+import time
+import threading
+import numpy as np
+from dataclasses import dataclass, field
+from collections import OrderedDict
+from typing import Optional
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("AnswerCache")
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+@dataclass
+class _DocumentAnswers:
+    ''' Cau tra loi da cache cua 1 index (vector_dir)'''
+    revision: str
+    vectors: list = field(default_factory=list)
+    questions: list = field(default_factory=list)
+    answers: list = field(default_factory=list)
+    created_at: list = field(default_factory=list)
+    last_used: list = field(default_factory=list)
+
+    def drop(self, idx: int):
+        for values in (self.vectors, self.questions, self.answers, self.created_at, self.last_used):
+            del values[idx]
+
+
+class AnswerCache:
+    '''
+    Semantic cache cau tra loi (toan process), key = vector_dir cua index.
+
+    - Cau hoi duoc embed (normalize L2), tim cau hoi da cache gan nhat theo cosine;
+      >= similarity_threshold va cung cac con so trong cau hoi -> dung lai cau tra loi.
+    - Entry het han sau ttl_seconds; moi index giu toi da max_entries (LRU),
+      toi da max_documents index (LRU).
+    - Gan voi revision (generation + version trong index_manifest.json): index thay doi
+      hoac bi tao lai -> bo cache cua index do; IndexCache.invalidate cung xoa cache nay.
+    '''
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(AnswerCache, cls).__new__(cls)
+                cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.enabled = config.ANSWER_CACHE_ENABLED
+        self.threshold = config.SIMILARITY_THRESHOLD
+        self.ttl = config.ANSWER_CACHE_TTL_SECONDS
+        self.max_entries = config.ANSWER_CACHE_MAX_ENTRIES
+        self.max_documents = config.ANSWER_CACHE_MAX_DOCUMENTS
+        self._documents: OrderedDict[str, _DocumentAnswers] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    def _entry(self, index_key: str, revision: str) -> Optional[_DocumentAnswers]:
+        entry = self._documents.get(index_key)
+        if entry is not None and entry.revision != revision:
+            logger.info(f"Index {index_key} changed (revision {entry.revision} -> {revision}), drop cached answers")
+            del self._documents[index_key]
+            entry = None
+        return entry
+
+    def get(self, index_key: str, revision: str, question: str, question_vector) -> Optional[str]:
+        if not self.enabled:
+            return None
+        vector = self._normalize(question_vector)
+        now = time.time()
+        with self._lock:
+            entry = self._entry(index_key, revision)
+            if entry is not None:
+                for idx in [i for i, t in enumerate(entry.created_at) if now - t > self.ttl][::-1]:
+                    entry.drop(idx)
+            if not entry or not entry.vectors:
+                self.misses += 1
+                return None
+            similarity = np.stack(entry.vectors) @ vector
+            best = int(np.argmax(similarity))
+            # Cau hoi chi khac con so (gia, nam, ...) thuong co embedding rat gan nhau
+            if similarity[best] < self.threshold or \
+                    _NUMBER_RE.findall(entry.questions[best]) != _NUMBER_RE.findall(question):
+                self.misses += 1
+                return None
+            entry.last_used[best] = now
+            self._documents.move_to_end(index_key)
+            self.hits += 1
+            logger.info(f"Answer cache hit ({similarity[best]:.3f}): '{question[:60]}' ~ '{entry.questions[best][:60]}'")
+            return entry.answers[best]
+
+    def put(self, index_key: str, revision: str, question: str, question_vector, answer: str):
+        if not self.enabled or not answer:
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._entry(index_key, revision)
+            if entry is None:
+                entry = self._documents[index_key] = _DocumentAnswers(revision)
+            self._documents.move_to_end(index_key)
+            entry.vectors.append(self._normalize(question_vector))
+            entry.questions.append(question)
+            entry.answers.append(answer)
+            entry.created_at.append(now)
+            entry.last_used.append(now)
+            if len(entry.answers) > self.max_entries:
+                entry.drop(int(np.argmin(entry.last_used)))
+            while len(self._documents) > self.max_documents:
+                key, _ = self._documents.popitem(last=False)
+                logger.info(f"Evicted cached answers of {key}")
+
+    def invalidate(self, index_key: str):
+        with self._lock:
+            if self._documents.pop(index_key, None) is not None:
+                logger.info(f"Dropped cached answers of {index_key}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "entries": sum(len(e.answers) for e in self._documents.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,172 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import Optional
+from langchain_core.embeddings import Embeddings
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("EmbeddingCache")
+
+
+class EmbeddingCache:
+    '''
+    Cache embedding tren disk, dung chung giua cac session.
+
+    - Key  = sha256(model_name, chunk text)
+    - Vector luu dang float32 trong file append-only (moi model/dim 1 file,
+      moi record dai dim*4 bytes), vi tri record (slot) luu trong SQLite.
+    - Vuot max_entries -> xoa entry it dung nhat (LRU theo last_used).
+      Slot bi xoa chi danh dau chet; khi so slot chet lon hon so slot song
+      thi file duoc compact lai.
+    '''
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(EmbeddingCache, cls).__new__(cls)
+                cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.cache_dir = config.EMBEDDING_CACHE_DIR
+        self.max_entries = config.EMBEDDING_CACHE_MAX_ENTRIES
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite"), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, model TEXT, dim INTEGER, slot INTEGER, last_used REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON entries(last_used)")
+        self.conn.commit()
+        logger.info(f"Embedding cache ready at {self.cache_dir} (max {self.max_entries} entries)")
+
+    # -------------------------------------------------------
+    # Helpers
+    # -------------------------------------------------------
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _vector_path(self, model_name: str, dim: int) -> str:
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        return os.path.join(self.cache_dir, f"{slug}_{dim}.f32")
+
+    @staticmethod
+    def _n_slots(path: str, dim: int) -> int:
+        return os.path.getsize(path) // (dim * 4) if os.path.exists(path) else 0
+
+    # -------------------------------------------------------
+    # Get / put
+    # -------------------------------------------------------
+    def get_many(self, model_name: str, texts: list[str]) -> list[Optional[np.ndarray]]:
+        ''' Tra ve vector cho tung text, None neu chua co trong cache'''
+        keys = [self.make_key(model_name, t) for t in texts]
+        results: list[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            found = {}
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, dim, slot FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update({key: (dim, slot) for key, dim, slot in rows})
+            if not found:
+                return results
+
+            by_dim: dict[int, np.memmap] = {}
+            for i, key in enumerate(keys):
+                if key not in found:
+                    continue
+                dim, slot = found[key]
+                if dim not in by_dim:
+                    path = self._vector_path(model_name, dim)
+                    by_dim[dim] = np.memmap(path, dtype=np.float32, mode="r").reshape(-1, dim)
+                results[i] = np.array(by_dim[dim][slot])
+
+            now = time.time()
+            self.conn.executemany("UPDATE entries SET last_used=? WHERE key=?", [(now, k) for k in found])
+            self.conn.commit()
+        return results
+
+    def put_many(self, model_name: str, texts: list[str], vectors) -> None:
+        if not texts:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dim = vectors.shape[1]
+        path = self._vector_path(model_name, dim)
+        with self._lock:
+            start = self._n_slots(path, dim)
+            with open(path, "ab") as f:
+                f.write(vectors.tobytes())
+            now = time.time()
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, model, dim, slot, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(self.make_key(model_name, t), model_name, dim, start + i, now) for i, t in enumerate(texts)],
+            )
+            self.conn.commit()
+            self._evict()
+            self._maybe_compact(model_name, dim)
+
+    # -------------------------------------------------------
+    # Eviction / compaction
+    # -------------------------------------------------------
+    def _evict(self):
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return
+        self.conn.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_used LIMIT ?)", (overflow,)
+        )
+        self.conn.commit()
+        logger.info(f"Evicted {overflow} least recently used embeddings")
+
+    def _maybe_compact(self, model_name: str, dim: int):
+        path = self._vector_path(model_name, dim)
+        rows = self.conn.execute(
+            "SELECT key, slot FROM entries WHERE model=? AND dim=? ORDER BY slot", (model_name, dim)
+        ).fetchall()
+        n_slots = self._n_slots(path, dim)
+        if n_slots - len(rows) <= len(rows):
+            return
+        old = np.memmap(path, dtype=np.float32, mode="r").reshape(-1, dim)
+        live = np.asarray(old[[slot for _, slot in rows]], dtype=np.float32)
+        del old
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(live.tobytes())
+        os.replace(tmp_path, path)
+        self.conn.executemany("UPDATE entries SET slot=? WHERE key=?", [(i, key) for i, (key, _) in enumerate(rows)])
+        self.conn.commit()
+        logger.info(f"Compacted embedding cache {path}: {n_slots} -> {len(rows)} slots")
+
+
+class CachedEmbeddings(Embeddings):
+    ''' Embeddings wrapper: chi embed nhung chunk chua co trong EmbeddingCache'''
+
+    def __init__(self, base: Embeddings, model_name: str, cache: EmbeddingCache = None):
+        self.base = base
+        self.model_name = model_name
+        self.cache = cache or EmbeddingCache()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        cached = self.cache.get_many(self.model_name, texts)
+        miss_idx = [i for i, v in enumerate(cached) if v is None]
+        if miss_idx:
+            miss_texts = [texts[i] for i in miss_idx]
+            new_vectors = self.base.embed_documents(miss_texts)
+            self.cache.put_many(self.model_name, miss_texts, new_vectors)
+            for i, vector in zip(miss_idx, new_vectors):
+                cached[i] = np.asarray(vector, dtype=np.float32)
+        logger.info(f"Embedding cache: {len(texts) - len(miss_idx)} hits, {len(miss_idx)} misses")
+        return [v.tolist() for v in cached]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.base.embed_query(text)
@@ -1,11 +1,89 @@
 from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 from app.helper.logger import get_logger
 import time 
+import atexit
+import threading
+import numpy as np
 from app.helper.config import config
+from app.services.embedding_cache import CachedEmbeddings
 
 
 logger = get_logger("Calling Embedding Service")
 
+
+class EmbeddingEngine(Embeddings):
+    '''
+    Engine embedding theo batch tren SentenceTransformer client:
+    - batch_size cau hinh duoc
+    - sap xep text theo do dai truoc khi chia batch -> it padding
+    - num_workers > 1: dung multi-process pool cua sentence-transformers (tao 1 lan, tai su dung);
+      pool chi co 1 cap queue input/output nen moi luc chi 1 lan encode duoc dung pool
+    '''
+
+    def __init__(self, client, batch_size: int = 64, num_workers: int = 1,
+                 sort_by_length: bool = True, normalize: bool = False):
+        self.client = client
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.sort_by_length = sort_by_length
+        self.normalize = normalize
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+
+    def _get_pool(self):
+        if self.num_workers <= 1:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = self.client.start_multi_process_pool(target_devices=["cpu"] * self.num_workers)
+                atexit.register(self.close)
+                logger.info(f"Started embedding process pool with {self.num_workers} workers")
+        return self._pool
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self.client.stop_multi_process_pool(self._pool)
+                self._pool = None
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.client.get_sentence_embedding_dimension()), dtype=np.float32)
+        if self.sort_by_length:
+            order = np.argsort([len(t) for t in texts], kind="stable")
+        else:
+            order = np.arange(len(texts))
+        sorted_texts = [texts[i] for i in order]
+
+        pool = self._get_pool() if len(texts) >= self.batch_size * self.num_workers else None
+        if pool is None:
+            vectors = self._encode(sorted_texts, None)
+        else:
+            # Giu lock suot lan encode: 2 lan goi song song se lay nham ket qua cua nhau tu queue chung
+            with self._encode_lock:
+                vectors = self._encode(sorted_texts, pool)
+        out = np.empty_like(vectors, dtype=np.float32)
+        out[order] = vectors
+        return out
+
+    def _encode(self, texts: list[str], pool) -> np.ndarray:
+        return self.client.encode(
+            texts,
+            batch_size=self.batch_size,
+            pool=pool,
+            normalize_embeddings=self.normalize,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.encode([text])[0].tolist()
+
 class EmbeddingService:
     ''' Serivce quan li va cung cap embedding tu Hugging Face'''
     _instance = None
@@ -19,12 +97,22 @@ class EmbeddingService:
         start_time = time.time()
         try:
             model_name =  config.EMBEDDING_MODEL
-            model_kwargs = {"device": "cpu"}
-            encode_kwargs = {"normalize_embeddings": False}
+            model_kwargs = {"device": config.EMBEDDING_DEVICE}
+            encode_kwargs = {"normalize_embeddings": False, "batch_size": config.EMBEDDING_BATCH_SIZE}
             self.model = HuggingFaceEmbeddings(
             model_name =model_name,
             model_kwargs = model_kwargs,
             encode_kwargs =encode_kwargs)
+            # Engine batch/multi-process dung chung SentenceTransformer da load o tren
+            self.engine = EmbeddingEngine(
+                self.model._client,
+                batch_size=config.EMBEDDING_BATCH_SIZE,
+                num_workers=config.EMBEDDING_NUM_WORKERS,
+                sort_by_length=config.EMBEDDING_SORT_BY_LENGTH,
+                normalize=encode_kwargs["normalize_embeddings"],
+            )
+            # Embedding cho chunk di qua cache tren disk (key: model + text)
+            self.cached_model = CachedEmbeddings(self.engine, model_name=model_name)
             logger.info(f"Embedding model {model_name} laoding successfull: (time: {time.time()-start_time:.2f})")
             
         except Exception as e:
@@ -45,12 +133,15 @@ class EmbeddingService:
         ''' Return ve embedding cho nhieu doan text'''
         try: 
             logger.info(f" Generating embeddding for {len(documents)} document")
-            embeddings = self.model.embed_documents(documents)
+            embeddings = self.cached_model.embed_documents(documents)
             logger.info(f"Successfully generated {len(embeddings)} embeddings.")
             return embeddings
         except Exception as e:
             logger.error(f" Erro generate embeeding for text {e}")
             raise
 
-embedder = EmbeddingService()
-vector = embedder.embed_text("Xin chào, đây là câu test embedding.")
+if __name__ == "__main__":
+    embedder = EmbeddingService()
+    vector = embedder.embed_text("Xin chào, đây là câu test embedding.")
+    print(len(vector))
+
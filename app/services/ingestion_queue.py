@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("IngestionQueue")
+
+
+class IngestionQueue:
+    '''
+    Hang doi ingest file chay nen, dung chung toan process.
+
+    - ThreadPoolExecutor max_workers job chay cung luc, job du thi xep hang;
+      job cua cung 1 session chay tuan tu: moi session 1 hang doi rieng, chi job dau hang duoc dua vao
+      executor, xong moi dua job ke tiep (worker khong bi chiem boi job dang cho).
+      Job van giu ChatSessionHandler.session_lock khi chay (chung voi remove_document / detete_session).
+    - Bang jobs (SQLite, jobs.db_path): status queued/running/done/failed, stage,
+      progress (json: parsed / total / chunks / embedded), error -> UI poll get() / session_jobs().
+    - Progress ghi toi da 1 lan moi progress_interval giay (doi stage thi ghi ngay).
+    - Job xong: ChatSessionHandler.file_process da attach index vao chinh session do (hot-attach).
+    - Process khoi dong lai: job queued/running cu khong con chay -> failed ("interrupted").
+    '''
+    ACTIVE = ("queued", "running")
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(IngestionQueue, cls).__new__(cls)
+                cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.db_path = config.JOBS_DB_PATH
+        self.progress_interval = config.JOBS_PROGRESS_INTERVAL
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._db_lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, session_key TEXT, file_name TEXT, status TEXT, stage TEXT, "
+            "progress TEXT, error TEXT, created_at REAL, updated_at REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs(session_key, created_at)")
+        interrupted = self.conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'interrupted', updated_at = ? "
+            "WHERE status IN ('queued', 'running')", (time.time(),)
+        ).rowcount
+        self.conn.commit()
+        self.executor = ThreadPoolExecutor(max_workers=config.JOBS_MAX_WORKERS, thread_name_prefix="ingest")
+        # session_key -> job (job_id, chat, file_path, cleanup) chua xong, job dau hang dang chay / da submit
+        self._pending: Dict[str, deque] = {}
+        self._pending_lock = threading.Lock()
+        logger.info(f"Ingestion queue ready at {self.db_path} ({config.JOBS_MAX_WORKERS} workers, "
+                    f"{interrupted} interrupted job(s) marked failed)")
+
+    # -------------------------------------------------------
+    # Job table
+    # -------------------------------------------------------
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        if "progress" in fields:
+            fields["progress"] = json.dumps(fields["progress"])
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._db_lock:
+            self.conn.execute(f"UPDATE jobs SET {columns} WHERE job_id = ?", (*fields.values(), job_id))
+            self.conn.commit()
+
+    @staticmethod
+    def _row(row) -> Dict:
+        keys = ("job_id", "session_key", "file_name", "status", "stage", "progress", "error", "created_at", "updated_at")
+        job = dict(zip(keys, row))
+        job["progress"] = json.loads(job["progress"] or "{}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._db_lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def session_jobs(self, session_key: str, active_only: bool = False, limit: int = 20) -> List[Dict]:
+        query, params = "SELECT * FROM jobs WHERE session_key = ?", [session_key]
+        if active_only:
+            query += f" AND status IN ({', '.join('?' * len(self.ACTIVE))})"
+            params.extend(self.ACTIVE)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._db_lock:
+            rows = self.conn.execute(query, (*params, limit)).fetchall()
+        return [self._row(row) for row in rows]
+
+    # -------------------------------------------------------
+    # Submit / run
+    # -------------------------------------------------------
+    def submit(self, chat, file_path: str, cleanup: bool = True) -> str:
+        '''
+        Xep hang ingest file_path vao session chat (ChatSessionHandler).
+
+        Args:
+            cleanup (bool): xoa file_path (file tam cua upload) khi job ket thuc
+        '''
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._db_lock:
+            self.conn.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, 'queued', 'queued', '{}', NULL, ?, ?)",
+                (job_id, chat.session_key, os.path.basename(file_path), now, now),
+            )
+            self.conn.commit()
+        with self._pending_lock:
+            pending = self._pending.setdefault(chat.session_key, deque())
+            pending.append((job_id, chat, file_path, cleanup))
+            first = len(pending) == 1
+        if first:
+            self.executor.submit(self._run_session, chat.session_key)
+        logger.info(f"Queued ingestion job {job_id[:8]} for {os.path.basename(file_path)} ({chat.session_key})")
+        return job_id
+
+    def cancel_session(self, session_key: str) -> int:
+        ''' Bo cac job dang cho cua session (vd session bi xoa); job dang chay van chay het'''
+        with self._pending_lock:
+            pending = self._pending.get(session_key)
+            if not pending:
+                return 0
+            cancelled = [pending.pop() for _ in range(len(pending) - 1)]
+        for job_id, _, file_path, cleanup in cancelled:
+            self._update(job_id, status="failed", stage="cancelled", error="cancelled")
+            if cleanup:
+                self._cleanup(file_path)
+        if cancelled:
+            logger.info(f"Cancelled {len(cancelled)} queued ingestion job(s) of {session_key}")
+        return len(cancelled)
+
+    def _progress_callback(self, job_id: str):
+        state = {"stage": None, "counts": {}, "written": 0.0}
+
+        def progress(stage: str, **counts):
+            state["counts"].update({k: v for k, v in counts.items() if v is not None})
+            now = time.time()
+            if stage != state["stage"] or now - state["written"] >= self.progress_interval:
+                state["stage"], state["written"] = stage, now
+                self._update(job_id, stage=stage, progress=state["counts"])
+
+        return progress, state
+
+    def _run_session(self, session_key: str):
+        ''' Chay job dau hang cua session, xong thi dua job ke tiep (neu co) vao executor'''
+        with self._pending_lock:
+            job = self._pending[session_key][0]
+        try:
+            self._run(*job)
+        finally:
+            with self._pending_lock:
+                pending = self._pending[session_key]
+                pending.popleft()
+                if not pending:
+                    del self._pending[session_key]
+            if pending:
+                self.executor.submit(self._run_session, session_key)
+
+    def _run(self, job_id: str, chat, file_path: str, cleanup: bool):
+        # Job cung session da tuan tu qua _pending; lock chi loai tru remove_document / detete_session (UI)
+        with chat.session_lock:
+            start_time = time.time()
+            self._update(job_id, status="running", stage="starting")
+            progress, state = self._progress_callback(job_id)
+            try:
+                if chat.file_process(file_path, progress=progress):
+                    self._update(job_id, status="done", stage="done", progress=state["counts"])
+                    logger.info(f"Ingestion job {job_id[:8]} done in {time.time() - start_time:.2f}s")
+                else:
+                    self._update(job_id, status="failed", stage=state["stage"], error="processing failed")
+            except Exception as e:
+                logger.exception(f"Ingestion job {job_id[:8]} failed: {e}")
+                self._update(job_id, status="failed", stage=state["stage"], error=str(e))
+            finally:
+                if cleanup:
+                    self._cleanup(file_path)
+
+    @staticmethod
+    def _cleanup(file_path: str):
+        ''' Xoa file tam cua upload (va thu muc tam neu da rong)'''
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            try:
+                os.rmdir(os.path.dirname(file_path))
+            except OSError:
+                pass
@@ -1,51 +1,84 @@
 from app.helper.config import config
 from app.helper.logger import get_logger
-from langchain.schema import HumanMessage
+from app.services.llm_client import AsyncLLMClient
 from langchain.chat_models import init_chat_model
+from typing import AsyncIterator, Iterator
 
 import os 
-
-import requests
+import threading
 
 logger = get_logger("llama_service")
 
 class GroqLlamaService:
-    ''' Service se goi groq API de truy van Llama model '''
-    def __init__(self):
-        groq_api_key = config.GROQ_API_KEY
+    '''
+    Service se goi groq API de truy van Llama model.
+    Singleton: moi session dung chung 1 AsyncLLMClient (connection pool, gioi han request dong thoi).
+    '''
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                # Chi giu instance khi khoi tao thanh cong (loi -> lan goi sau thu lai, khong nhan instance do dang)
+                instance = super(GroqLlamaService, cls).__new__(cls)
+                instance._initialize()
+                cls._instance = instance
+        return cls._instance
+
+    GROQ_HOST = "api.groq.com"
 
-        if not groq_api_key:
-            
+    def _initialize(self):
+        # Nhu AsyncLLMClient: key trong config, khong co thi lay tu bien moi truong
+        groq_api_key = config.GROQ_API_KEY or os.environ.get("GROQ_API_KEY", "")
+        base_url = os.environ.get("LLM_BASE_URL", config.LLM_BASE_URL)
+
+        # base_url rieng (server stub, self-host) khong bat buoc co key
+        if not groq_api_key and self.GROQ_HOST in base_url:
             raise ValueError("GROQ_API_KEY not found. Please set it in Streamlit secrets.")
 
-        os.environ["GROQ_API_KEY"] = groq_api_key
-        
-        #if not os.environ.get("GROQ_API_KEY"):
-            #os.environ["GROQ_API_KEY"] = config.GROQ_API_KEY
-        #self.api_key = config.GROQ_API_KEY
+        if groq_api_key:
+            os.environ["GROQ_API_KEY"] = groq_api_key
+
         self.model_name = config.LLM_MODEL
         self.temperature = config.TEMPERATURE
         self.max_tokens = config.MAX_TOKENS
-        # khoi tao model Groq
-        self.llm  = init_chat_model(
-            model= self.model_name,
-            model_provider='groq',
-            temperature = self.temperature,
-            max_tokens = self.max_tokens
-        )
+        self.client = AsyncLLMClient()
+        self._llm = None
         logger.info(f" => GroqLlamaService initialized with model: {self.model_name}")
 
+    @property
+    def llm(self):
+        ''' LangChain chat model (chi tao khi can dung voi chain cua LangChain)'''
+        if self._llm is None:
+            self._llm = init_chat_model(
+                model= self.model_name,
+                model_provider='groq',
+                temperature = self.temperature,
+                max_tokens = self.max_tokens
+            )
+        return self._llm
+
     def generate (self, promt:str)-> str:
         " Gui prompt va nhan phan hoi tu Groq LLama"
         try:
             logger.info(f" Prompt input  {promt[:100]}...")
-            result = self.llm.invoke([HumanMessage(content=promt)])
-            logger.info(f" Groq repone recived ({len(result.content)} chars)")
-            return result.content
+            result = self.client.generate(promt)
+            logger.info(f" Groq repone recived ({len(result)} chars)")
+            return result
         
         except Exception as e:
             logger.error(f" Erro calling API {e}")
             raise
+
+    def stream(self, promt: str) -> Iterator[str]:
+        return self.client.stream(promt)
+
+    async def agenerate(self, promt: str) -> str:
+        return await self.client.agenerate(promt)
+
+    def astream(self, promt: str) -> AsyncIterator[str]:
+        return self.client.astream(promt)
         
     def get_llm(self):
         return self.llm
@@ -0,0 +1,171 @@
+import os
+import json
+import queue
+import asyncio
+import threading
+import httpx
+from typing import AsyncIterator, Iterator
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("LLMClient")
+
+_DONE = object()
+
+
+class AsyncLLMClient:
+    '''
+    Client async dung chung toan process cho API chat completions tuong thich OpenAI (Groq).
+
+    - 1 httpx.AsyncClient (connection pool + keep-alive) dung chung cho moi session.
+    - Semaphore gioi han so request dong thoi toi API.
+    - agenerate / astream cho code async; generate / stream la cau noi sync:
+      coroutine chay tren 1 event loop nen rieng (1 thread), khong tao thread moi moi request.
+    - base_url doi duoc qua config (llm.base_url) hoac bien moi truong LLM_BASE_URL
+      (vd tro toi server stub khi test).
+    '''
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                # Chi giu instance khi khoi tao thanh cong (loi -> lan goi sau thu lai, khong nhan instance do dang)
+                instance = super(AsyncLLMClient, cls).__new__(cls)
+                instance._initialize()
+                cls._instance = instance
+        return cls._instance
+
+    def _initialize(self):
+        self.base_url = os.environ.get("LLM_BASE_URL", config.LLM_BASE_URL).rstrip("/")
+        self.api_key = config.GROQ_API_KEY or os.environ.get("GROQ_API_KEY", "")
+        self.model_name = config.LLM_MODEL
+        self.temperature = config.TEMPERATURE
+        self.max_tokens = config.MAX_TOKENS
+        self.timeout = config.LLM_TIMEOUT
+        self.max_concurrency = config.LLM_MAX_CONCURRENCY
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-client-loop", daemon=True)
+        self._thread.start()
+        # AsyncClient va Semaphore phai tao tren chinh event loop se dung chung
+        asyncio.run_coroutine_threadsafe(self._open(), self._loop).result()
+        logger.info(f"LLM client ready: {self.base_url} (model {self.model_name}, max {self.max_concurrency} concurrent)")
+
+    async def _open(self):
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else None,
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(
+                max_connections=config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=config.LLM_MAX_CONNECTIONS,
+                keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def _payload(self, prompt: str, stream: bool, **kwargs) -> dict:
+        return {
+            "model": kwargs.get("model", self.model_name),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": kwargs.get("temperature", self.temperature),
+            "max_tokens": kwargs.get("max_tokens", self.max_tokens),
+            "stream": stream,
+        }
+
+    # -------------------------------------------------------
+    # Async API
+    # -------------------------------------------------------
+    def _on_own_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    async def _agenerate(self, prompt: str, **kwargs) -> str:
+        async with self._semaphore:
+            response = await self._client.post("/chat/completions", json=self._payload(prompt, False, **kwargs))
+            response.raise_for_status()
+            return response.json()["choices"][0]["message"].get("content") or ""
+
+    async def _astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        ''' Stream text theo Server-Sent Events (data: {...} / data: [DONE])'''
+        async with self._semaphore:
+            async with self._client.stream(
+                "POST", "/chat/completions", json=self._payload(prompt, True, **kwargs)
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    text = choices[0].get("delta", {}).get("content")
+                    if text:
+                        yield text
+
+    async def agenerate(self, prompt: str, **kwargs) -> str:
+        # httpx.AsyncClient gan voi event loop cua client -> goi tu loop khac thi chuyen sang loop do
+        if self._on_own_loop():
+            return await self._agenerate(prompt, **kwargs)
+        future = asyncio.run_coroutine_threadsafe(self._agenerate(prompt, **kwargs), self._loop)
+        return await asyncio.wrap_future(future)
+
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        if self._on_own_loop():
+            async for text in self._astream(prompt, **kwargs):
+                yield text
+            return
+        caller_loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        future = self._pump(prompt, lambda item: caller_loop.call_soon_threadsafe(chunks.put_nowait, item), **kwargs)
+        try:
+            while True:
+                item = await chunks.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Nguoi doc dung som (break / close) -> huy request dang stream, tra slot semaphore
+            future.cancel()
+
+    def _pump(self, prompt: str, put, **kwargs):
+        ''' Chay _astream tren loop cua client, day tung doan text (roi _DONE) qua put(); tra ve future de huy'''
+        async def pump():
+            try:
+                async for text in self._astream(prompt, **kwargs):
+                    put(text)
+            except Exception as e:
+                put(e)
+            finally:
+                put(_DONE)
+
+        return asyncio.run_coroutine_threadsafe(pump(), self._loop)
+
+    # -------------------------------------------------------
+    # Sync bridges
+    # -------------------------------------------------------
+    def generate(self, prompt: str, **kwargs) -> str:
+        return asyncio.run_coroutine_threadsafe(self._agenerate(prompt, **kwargs), self._loop).result()
+
+    def stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        chunks: queue.Queue = queue.Queue()
+        future = self._pump(prompt, chunks.put, **kwargs)
+        try:
+            while True:
+                item = chunks.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
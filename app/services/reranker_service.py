@@ -0,0 +1,70 @@
+import time
+import threading
+import numpy as np
+from langchain_community.cross_encoders.base import BaseCrossEncoder
+from app.helper.config import config
+from app.helper.logger import get_logger
+
+logger = get_logger("RerankerService")
+
+
+class RerankerService(BaseCrossEncoder):
+    ''' Service cross-encoder dung chung toan process: load model 1 lan (lazy), predict theo batch'''
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(RerankerService, cls).__new__(cls)
+                cls._instance.model_name = config.RERANKER_MODEL
+                cls._instance.batch_size = config.RERANKER_BATCH_SIZE
+                cls._instance._model = None
+                cls._instance._predict_lock = threading.Lock()
+                # Lock rieng cho lan load model (cham): record() / stats() khong phai cho
+                cls._instance._load_lock = threading.Lock()
+                cls._instance._paths = {"skip": 0, "full": 0, "budget": 0}
+                cls._instance.pairs_scored = 0
+                cls._instance.total_seconds = 0.0
+        return cls._instance
+
+    @property
+    def model(self):
+        ''' Load CrossEncoder o lan dung dau tien'''
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    start_time = time.time()
+                    self._model = CrossEncoder(self.model_name, device=config.EMBEDDING_DEVICE)
+                    logger.info(f"Reranker model {self.model_name} loaded (time: {time.time() - start_time:.2f}s)")
+        return self._model
+
+    def predict(self, query: str, texts: list[str]) -> np.ndarray:
+        ''' Diem lien quan cua tung text voi query'''
+        if not texts:
+            return np.empty(0, dtype=np.float32)
+        return self.score([(query, text) for text in texts])
+
+    def score(self, text_pairs: list[tuple[str, str]]) -> np.ndarray:
+        model = self.model
+        # 1 model dung chung giua cac session -> tuan tu hoa inference
+        with self._predict_lock:
+            scores = model.predict(text_pairs, batch_size=self.batch_size, show_progress_bar=False)
+        return np.asarray(scores, dtype=np.float32)
+
+    def record(self, path: str, n_pairs: int, seconds: float):
+        ''' Ghi nhan 1 lan rerank (skip | full | budget)'''
+        with self._lock:
+            self._paths[path] = self._paths.get(path, 0) + 1
+            self.pairs_scored += n_pairs
+            self.total_seconds += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            n_queries = sum(self._paths.values())
+            return {
+                **self._paths,
+                "pairs_scored": self.pairs_scored,
+                "avg_ms": round(self.total_seconds * 1000 / n_queries, 1) if n_queries else 0.0,
+            }
@@ -0,0 +1,86 @@
+import hashlib
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain_core.embeddings import Embeddings
+
+from app.helper.config import config
+from app.core import index_manager as index_manager_module
+from app.core.bm25_index import BM25Index
+from app.core.chunk_store import ChunkStore
+from app.core.index_manager import IndexManager
+from app.core.vector_store import VectorStore
+
+DIM = 16
+
+
+class HashEmbeddings(Embeddings):
+    ''' Embedding xac dinh theo hash text (khong load model)'''
+    model_name = "hash"
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:4], "little")
+        return np.random.default_rng(seed).random(DIM, dtype=np.float32).tolist()
+
+
+class FakeEmbeddingService:
+    cached_model = HashEmbeddings()
+
+
+def build_document_index(vector_dir, doc_hash, texts, source):
+    ''' Index 1 tai lieu nhu DataPipeLine: ChunkStore + FAISS (toi uu theo config) + BM25 + manifest'''
+    docs = [Document(page_content=text, metadata={"source": source, "chunk_id": i}) for i, text in enumerate(texts)]
+    embeddings = FakeEmbeddingService.cached_model
+    store = VectorStore()
+    ChunkStore.save(docs, str(vector_dir))
+    vt_store = store.add_embeddings(None, docs, embeddings.embed_documents(texts), embeddings)
+    store.save_vector_store(store.optimize_index(vt_store), str(vector_dir))
+    BM25Index.from_texts(texts).save(str(vector_dir))
+    IndexManager(str(vector_dir)).init_manifest(doc_hash, f"{doc_hash}.txt", len(docs))
+
+
+def load_full(vector_dir):
+    return VectorStore().load_vectore_store(str(vector_dir), embedding_model=FakeEmbeddingService.cached_model)
+
+
+@pytest.mark.parametrize("index_type", VectorStore.INDEX_TYPES)
+def test_append_revise_remove(tmp_path, monkeypatch, index_type):
+    monkeypatch.setattr(index_manager_module, "EmbeddingService", FakeEmbeddingService)
+    monkeypatch.setattr(config, "INDEX_PQ_M", 4)
+
+    base_texts = [f"base chunk {i}" for i in range(600)]
+    extra_texts = [f"extra chunk {i}" for i in range(40)]
+    monkeypatch.setattr(config, "INDEX_TYPE", "flat")
+    build_document_index(tmp_path / "b", "b", extra_texts, "b.txt")
+    monkeypatch.setattr(config, "INDEX_TYPE", index_type)
+    build_document_index(tmp_path / "a", "a", base_texts, "a.txt")
+
+    manager = IndexManager(str(tmp_path / "a"))
+    manager.append_index(str(tmp_path / "b"))
+    assert VectorStore.current_index_type(load_full(tmp_path / "a").index) == index_type
+
+    # Ban sua cua b: chunk 0-9 chi doi metadata (vector lay lai tu FAISS o vi tri da append),
+    # chunk 10-19 bi xoa, con lai giu nguyen
+    revised = [Document(page_content=text, metadata={"source": "b2.txt", **({"page": 1} if i < 10 else {})})
+               for i, text in enumerate(extra_texts) if not 10 <= i < 20]
+    stats = manager.update_document("b", "b2", "b.txt", revised)
+    assert stats == {"kept": 20, "added": 10, "removed": 20, "embedded": 0}
+    vt_store = load_full(tmp_path / "a")
+    assert vt_store.index.ntotal == len(base_texts) + len(revised)
+
+    # Vector lay lai = vector embed that
+    chunk_ids = manager.load_manifest()["documents"]["b2"]["chunk_ids"][:10]
+    vectors = manager._reconstruct(manager.vector_dir, chunk_ids, extra_texts[:10])
+    expected = np.asarray(FakeEmbeddingService.cached_model.embed_documents(extra_texts[:10]), dtype=np.float32)
+    if index_type != "ivf_pq":
+        np.testing.assert_allclose(vectors, expected, rtol=1e-5)
+
+    assert manager.delete_document("b2")
+    assert load_full(tmp_path / "a").index.ntotal == len(base_texts)
+
+    # Xoa het -> index flat rong, khong train IVF tren 0 vector
+    assert manager.delete_document("a")
+    assert load_full(tmp_path / "a").index.ntotal == 0